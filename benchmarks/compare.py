@@ -0,0 +1,38 @@
+"""Compare two benchmark result files, e.g. of two releases."""
+import argparse
+import json
+from pathlib import Path
+
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps')
+
+
+def change(before, after):
+    if not before or after is None:
+        return ''
+    return f'{(after - before) / before:+.1%}'
+
+
+def compare(baseline, current):
+    print(f'{baseline["revision"]} ({baseline["books"]} книг) -> '
+          f'{current["revision"]} ({current["books"]} книг)')
+    for name, result in current['results'].items():
+        previous = baseline['results'].get(name, {})
+        print(name)
+        for metric in METRICS:
+            print(f'  {metric:<15}{previous.get(metric, "-"):>10} -> '
+                  f'{result.get(metric, "-"):>10} '
+                  f'{change(previous.get(metric), result.get(metric))}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('baseline', type=Path)
+    parser.add_argument('current', type=Path)
+    args = parser.parse_args()
+    compare(json.loads(args.baseline.read_text()),
+            json.loads(args.current.read_text()))
+
+
+if __name__ == '__main__':
+    main()
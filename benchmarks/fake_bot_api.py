@@ -0,0 +1,163 @@
+"""Fake Bot API server for load tests of runner.py and main.py.
+
+Hands out synthetic updates through getUpdates (or posts them to a
+webhook) and answers every other method, replies are matched to updates
+by chat to measure the latency. Start it, then the bot with BOT_API_URL
+pointing at it:
+
+    python -m benchmarks.fake_bot_api --updates 10000 --users 1000
+    BOT_API_URL=http://localhost:8081 python runner.py --workers 4
+"""
+import argparse
+import asyncio
+import json
+import random
+from collections import defaultdict, deque
+from time import perf_counter, time
+
+from aiohttp import ClientSession, web
+
+from benchmarks.run import summary
+from webhook import SECRET_HEADER
+
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Fake',
+            'username': 'fake_bot'}
+UPDATES_PER_RESPONSE = 100
+# methods that answer an update, the first of them ends its latency
+REPLIES = {'sendmessage', 'editmessagetext', 'editmessagereplymarkup'}
+
+
+class FakeBotAPI:
+    def __init__(self, args):
+        rng = random.Random(args.seed)
+        self.updates = [
+            self.message(number + 1, rng.randint(1, args.users), args.text)
+            for number in range(args.updates)
+        ]
+        self.delivered = defaultdict(deque)
+        self.latencies = []
+        self.calls = defaultdict(int)
+        self.started = None
+        self.finished = asyncio.Event()
+
+    @staticmethod
+    def message(update_id, user_id, text):
+        user = {'id': user_id, 'is_bot': False,
+                'first_name': f'Пользователь {user_id}'}
+        return {'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': int(time()), 'from': user,
+            'chat': {'id': user_id, 'type': 'private'}, 'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0,
+                          'length': len(text.split()[0])}]
+            if text.startswith('/') else [],
+        }}
+
+    def deliver(self, updates):
+        now = perf_counter()
+        if self.started is None and updates:
+            self.started = now
+        for update in updates:
+            self.delivered[update['message']['chat']['id']].append(now)
+
+    def reply(self, chat_id):
+        if self.delivered[chat_id]:
+            self.latencies.append(
+                (perf_counter() - self.delivered[chat_id].popleft()) * 1000
+            )
+            if len(self.latencies) == len(self.updates):
+                self.finished.set()
+
+    async def handle(self, request):
+        method = request.match_info['method'].lower()
+        params = dict(await request.post())
+        self.calls[method] += 1
+        if method == 'getme':
+            return self.ok(BOT_USER)
+        if method == 'getupdates':
+            return self.ok(await self.get_updates(params))
+        chat_id = params.get('chat_id')
+        if method in REPLIES and chat_id is not None:
+            self.reply(int(chat_id))
+        if method.startswith(('send', 'edit')):
+            return self.ok({
+                'message_id': self.calls[method], 'date': int(time()),
+                'chat': {'id': int(chat_id or 0), 'type': 'private'},
+                'from': BOT_USER, 'text': params.get('text', ''),
+            })
+        return self.ok(True)
+
+    async def get_updates(self, params):
+        offset = int(params.get('offset') or 1)
+        updates = self.updates[offset - 1:offset - 1 + UPDATES_PER_RESPONSE]
+        if not updates:
+            # long polling with nothing left
+            await asyncio.sleep(min(float(params.get('timeout') or 0), 1))
+        self.deliver(updates)
+        return updates
+
+    @staticmethod
+    def ok(result):
+        return web.json_response({'ok': True, 'result': result})
+
+    async def post_updates(self, url, secret, concurrency):
+        async with ClientSession() as session:
+            pending = iter(self.updates)
+
+            async def post():
+                for update in pending:
+                    self.deliver([update])
+                    async with session.post(
+                        url, json=update, headers={SECRET_HEADER: secret}
+                    ) as response:
+                        response.raise_for_status()
+
+            await asyncio.gather(*(post() for _ in range(concurrency)))
+
+    def report(self):
+        result = summary(self.latencies, len(self.updates) - len(
+            self.latencies), perf_counter() - self.started)
+        result['calls'] = dict(self.calls)
+        return result
+
+
+async def serve(args):
+    api = FakeBotAPI(args)
+    app = web.Application()
+    app.router.add_route('*', '/bot{token}/{method}', api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port, backlog=1024).start()
+    print(f'Fake Bot API: http://{args.host}:{args.port}, '
+          f'{args.updates} обновлений', flush=True)
+    if args.webhook:
+        await api.post_updates(args.webhook, args.secret, args.concurrency)
+    try:
+        await asyncio.wait_for(api.finished.wait(), args.time_limit)
+    except asyncio.TimeoutError:
+        print('Не все обновления получили ответ')
+    print(json.dumps(api.report(), ensure_ascii=False, indent=2))
+    await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--updates', type=int, default=10_000)
+    parser.add_argument('--users', type=int, default=1000,
+                        help='senders are 1..users, as made by seed.py')
+    parser.add_argument('--text', default='/mybooks')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--webhook',
+                        help='post updates to this url instead of polling')
+    parser.add_argument('--secret', default='')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--time-limit', type=float, default=600)
+    parser.add_argument('--seed', type=int, default=42)
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
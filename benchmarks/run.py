@@ -0,0 +1,207 @@
+"""Run db_requests functions under concurrency and store latencies as JSON.
+
+Seed the database with benchmarks.seed first.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from statistics import quantiles
+from time import perf_counter
+
+from sqlalchemy import func, select
+
+from database.database import (
+    DB_SETTINGS, async_sessionmaker, engine, warm_up_pool,
+)
+from database.db_requests import (
+    insert_new_book_instance,
+    load_reference_data,
+    select_books_by_home_location,
+    select_books_by_keyword,
+    select_users_books,
+)
+from database.models import Book, BookData, User
+from database.query_stats import query_stats
+from database.reference_cache import reference_cache
+
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+SAMPLE_SIZE = 1000
+
+
+async def keyword_search(session, rng, sample):
+    # a new search every time, paging is served from search_cache
+    await select_books_by_keyword(
+        session, rng.choice(sample['users']), rng.choice(sample['keywords']),
+        refresh=True,
+    )
+
+
+async def home_location(session, rng, sample):
+    await select_books_by_home_location(session, rng.choice(sample['users']))
+
+
+async def users_books(session, rng, sample):
+    await select_users_books(session, rng.choice(sample['owners']))
+
+
+async def new_book(session, rng, sample):
+    await insert_new_book_instance(session, rng.choice(sample['users']), {
+        'book': f'Бенчмарк {rng.random()}',
+        'authors': [f'Автор {rng.randint(1, 10 ** 6)}'],
+        'genres_id': [rng.choice(sample['genres'])],
+    })
+
+
+SCENARIOS = {
+    'select_books_by_keyword': keyword_search,
+    'select_books_by_home_location': home_location,
+    'select_users_books': users_books,
+    'insert_new_book_instance': new_book,
+}
+
+
+async def load_sample(rng):
+    async with async_sessionmaker() as session:
+        await load_reference_data(session)
+        users = await session.scalars(
+            select(User.telegram_id).where(User.location_id.is_not(None)
+                                           ).limit(SAMPLE_SIZE)
+        )
+        owners = await session.scalars(
+            select(Book.telegram_id).distinct().limit(SAMPLE_SIZE)
+        )
+        titles = await session.scalars(
+            select(BookData.title).order_by(func.random()).limit(SAMPLE_SIZE)
+        )
+        books = await session.scalar(select(func.count()).select_from(Book))
+    words = sorted({
+        word for title in titles for word in title.lower().split()
+    })
+    sample = {
+        'users': list(users),
+        'owners': list(owners),
+        # single words and two word phrases, like real queries
+        'keywords': words + [
+            ' '.join(rng.sample(words, 2)) for _ in range(len(words))
+        ],
+        'genres': list(reference_cache.genres),
+    }
+    if not sample['users'] or not sample['owners'] or not words:
+        raise SystemExit('База пуста, сначала запустите benchmarks.seed')
+    return sample, books
+
+
+async def run_scenario(scenario, sample, requests, concurrency, commit,
+                       seed_value):
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker(number):
+        nonlocal errors
+        rng = random.Random(seed_value + number)
+        for _ in remaining:
+            async with async_sessionmaker() as session:
+                started = perf_counter()
+                try:
+                    await scenario(session, rng, sample)
+                    if commit:
+                        await session.commit()
+                except Exception:
+                    errors += 1
+                    continue
+                finally:
+                    # inserts are rolled back unless --commit is given,
+                    # the data set stays the same between runs
+                    await session.rollback()
+                latencies.append((perf_counter() - started) * 1000)
+
+    started = perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    elapsed = perf_counter() - started
+    return summary(latencies, errors, elapsed)
+
+
+def summary(latencies, errors, elapsed):
+    if len(latencies) < 2:
+        return {'requests': len(latencies), 'errors': errors}
+    percentiles = quantiles(latencies, n=100, method='inclusive')
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'p50_ms': round(percentiles[49], 2),
+        'p95_ms': round(percentiles[94], 2),
+        'p99_ms': round(percentiles[98], 2),
+        'max_ms': round(max(latencies), 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ('git', 'rev-parse', '--short', 'HEAD'), text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def benchmark(args):
+    rng = random.Random(args.seed)
+    sample, books = await load_sample(rng)
+    await warm_up_pool()
+    results = {}
+    for name in args.scenarios:
+        query_stats.clear()
+        results[name] = await run_scenario(
+            SCENARIOS[name], sample, args.requests, args.concurrency,
+            args.commit, args.seed,
+        )
+        results[name]['statements'] = query_stats.report()
+        print(name, {
+            key: value for key, value in results[name].items()
+            if key != 'statements'
+        })
+    await engine.dispose()
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'books': books,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'pool': DB_SETTINGS,
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS,
+                        default=list(SCENARIOS))
+    parser.add_argument('--commit', action='store_true',
+                        help='commit inserts instead of rolling them back')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', type=Path)
+    args = parser.parse_args()
+
+    report = asyncio.run(benchmark(args))
+    output = args.output or RESULTS_DIR / (
+        f'{report["created_at"].replace(":", "-")}_{report["revision"]}.json'
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f'Результаты сохранены в {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""Seed the database with synthetic users and books using COPY.
+
+Apply migrations and load the reference data with import_data.py first.
+"""
+import argparse
+import asyncio
+import random
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from database.bulk import CHUNK_SIZE, chunks, copy_connection
+
+
+FIRST_NAMES = (
+    'Александр', 'Анна', 'Борис', 'Валентина', 'Виктор', 'Галина', 'Дмитрий',
+    'Елена', 'Иван', 'Ирина', 'Константин', 'Мария', 'Михаил', 'Наталья',
+    'Николай', 'Ольга', 'Павел', 'Светлана', 'Сергей', 'Татьяна', 'Фёдор',
+    'Юлия',
+)
+MIDDLE_NAMES = (
+    'Александрович', 'Борисович', 'Викторович', 'Дмитриевич', 'Иванович',
+    'Михайлович', 'Николаевич', 'Павлович', 'Сергеевич', 'Фёдорович',
+)
+LAST_NAMES = (
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров',
+    'Соколов', 'Михайлов', 'Новиков', 'Фёдоров', 'Морозов', 'Волков',
+    'Алексеев', 'Лебедев', 'Семёнов', 'Егоров', 'Павлов', 'Козлов',
+    'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров', 'Никитин',
+)
+TITLE_WORDS = (
+    'война', 'мир', 'тайна', 'дом', 'город', 'ночь', 'море', 'звезда',
+    'сад', 'путь', 'огонь', 'тень', 'зима', 'лето', 'история', 'жизнь',
+    'время', 'остров', 'дорога', 'сердце', 'ветер', 'песня', 'мастер',
+    'капитан', 'дочь', 'отцы', 'дети', 'преступление', 'наказание', 'идиот',
+    'записки', 'хроники', 'повесть', 'легенда', 'последний', 'белый',
+    'тихий', 'золотой', 'старый', 'новый', 'далёкий', 'тёмный', 'ёлка',
+)
+# share of free, booked and reading book instances
+STATUS_WEIGHTS = (70, 10, 20)
+
+
+async def copy(conn, table, columns, records):
+    started = perf_counter()
+    count = 0
+    for chunk in chunks(records):
+        await conn.copy_records_to_table(table, records=chunk, columns=columns)
+        count += len(chunk)
+    print(f'{table}: {count} rows, {perf_counter() - started:.1f}s')
+
+
+async def next_id(conn, table, column='id'):
+    return await conn.fetchval(f'SELECT coalesce(max({column}), 0) + 1 '
+                               f'FROM {table}')
+
+
+def weighted_locations(location_ids):
+    # a few big cities hold most of the users, like in real life
+    weights = [1 / (rank + 1) for rank in range(len(location_ids))]
+    return location_ids, weights
+
+
+def title(rng):
+    words = rng.sample(TITLE_WORDS, rng.choice((1, 2, 2, 3, 3, 4)))
+    return ' '.join(words).capitalize()
+
+
+def author_names(rng, count):
+    names = set()
+    while len(names) < count:
+        name = (f'{rng.choice(FIRST_NAMES)} {rng.choice(MIDDLE_NAMES)} '
+                f'{rng.choice(LAST_NAMES)}')
+        if name in names:
+            name = f'{name} {len(names)}'
+        names.add(name)
+    return names
+
+
+async def seed(books, seed_value):
+    rng = random.Random(seed_value)
+    conn = await copy_connection()
+    try:
+        location_ids = [
+            row['id'] for row in await conn.fetch(
+                'SELECT id FROM locations ORDER BY id'
+            )
+        ]
+        genre_ids = [
+            row['id'] for row in await conn.fetch('SELECT id FROM genres')
+        ]
+        if not location_ids or not genre_ids:
+            raise SystemExit(
+                'Справочники пусты, сначала запустите import_data.py'
+            )
+        locations, location_weights = weighted_locations(location_ids)
+
+        users_count = max(books // 5, 1)
+        authors_count = max(books // 3, 1)
+        # some instances are copies of the same work
+        works_count = max(books * 7 // 10, 1)
+
+        user_id = await next_id(conn, 'users', 'telegram_id')
+        user_id = max(user_id, 10 ** 9)
+        users = [
+            (user_id + i, rng.choice(FIRST_NAMES), None, f'bench_user_{i}',
+             0, location)
+            for i, location in enumerate(rng.choices(
+                locations, location_weights, k=users_count
+            ))
+        ]
+        user_locations = {user[0]: user[5] for user in users}
+        user_ids = list(user_locations)
+
+        author_id = await next_id(conn, 'authors')
+        author_ids = range(author_id, author_id + authors_count)
+        existing = {
+            row['author'] for row in await conn.fetch(
+                'SELECT author FROM authors'
+            )
+        }
+        authors = zip(
+            author_ids,
+            (name for name in author_names(rng, authors_count + len(existing))
+             if name not in existing),
+        )
+
+        work_id = await next_id(conn, 'books_data')
+        work_ids = range(work_id, work_id + works_count)
+        book_id = await next_id(conn, 'books')
+        now = datetime.now()
+
+        def book_rows():
+            for i in range(books):
+                owner = rng.choice(user_ids)
+                status = rng.choices((1, 2, 3), STATUS_WEIGHTS)[0]
+                candidate = rng.choice(user_ids) if status == 2 else None
+                remain_time = (
+                    now + timedelta(days=rng.randint(-10, 90))
+                    if status == 3 else None
+                )
+                yield (
+                    book_id + i, rng.choice(work_ids), owner, status,
+                    user_locations[owner], now, remain_time, candidate,
+                    status == 2 and rng.random() < 0.3,
+                )
+
+        def work_links(ids, per_work):
+            for work in work_ids:
+                count = min(rng.choice(per_work), len(ids))
+                for linked in rng.sample(ids, count):
+                    yield work, linked
+
+        # the read model is filled in one pass at the end, row triggers
+        # would rebuild it for every copied row
+        triggers = (
+            ('books', 'book_search_books'),
+            ('book_author', 'book_search_book_author'),
+            ('book_genre', 'book_search_book_genre'),
+        )
+        async with conn.transaction():
+            for table, trigger in triggers:
+                await conn.execute(
+                    f'ALTER TABLE {table} DISABLE TRIGGER {trigger}'
+                )
+            await copy(conn, 'users', (
+                'telegram_id', 'first_name', 'last_name', 'username',
+                'reading_amount', 'location_id',
+            ), users)
+            await copy(conn, 'authors', ('id', 'author'), authors)
+            await copy(conn, 'books_data', ('id', 'title'), (
+                (work, title(rng)) for work in work_ids
+            ))
+            await copy(conn, 'book_author', ('book_id', 'author_id'),
+                       work_links(author_ids, (1, 1, 1, 1, 2, 3)))
+            await copy(conn, 'book_genre', ('book_id', 'genre_id'),
+                       work_links(genre_ids, (1, 1, 2, 3)))
+            await copy(conn, 'books', (
+                'id', 'book_id', 'telegram_id', 'status_id', 'location_id',
+                'pub_date', 'remain_time', 'candidate_telegram_id',
+                'is_transferred',
+            ), book_rows())
+            for table, trigger in triggers:
+                await conn.execute(
+                    f'ALTER TABLE {table} ENABLE TRIGGER {trigger}'
+                )
+            for table in ('authors', 'books_data', 'books'):
+                await conn.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT max(id) FROM {table}))"
+                )
+
+        started = perf_counter()
+        for first in range(book_id, book_id + books, CHUNK_SIZE):
+            await conn.execute(
+                'SELECT book_search_upsert(ARRAY(SELECT id FROM books '
+                'WHERE id >= $1 AND id < $2))',
+                first, first + CHUNK_SIZE,
+            )
+        print(f'book_search: {perf_counter() - started:.1f}s')
+        await conn.execute('ANALYZE')
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(seed(args.books, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,10 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
+# base url of a local Bot API server, api.telegram.org when empty
+BOT_API_URL = os.getenv('BOT_API_URL', '').rstrip('/')
+# worker processes of runner.py, updates are split between them by user
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', os.cpu_count() or 1))
 
 DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
@@ -14,7 +18,99 @@ DB_PORT = os.getenv('DB_PORT')
 DB_NAME = os.getenv('DB_NAME')
 DB_PORT = os.getenv('DB_PORT')
 
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+# 0 turns prepared statement caching off, needed behind pgbouncer
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 500))
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 5000))
+DB_COMMAND_TIMEOUT = int(os.getenv('DB_COMMAND_TIMEOUT', 10))
+DB_ECHO = os.getenv('DB_ECHO', 'false').lower() == 'true'
+DB_SLOW_QUERY_MS = int(os.getenv('DB_SLOW_QUERY_MS', 200))
+DB_SLOW_QUERY_EXPLAIN = (
+    os.getenv('DB_SLOW_QUERY_EXPLAIN', 'false').lower() == 'true'
+)
+
+# updates handled at once by one process, by default as many as the pool
+# has connections
+HANDLER_CONCURRENCY = int(
+    os.getenv('HANDLER_CONCURRENCY', DB_POOL_SIZE + DB_MAX_OVERFLOW)
+)
+# updates waiting or running above which the webhook answers 429
+HANDLER_MAX_PENDING = int(os.getenv('HANDLER_MAX_PENDING', 1000))
+
+# anti-flood token buckets: every user gets THROTTLE_BURST tokens that
+# refill at THROTTLE_RATE a second, a handler takes its cost (1 by default)
+THROTTLE_STORAGE = os.getenv('THROTTLE_STORAGE', 'memory')
+THROTTLE_RATE = float(os.getenv('THROTTLE_RATE', 1))
+THROTTLE_BURST = float(os.getenv('THROTTLE_BURST', 10))
+# handler name, /command or callback data prefix = cost
+THROTTLE_COSTS = {
+    name.strip(): float(cost)
+    for name, cost in (
+        item.split('=') for item in os.getenv(
+            'THROTTLE_COSTS',
+            'result_by_keyword=4,return_keyword_results=4,'
+            'page_by_keyword=2,search_by_home_location=3,'
+            'page_by_home_location=2,get_book=3,/mybooks=2,'
+            'mybooks-page_=2,/rules=0.5',
+        ).split(',') if item.strip()
+    )
+}
+
+# crontab of the reading-expiry sweep, daily at 10:00 by default
+READING_SWEEP_CRON = os.getenv('READING_SWEEP_CRON', '0 10 * * *')
+READING_SWEEP_TIMEZONE = os.getenv('READING_SWEEP_TIMEZONE', 'Europe/Moscow')
+
+# polling or webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# public https address telegram posts to, e.g. https://bot.example.com,
+# left empty the webhook is not registered (local testing)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', 8080))
+
+# memory or redis, redis lets several bot workers share FSM states
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'memory')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+# seconds an idle FSM state is kept in redis
+FSM_STATE_TTL = int(os.getenv('FSM_STATE_TTL', 86400))
+
+# notification outbox, telegram allows about 30 messages a second in total
+# and one a second to the same chat
+OUTBOX_RATE = float(os.getenv('OUTBOX_RATE', 25))
+OUTBOX_CHAT_INTERVAL = float(os.getenv('OUTBOX_CHAT_INTERVAL', 1))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 100))
+# new notifications wake the sender through NOTIFY, polling is a fallback
+# for send_after retries and a lost LISTEN connection
+OUTBOX_POLL_INTERVAL = int(os.getenv('OUTBOX_POLL_INTERVAL', 5))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+
+BOOK_CACHE_SIZE = int(os.getenv('BOOK_CACHE_SIZE', 1024))
+BOOK_CACHE_TTL = int(os.getenv('BOOK_CACHE_TTL', 60))
+# ids of the last keyword search of a user, for paging and "back"
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', 1024))
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', 300))
+SEARCH_RESULTS_LIMIT = int(os.getenv('SEARCH_RESULTS_LIMIT', 500))
+# matches of a keyword that are ranked, the rest of a broad one is dropped
+SEARCH_CANDIDATES_LIMIT = int(os.getenv('SEARCH_CANDIDATES_LIMIT', 5000))
+
 DB_URL = (
     f'postgresql'
     f'+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
 )
+
+# optional streaming replica with the same credentials, reads go there
+DB_REPLICA_HOST = os.getenv('DB_REPLICA_HOST')
+DB_REPLICA_PORT = os.getenv('DB_REPLICA_PORT', DB_PORT)
+DB_REPLICA_URL = (
+    f'postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}'
+    f'@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}'
+    if DB_REPLICA_HOST else None
+)
+# seconds a user reads from the primary after their own write
+DB_PRIMARY_STICKY_SECONDS = int(os.getenv('DB_PRIMARY_STICKY_SECONDS', 5))
@@ -0,0 +1,134 @@
+BOOK_SEARCH_DDL = (
+    """
+    CREATE OR REPLACE FUNCTION book_search_upsert(book_ids integer[])
+    RETURNS void AS $$
+        INSERT INTO book_search (
+            id, book_data_id, title, authors, genre_ids, status_id,
+            location_id, telegram_id, remain_time, candidate_telegram_id,
+            is_transferred, document
+        )
+        SELECT b.id, b.book_id, d.title,
+               coalesce(a.authors, '{}'), coalesce(g.genre_ids, '{}'),
+               b.status_id, b.location_id, b.telegram_id, b.remain_time,
+               b.candidate_telegram_id, b.is_transferred,
+               concat_ws(' ', d.title, array_to_string(a.authors, ' '),
+                         g.genres)
+        FROM books b
+        JOIN books_data d ON d.id = b.book_id
+        LEFT JOIN LATERAL (
+            SELECT array_agg(au.author ORDER BY au.author) AS authors
+            FROM book_author ba JOIN authors au ON au.id = ba.author_id
+            WHERE ba.book_id = d.id
+        ) a ON true
+        LEFT JOIN LATERAL (
+            SELECT array_agg(ge.id ORDER BY ge.id) AS genre_ids,
+                   string_agg(ge.genre, ' ') AS genres
+            FROM book_genre bg JOIN genres ge ON ge.id = bg.genre_id
+            WHERE bg.book_id = d.id
+        ) g ON true
+        WHERE b.id = ANY(book_ids)
+        ON CONFLICT (id) DO UPDATE SET
+            book_data_id = EXCLUDED.book_data_id,
+            title = EXCLUDED.title,
+            authors = EXCLUDED.authors,
+            genre_ids = EXCLUDED.genre_ids,
+            status_id = EXCLUDED.status_id,
+            location_id = EXCLUDED.location_id,
+            telegram_id = EXCLUDED.telegram_id,
+            remain_time = EXCLUDED.remain_time,
+            candidate_telegram_id = EXCLUDED.candidate_telegram_id,
+            is_transferred = EXCLUDED.is_transferred,
+            document = EXCLUDED.document
+    $$ LANGUAGE sql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION book_search_on_book() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND NEW.book_id IS NOT DISTINCT FROM OLD.book_id
+        THEN
+            -- status transitions do not touch the aggregated columns
+            UPDATE book_search SET
+                status_id = NEW.status_id,
+                location_id = NEW.location_id,
+                telegram_id = NEW.telegram_id,
+                remain_time = NEW.remain_time,
+                candidate_telegram_id = NEW.candidate_telegram_id,
+                is_transferred = NEW.is_transferred
+            WHERE id = NEW.id;
+            IF FOUND THEN
+                RETURN NULL;
+            END IF;
+        END IF;
+        PERFORM book_search_upsert(ARRAY[NEW.id]);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION book_search_on_book_data() RETURNS trigger
+    AS $$
+    DECLARE
+        book_data_id integer;
+    BEGIN
+        IF TG_TABLE_NAME = 'books_data' THEN
+            book_data_id := NEW.id;
+        ELSIF TG_OP = 'DELETE' THEN
+            book_data_id := OLD.book_id;
+        ELSE
+            book_data_id := NEW.book_id;
+        END IF;
+        PERFORM book_search_upsert(
+            ARRAY(SELECT id FROM books WHERE book_id = book_data_id)
+        );
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION book_search_on_author() RETURNS trigger AS $$
+    BEGIN
+        PERFORM book_search_upsert(ARRAY(
+            SELECT b.id FROM books b
+            JOIN book_author ba ON ba.book_id = b.book_id
+            WHERE ba.author_id = NEW.id
+        ));
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    'DROP TRIGGER IF EXISTS book_search_books ON books',
+    """
+    CREATE TRIGGER book_search_books
+    AFTER INSERT OR UPDATE ON books
+    FOR EACH ROW EXECUTE FUNCTION book_search_on_book()
+    """,
+    'DROP TRIGGER IF EXISTS book_search_books_data ON books_data',
+    """
+    CREATE TRIGGER book_search_books_data
+    AFTER UPDATE OF title ON books_data
+    FOR EACH ROW EXECUTE FUNCTION book_search_on_book_data()
+    """,
+    'DROP TRIGGER IF EXISTS book_search_book_author ON book_author',
+    """
+    CREATE TRIGGER book_search_book_author
+    AFTER INSERT OR DELETE ON book_author
+    FOR EACH ROW EXECUTE FUNCTION book_search_on_book_data()
+    """,
+    'DROP TRIGGER IF EXISTS book_search_book_genre ON book_genre',
+    """
+    CREATE TRIGGER book_search_book_genre
+    AFTER INSERT OR DELETE ON book_genre
+    FOR EACH ROW EXECUTE FUNCTION book_search_on_book_data()
+    """,
+    'DROP TRIGGER IF EXISTS book_search_authors ON authors',
+    """
+    CREATE TRIGGER book_search_authors
+    AFTER UPDATE OF author ON authors
+    FOR EACH ROW EXECUTE FUNCTION book_search_on_author()
+    """,
+)
+
+BOOK_SEARCH_BACKFILL = (
+    'SELECT book_search_upsert(ARRAY(SELECT id FROM books)) '
+    'WHERE NOT EXISTS (SELECT 1 FROM book_search)'
+)
@@ -0,0 +1,63 @@
+from itertools import islice
+
+import asyncpg
+
+from database.database import engine
+
+
+CHUNK_SIZE = 50_000
+
+
+def copy_connection():
+    # plain asyncpg connection, COPY is not available through SQLAlchemy
+    url = engine.url.set(drivername='postgresql')
+    return asyncpg.connect(url.render_as_string(hide_password=False))
+
+
+def chunks(records, size=CHUNK_SIZE):
+    records = iter(records)
+    while chunk := list(islice(records, size)):
+        yield chunk
+
+
+async def upsert_records(conn, table, columns, records, key=('id',),
+                         progress=None):
+    # every chunk is copied into a temporary table and merged from there,
+    # rows that did not change are not rewritten
+    stage = f'stage_{table}'
+    names = ', '.join(columns)
+    updated = [column for column in columns if column not in key]
+    if updated:
+        values = ', '.join(f'EXCLUDED.{column}' for column in updated)
+        current = ', '.join(f'{table}.{column}' for column in updated)
+        conflict = (
+            f'DO UPDATE SET ({", ".join(updated)}) = ROW({values}) '
+            f'WHERE ROW({current}) IS DISTINCT FROM ROW({values})'
+        )
+    else:
+        conflict = 'DO NOTHING'
+    # only the copied columns, without constraints and defaults
+    await conn.execute(
+        f'CREATE TEMP TABLE IF NOT EXISTS {stage} AS '
+        f'SELECT {names} FROM {table} WITH NO DATA'
+    )
+    total = 0
+    for chunk in chunks(records):
+        await conn.copy_records_to_table(stage, records=chunk, columns=columns)
+        await conn.execute(
+            f'INSERT INTO {table} ({names}) SELECT DISTINCT ON '
+            f'({", ".join(key)}) {names} FROM {stage} '
+            f'ON CONFLICT ({", ".join(key)}) {conflict}'
+        )
+        await conn.execute(f'TRUNCATE {stage}')
+        total += len(chunk)
+        if progress is not None:
+            progress(table, total)
+    return total
+
+
+async def reset_sequence(conn, table, column='id'):
+    await conn.execute(
+        f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+        f"coalesce((SELECT max({column}) FROM {table}), 0) + 1, false)"
+    )
@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from time import monotonic
+
+from config_data.config import (
+    BOOK_CACHE_SIZE, BOOK_CACHE_TTL, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL,
+)
+
+
+class CacheEntry:
+    __slots__ = ('value', 'expires_at')
+
+    def __init__(self, value, expires_at):
+        self.value = value
+        self.expires_at = expires_at
+
+
+class BookCardCache:
+    # LRU of book cards by Book.id, entries also expire after ttl seconds
+    def __init__(self, maxsize=BOOK_CACHE_SIZE, ttl=BOOK_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, book_id):
+        entry = self.entries.get(book_id)
+        if entry is None or entry.expires_at < monotonic():
+            self.misses += 1
+            return None
+        self.entries.move_to_end(book_id)
+        self.hits += 1
+        return entry.value
+
+    def set(self, book_id, value, generation):
+        # a card read before the last invalidation may already be stale
+        if value is None or generation != self.generation or not self.maxsize:
+            return
+        self.entries[book_id] = CacheEntry(value, monotonic() + self.ttl)
+        self.entries.move_to_end(book_id)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, *book_ids):
+        self.generation += 1
+        for book_id in book_ids:
+            self.entries.pop(book_id, None)
+
+    def clear(self):
+        self.generation += 1
+        self.entries.clear()
+
+    def disable(self):
+        # invalidations do not leave the process, with several bot
+        # processes a card changed by another one would be served stale
+        self.maxsize = 0
+        self.clear()
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / requests, 3) if requests else 0.0,
+        }
+
+
+book_cache = BookCardCache()
+
+
+class SearchResultCache:
+    # LRU of the last keyword search of every user: the normalized query and
+    # the ids of the books found, in result order. Entries expire after ttl
+    # seconds, the cards themselves come from book_cache.
+    def __init__(self, maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, query):
+        entry = self.entries.get(user_id)
+        if (entry is None or entry.expires_at < monotonic()
+                or entry.value[0] != query):
+            self.misses += 1
+            return None
+        self.entries.move_to_end(user_id)
+        self.hits += 1
+        return entry.value[1]
+
+    def set(self, user_id, query, book_ids):
+        self.entries[user_id] = CacheEntry(
+            (query, book_ids), monotonic() + self.ttl
+        )
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / requests, 3) if requests else 0.0,
+        }
+
+
+search_cache = SearchResultCache()
@@ -1,108 +1,75 @@
 import asyncio
 import csv
+from pathlib import Path
+from time import perf_counter
 
-from sqlalchemy import select, func
-from sqlalchemy.ext.asyncio import AsyncSession
+from database.bulk import copy_connection, reset_sequence, upsert_records
+from database.listener import REFERENCE_DATA_CHANNEL
 
-from database.database import engine
-from database.models import DictStatus, DictAction, Location, Genre
 
+CSV_DIR = Path(__file__).parent
 
-async def import_statuses():
-    async with engine.begin() as conn:
-        result = await conn.execute(
-            select(func.count()).select_from(DictStatus)
-        )
-        count = result.scalar()
-        if not count == 0:
-            return 'В таблице dict_statuses уже есть данные!'
-        await conn.run_sync(DictStatus.metadata.create_all)
-        async with AsyncSession(engine, expire_on_commit=False) as session:
-            with open('status.csv', 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                rows = [
-                    DictStatus(id=int(row['id']), status=row['status'])
-                    for row in reader
-                ]
-                session.add_all(rows)
-                await session.commit()
-                return 'Данные добавлены в таблицу dict_statuses!'
-
-
-async def import_actions():
-    async with engine.begin() as conn:
-        result = await conn.execute(
-            select(func.count()).select_from(DictAction)
-        )
-        count = result.scalar()
-        if not count == 0:
-            return 'В таблице dict_actions уже есть данные!'
-        await conn.run_sync(DictAction.metadata.create_all)
-        async with AsyncSession(engine, expire_on_commit=False) as session:
-            with open('action.csv', 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                rows = [
-                    DictAction(id=int(row['id']), action=row['action'])
-                    for row in reader
-                ]
-                session.add_all(rows)
-                await session.commit()
-                return 'Данные добавлены в таблицу dict_actions!'
-
-
-async def import_locations():
-    async with engine.begin() as conn:
-        result = await conn.execute(
-            select(func.count()).select_from(Location)
-        )
-        count = result.scalar()
-        if not count == 0:
-            return 'В таблице locations уже есть данные!'
-        await conn.run_sync(Location.metadata.create_all)
-        async with AsyncSession(engine, expire_on_commit=False) as session:
-            with open('location.csv', 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                rows = [
-                    Location(
-                        id=id + 1,
-                        # country=row['country'],
-                        region=row['region'],
-                        city=row['city'],
-                    )
-                    for id, row in enumerate(reader)
-                ]
-                session.add_all(rows)
-                await session.commit()
-                return 'Данные добавлены в таблицу locations!'
-
-
-async def import_genres():
-    async with engine.begin() as conn:
-        result = await conn.execute(
-            select(func.count()).select_from(Genre)
+
+def read_csv(file_name):
+    with open(CSV_DIR / file_name, 'r', encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def statuses():
+    for row in read_csv('status.csv'):
+        yield int(row['id']), row['status']
+
+
+def actions():
+    for row in read_csv('action.csv'):
+        yield int(row['id']), row['action']
+
+
+def locations():
+    # location.csv has no ids, a location is identified by its line number
+    for id, row in enumerate(read_csv('location.csv')):
+        yield id + 1, row['region'], row['city']
+
+
+def genres():
+    for row in read_csv('genre.csv'):
+        yield int(row['id']), row['genre']
+
+
+TABLES = (
+    ('dict_statuses', ('id', 'status'), statuses),
+    ('dict_actions', ('id', 'action'), actions),
+    ('locations', ('id', 'region', 'city'), locations),
+    ('genres', ('id', 'genre'), genres),
+)
+
+
+def report_progress(table, total):
+    print(f'{table}: {total} строк...', end='\r', flush=True)
+
+
+async def import_table(conn, table, columns, records):
+    started = perf_counter()
+    async with conn.transaction():
+        total = await upsert_records(
+            conn, table, columns, records(), progress=report_progress
         )
-        count = result.scalar()
-        if not count == 0:
-            return 'В таблице genres уже есть данные!'
-        await conn.run_sync(Genre.metadata.create_all)
-        async with AsyncSession(engine, expire_on_commit=False) as session:
-            with open('genre.csv', 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                rows = [
-                    Genre(id=int(row['id']), genre=row['genre'])
-                    for row in reader
-                ]
-                session.add_all(rows)
-                await session.commit()
-                return 'Данные добавлены в таблицу genres!'
+        await reset_sequence(conn, table)
+    return (f'Таблица {table} обновлена: {total} строк '
+            f'за {perf_counter() - started:.1f} с.')
 
 
 async def main():
-    statuses = await import_statuses()
-    actions = await import_actions()
-    locations = await import_locations()
-    genres = await import_genres()
-    print(statuses, actions, locations, genres, sep='\n')
+    conn = await copy_connection()
+    try:
+        for table, columns, records in TABLES:
+            print(await import_table(conn, table, columns, records))
+        # running bots reload their reference_cache
+        await conn.execute("SELECT pg_notify($1, '')",
+                           REFERENCE_DATA_CHANNEL)
+    finally:
+        await conn.close()
 
 
-asyncio.run(main())
+if __name__ == '__main__':
+    asyncio.run(main())
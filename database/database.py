@@ -1,18 +1,151 @@
+import asyncio
+import logging
+from time import monotonic
+
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from config_data.config import (
+    DB_COMMAND_TIMEOUT,
+    DB_ECHO,
+    DB_HOST,
+    DB_MAX_OVERFLOW,
+    DB_NAME,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_PRIMARY_STICKY_SECONDS,
+    DB_REPLICA_HOST,
+    DB_REPLICA_URL,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_STATEMENT_TIMEOUT,
+    DB_URL,
+)
+from .query_stats import TimedQueuePool, instrument
+
+
+DB_SETTINGS = {
+    'pool_size': DB_POOL_SIZE,
+    'max_overflow': DB_MAX_OVERFLOW,
+    'pool_timeout': DB_POOL_TIMEOUT,
+    'pool_recycle': DB_POOL_RECYCLE,
+    'pool_pre_ping': DB_POOL_PRE_PING,
+    'echo': DB_ECHO,
+}
+
+
+def create_engine(url):
+    engine = create_async_engine(
+        url,
+        **DB_SETTINGS,
+        poolclass=TimedQueuePool,
+        connect_args={
+            # the first one is the SQLAlchemy cache of prepared statements,
+            # the second one is used by asyncpg itself
+            'prepared_statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+            'statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+            'command_timeout': DB_COMMAND_TIMEOUT,
+            'server_settings': {
+                'statement_timeout': str(DB_STATEMENT_TIMEOUT),
+            },
+        },
+    )
+    instrument(engine)
+    return engine
+
+
+engine = create_engine(DB_URL)
+replica_engine = create_engine(DB_REPLICA_URL) if DB_REPLICA_URL else None
+
+
+class RecentWriters:
+    # users who wrote less than `window` seconds ago read from the primary,
+    # so they see their own changes while the replica catches up
+    def __init__(self, window=DB_PRIMARY_STICKY_SECONDS):
+        self.window = window
+        self.deadlines = {}
+
+    def pin(self, user_id):
+        now = monotonic()
+        self.deadlines[user_id] = now + self.window
+        if len(self.deadlines) > 10000:
+            self.deadlines = {
+                user: deadline for user, deadline in self.deadlines.items()
+                if deadline > now
+            }
+
+    def is_pinned(self, user_id):
+        deadline = self.deadlines.get(user_id)
+        return deadline is not None and deadline > monotonic()
+
+
+recent_writers = RecentWriters()
+
+
+class RoutingSession(Session):
+    # plain selects go to the replica, everything else and every statement
+    # after the first write of the session go to the primary
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if replica_engine is None:
+            return engine.sync_engine
+        if not self.info.get('primary'):
+            if self._flushing or not is_replica_safe(clause):
+                self.info['primary'] = True
+            else:
+                return replica_engine.sync_engine
+        if self._flushing or getattr(clause, 'is_dml', False):
+            self.info['wrote'] = True
+        return engine.sync_engine
+
+
+def is_replica_safe(clause):
+    return (
+        clause is not None
+        and getattr(clause, 'is_select', False)
+        and getattr(clause, '_for_update_arg', None) is None
+        and not clause.get_execution_options().get('use_primary')
+    )
+
+
+async_sessionmaker = async_sessionmaker(
+    sync_session_class=RoutingSession, expire_on_commit=False
+)
+
 
-from config_data.config import DB_URL
-from .models import Base
+async def ping(target):
+    async with target.connect() as conn:
+        await conn.execute(text('SELECT 1'))
 
 
-engine = create_async_engine(DB_URL, echo=True,)
-async_sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+async def warm_up_pool():
+    # open pool_size connections at once, so first updates do not pay
+    # for the connection handshake
+    engines = (engine, replica_engine) if replica_engine else (engine,)
+    await asyncio.gather(*(
+        ping(target) for target in engines for _ in range(DB_POOL_SIZE)
+    ))
 
 
 async def connect_to_database():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    logging.info(
+        'Database %s@%s: %s, statement_cache_size=%s, '
+        'statement_timeout=%sms, command_timeout=%ss',
+        DB_NAME, DB_HOST, DB_SETTINGS, DB_STATEMENT_CACHE_SIZE,
+        DB_STATEMENT_TIMEOUT, DB_COMMAND_TIMEOUT,
+    )
+    if replica_engine is not None:
+        logging.info(
+            'Reads go to the replica %s, writers are pinned to the primary '
+            'for %ss', DB_REPLICA_HOST, DB_PRIMARY_STICKY_SECONDS,
+        )
+    # the schema is created by migrations, see alembic upgrade head
+    await warm_up_pool()
     return async_sessionmaker
 
 
-async def close_database(session):
-    await session.close()
+async def close_database():
+    await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
@@ -1,182 +1,292 @@
+import asyncio
 from datetime import datetime, timedelta
-from typing import Dict
+from typing import Dict, NamedTuple, Optional
 
-from sqlalchemy import select, func, update, or_, and_
+from sqlalchemy import (
+    and_, delete, event, func, insert, literal, or_, select, tuple_, update,
+)
 from sqlalchemy.dialects.postgresql import array_agg
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, aliased
 
-from database.database import async_sessionmaker
+from config_data.config import SEARCH_CANDIDATES_LIMIT, SEARCH_RESULTS_LIMIT
+from database.cache import book_cache, search_cache
+from database.location_index import location_index
 from database.models import (
+    SEARCH_CONFIG,
+    STATUS_BOOKED,
+    STATUS_FREE,
+    STATUS_READING,
     Author,
     Book,
     BookData,
+    BookSearch,
+    DictAction,
     DictStatus,
     Genre,
     Location,
+    Notification,
     User,
     book_author,
-    book_genre
+    book_genre,
+    normalized_text,
 )
+from database.query_stats import instrumented
+from database.reference_cache import reference_cache
 
 
-async def select_user(user_id):
-    async with async_sessionmaker() as session:
-        user = await session.get(User, user_id)
-    return user
+def invalidate_books_on_commit(session, *book_ids):
+    # the cards are dropped now and once more when the update commits or
+    # rolls back, so a concurrent read can not cache the uncommitted state
+    book_cache.invalidate(*book_ids)
+    session.info.setdefault('invalidated_books', set()).update(book_ids)
 
 
-async def insert_user(user_id, first_name, last_name, username):
-    async with async_sessionmaker() as session:
-        user = User(
-            telegram_id=user_id,
-            first_name=first_name,
-            last_name=last_name,
-            username=username,
-        )
-        session.add(user)
-        await session.commit()
-
-
-async def select_location(user_input):
-    async with async_sessionmaker() as session:
-        locations = await session.execute(
-            select(
-                Location.id,
-                Location.city,
-                Location.region
-            ).select_from(Location
-                          ).where(Location.city.ilike(f'%{user_input}%')
-                                  ).order_by(Location.city)
-        )
-        locations = locations.fetchall()
-    return locations
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def invalidate_books(session):
+    book_cache.invalidate(*session.info.pop('invalidated_books', ()))
 
 
-async def insert_location(location_id, user_id):
-    async with async_sessionmaker() as session:
-        location = await session.get(Location, location_id)
-        user = await session.get(User, user_id)
-        user.location_id = location_id
-        await session.commit()
-    return location.city, location.region
+# set when a transaction with new notifications commits, wakes the sender.
+# Notifications written by other processes set it through NOTIFY
+notifications_added = asyncio.Event()
 
 
-async def select_books_by_title(user_input):
-    async with async_sessionmaker() as session:
-        books = await session.execute(select(
-            BookData.id,
-            BookData.title,
-            array_agg(Author.author).label('authors'),
-            array_agg(Genre.genre).label('genres'),
-        ).select_from(BookData
-                      ).outerjoin(book_author
-                                  ).outerjoin(Author
-                                              ).outerjoin(book_genre
-                                                          ).outerjoin(Genre
-        ).where(BookData.title.ilike(f'%{user_input}%')
-                ).group_by(BookData.id, BookData.title)
-                                      )
-        return books.fetchall()
-
-
-async def select_bookdata_by_id(book_id):
-    async with async_sessionmaker() as session:
-        book = await session.execute(select(
-            Book.id,
-            BookData.id.label('book_id'),
-            BookData.title,
-            array_agg(func.distinct(Author.author)).label('authors'),
-            array_agg(func.distinct(Genre.genre)).label('genres'),
-            DictStatus.status,
-            Location.city,
-            Book.status_id,
-            Book.remain_time,
-            Book.candidate_telegram_id,
-            Book.is_transferred,
-            Book.telegram_id,
-        ).select_from(Book
-                      ).join(BookData
-                      ).outerjoin(DictStatus
-                      ).outerjoin(Location
-                      ).outerjoin(book_author
-                      ).outerjoin(Author
-                      ).outerjoin(book_genre
-                      ).outerjoin(Genre
-                                  ).where(BookData.id == book_id
-                                          ).group_by(Book.id,
-                                                     BookData.id,
-                                                     DictStatus.id,
-                                                     Location.city)
-                                     )
-        return book.fetchone()
-
-
-async def insert_existing_book_instance(book_id, user_id):
-    user = await select_user(user_id)
-    async with async_sessionmaker() as session:
-        session.add(
-            Book(
-                book_id=book_id,
-                telegram_id=user.telegram_id,
-                location_id=user.location_id,
-            )
-        )
-        await session.commit()
+@event.listens_for(Session, 'after_commit')
+def wake_notification_sender(session):
+    if session.info.pop('notifications', False):
+        notifications_added.set()
 
 
-async def select_author_by_keyword(user_input):
-    async with async_sessionmaker() as session:
-        author = await session.execute(
-            select(Author.id, Author.author
-                   ).where(Author.author == user_input)
-            )
-    return author.fetchone()
+@event.listens_for(Session, 'after_rollback')
+def drop_notifications(session):
+    session.info.pop('notifications', None)
 
 
-async def insert_new_book_instance(user_id, book_data):
-    user = await select_user(user_id)
-    async with async_sessionmaker() as session:
-        book = BookData(title=book_data.get('book'))
-        session.add(book)
-        existing_authors = []
-        for author in book_data['authors']:
-            db_author = await select_author_by_keyword(author)
-            if db_author is None:
-                session.add(Author(author=author))
-            existing_authors.append(author)
-        await session.commit()
-        for author in existing_authors:
-            db_id, db_name = await select_author_by_keyword(author)
-            await session.execute(
-                book_author.insert().values(
-                    book_id=book.id,
-                    author_id=db_id,
-                )
-            )
-        genre_ids = book_data.get('genres_id')
-        if genre_ids is not None:
-            for genre_id in genre_ids:
-                await session.execute(
-                    book_genre.insert().values(
-                        book_id=book.id,
-                        genre_id=genre_id,
-                    )
-                )
-        else:
-            await session.execute(
-                book_genre.insert().values(
-                    book_id=book.id,
-                    genre_id=15,
-                )
-            )
+BOOKS_PAGE_SIZE = 10
+TITLES_LIMIT = 10
+READING_REMINDER_DAYS = 7
+SWEEP_BATCH_SIZE = 500
+
+
+class BooksPage(NamedTuple):
+    books: list
+    prev_cursor: Optional[int]
+    next_cursor: Optional[int]
+
+
+async def fetch_books_page(session, query, sort_keys, cursor_query,
+                           after=None, before=None):
+    # keyset pagination, the cursor is the id of the edge row (the last sort
+    # key) and its sort key is resolved by cursor_query inside the statement
+    keys = tuple_(*sort_keys)
+    id_column = sort_keys[-1]
+    if before is not None:
+        cursor = cursor_query.where(id_column == before).correlate(None)
+        query = query.where(keys < cursor.scalar_subquery()
+                            ).order_by(*(key.desc() for key in sort_keys))
+    else:
+        if after is not None:
+            cursor = cursor_query.where(id_column == after).correlate(None)
+            query = query.where(keys > cursor.scalar_subquery())
+        query = query.order_by(*sort_keys)
+    result = await session.execute(query.limit(BOOKS_PAGE_SIZE + 1))
+    books = result.fetchall()
+    has_more = len(books) > BOOKS_PAGE_SIZE
+    books = books[:BOOKS_PAGE_SIZE]
+    if before is not None:
+        books.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = after is not None, has_more
+    if not books:
+        return BooksPage(books, None, None)
+    return BooksPage(
+        books,
+        books[0].id if has_prev else None,
+        books[-1].id if has_next else None,
+    )
+
+
+def book_cards_query(*columns):
+    # status, city and genre names are taken from reference_cache
+    return select(
+        BookSearch.id,
+        BookSearch.book_data_id.label('book_id'),
+        BookSearch.title,
+        BookSearch.authors,
+        BookSearch.genre_ids,
+        BookSearch.status_id,
+        BookSearch.location_id,
+        BookSearch.remain_time,
+        BookSearch.candidate_telegram_id,
+        BookSearch.is_transferred,
+        BookSearch.telegram_id,
+        *columns,
+    )
+
+
+@instrumented
+async def select_user(session, user_id):
+    user = await session.get(User, user_id)
+    return user
+
+
+@instrumented
+async def insert_user(session, user_id, first_name, last_name, username):
+    user = User(
+        telegram_id=user_id,
+        first_name=first_name,
+        last_name=last_name,
+        username=username,
+    )
+    session.add(user)
+
+
+@instrumented
+async def load_reference_data(session):
+    statuses = await session.execute(
+        select(DictStatus.id, DictStatus.status)
+    )
+    actions = await session.execute(
+        select(DictAction.id, DictAction.action)
+    )
+    genres = await session.execute(
+        select(Genre.id, Genre.genre).order_by(Genre.id)
+    )
+    locations = await session.execute(
+        select(
+            Location.id, Location.city, Location.region,
+            func.count(User.telegram_id).label('users'),
+        ).outerjoin(User, User.location_id == Location.id
+                    ).group_by(Location.id)
+    )
+    reference_cache.update(
+        statuses.fetchall(),
+        actions.fetchall(),
+        genres.fetchall(),
+        locations.fetchall(),
+    )
+
+
+@instrumented
+async def select_location(session, user_input):
+    if not location_index:
+        await load_reference_data(session)
+    return location_index.search(user_input)
+
+
+@instrumented
+async def insert_location(session, location_id, user_id):
+    await session.execute(
+        update(User
+               ).where(User.telegram_id == user_id
+                       ).values(location_id=location_id)
+    )
+    location = reference_cache.locations[location_id]
+    return location.city, location.region
+
+
+@instrumented
+async def select_books_by_title(session, user_input):
+    # substring match served by the trigram index, closest titles first,
+    # the catalog can hold millions of works
+    title = normalize_keyword(user_input)
+    books = await session.execute(select(
+        BookData.id,
+        BookData.title,
+        select(array_agg(Author.author)).join(book_author).where(
+            book_author.c.book_id == BookData.id
+        ).scalar_subquery().label('authors'),
+        select(array_agg(book_genre.c.genre_id)).where(
+            book_genre.c.book_id == BookData.id
+        ).scalar_subquery().label('genre_ids'),
+    ).where(normalized_text(BookData.title).contains(title, autoescape=True)
+            ).order_by(
+        func.similarity(normalized_text(BookData.title), title).desc(),
+        BookData.id,
+    ).limit(TITLES_LIMIT))
+    return books.fetchall()
+
+
+@instrumented
+async def select_bookdata_by_id(session, book_id):
+    book = await session.execute(select(
+        BookData.id,
+        BookData.title,
+        array_agg(func.distinct(Author.author)).label('authors'),
+        array_agg(func.distinct(book_genre.c.genre_id)).label('genre_ids'),
+    ).select_from(BookData
+                  ).outerjoin(book_author
+                  ).outerjoin(Author
+                  ).outerjoin(book_genre
+                              ).where(BookData.id == book_id
+                                      ).group_by(BookData.id)
+                                 )
+    return book.fetchone()
+
+
+def insert_book_instance(book_id, user_id):
+    # owner and location are copied from users inside the same statement
+    return insert(Book.__table__).from_select(
+        ['book_id', 'telegram_id', 'location_id'],
+        select(literal(book_id), User.telegram_id, User.location_id
+               ).where(User.telegram_id == user_id),
+    )
+
+
+@instrumented
+async def insert_existing_book_instance(session, book_id, user_id):
+    await session.execute(insert_book_instance(book_id, user_id))
+
+
+@instrumented
+async def select_author_by_keyword(session, user_input):
+    author = await session.execute(
+        select(Author.id, Author.author
+               ).where(Author.author == user_input)
+        )
+    return author.fetchone()
 
-        session.add(
-            Book(
-                book_id=book.id,
-                telegram_id=user.telegram_id,
-                location_id=user.location_id,
+
+@instrumented
+async def insert_new_book_instance(session, user_id, book_data):
+    authors = list(dict.fromkeys(
+        author.strip() for author in book_data['authors'] if author.strip()
+    ))
+    genre_ids = book_data.get('genres_id') or [15]
+    book_id = await session.scalar(
+        insert(BookData.__table__
+               ).values(title=book_data.get('book')
+                        ).returning(BookData.id)
+    )
+    if authors:
+        # existing authors are left untouched, an UPDATE of one would fire
+        # book_search_authors and rebuild every book of the author. An
+        # insert that conflicts with a concurrent one waits for it, so the
+        # next statement, with a new read committed snapshot, sees the
+        # authors either way. Sorted, so concurrent inserts wait in the
+        # same order.
+        await session.execute(
+            pg_insert(Author.__table__).values(
+                [{'author': author} for author in sorted(authors)]
+            ).on_conflict_do_nothing(index_elements=['author'])
+        )
+        await session.execute(
+            book_author.insert().from_select(
+                ['book_id', 'author_id'],
+                select(literal(book_id), Author.id
+                       ).where(Author.author.in_(authors)),
             )
         )
-        await session.commit()
+    await session.execute(
+        book_genre.insert().values(
+            [{'book_id': book_id, 'genre_id': genre_id}
+             for genre_id in dict.fromkeys(genre_ids)]
+        )
+    )
+    await session.execute(insert_book_instance(book_id, user_id))
 
 
 async def get_book_data(book_data):
@@ -186,230 +296,410 @@ async def get_book_data(book_data):
         genre = ', '.join(g for g in [*book_data.get('genres', '')])
     else:
         title = book_data.title
-        author = ', '.join(a.title() for a in set(book_data.authors))
-        genre = ', '.join(g for g in set(book_data.genres) if g is not None)
+        author = ', '.join(
+            a.title() for a in set(book_data.authors or ()) if a is not None
+        )
+        genre = ', '.join(
+            reference_cache.genre_names(set(book_data.genre_ids or ()))
+        )
     return title, author, genre
 
 
-async def select_users_books(user_id):
-    async with async_sessionmaker() as session:
-        book = await session.execute(select(
-            Book.id,
-            BookData.id.label('book_id'),
-            BookData.title,
-            array_agg(func.distinct(Author.author)).label('authors'),
-            array_agg(func.distinct(Genre.genre)).label('genres'),
-            DictStatus.status,
-            Location.city,
-            Book.remain_time,
-        ).select_from(Book
-                      ).join(BookData
-                      ).outerjoin(DictStatus
-                      ).outerjoin(Location
-                      ).outerjoin(book_author
-                      ).outerjoin(Author
-                      ).outerjoin(book_genre
-                      ).outerjoin(Genre
-                                  ).filter(Book.telegram_id == user_id
-                                           ).group_by(Book.id,
-                                                      BookData.id,
-                                                      DictStatus.id,
-                                                      Location.city,
-                                                      # Author.author,
-                                                      # Genre.genre
-                                                      ).order_by(DictStatus.id)
-                                     )
-        return book.fetchall()
-
-
-async def select_book(book_id):
-    async with async_sessionmaker() as session:
-        book = await session.execute(select(
-            Book.id,
-            BookData.id.label('book_id'),
-            BookData.title,
-            array_agg(func.distinct(Author.author)).label('authors'),
-            array_agg(func.distinct(Genre.genre)).label('genres'),
-            DictStatus.status,
-            Location.city,
-            Book.status_id,
-            Book.remain_time,
-            Book.candidate_telegram_id,
-            Book.is_transferred,
-            Book.telegram_id
-        ).select_from(Book
-                      ).join(BookData
-                      ).outerjoin(DictStatus
-                      ).outerjoin(Location
-                      ).outerjoin(book_author
-                      ).outerjoin(Author
-                      ).outerjoin(book_genre
-                      ).outerjoin(Genre
-                                  ).filter(Book.id == book_id
-                                           ).group_by(Book.id,
-                                                      BookData.id,
-                                                      DictStatus.id,
-                                                      Location.city,
-                                                      # Author.author,
-                                                      # Genre.genre
-                                                      ).order_by(DictStatus.id)
-                                     )
-        return book.fetchone()
-
-
-async def update_book(book_id, book_status, candidate_id=None):
-    async with async_sessionmaker() as session:
-        book = await select_book(book_id)
-        remain_time = (datetime.now() + timedelta(days=90) if book_status == 3
-                       else None)
-        candidate_telegram_id = ( # TODO check if all correct with diff statuses!!!
-            None if book_status == 1
-            else book.candidate_telegram_id if book_status == 3
-            else candidate_id
+@instrumented
+async def select_users_books(session, user_id, after=None, before=None):
+    sort_keys = (BookSearch.status_id, BookSearch.title, BookSearch.id)
+    return await fetch_books_page(
+        session,
+        book_cards_query().where(BookSearch.telegram_id == user_id),
+        sort_keys,
+        select(*sort_keys),
+        after,
+        before,
+    )
+
+
+@instrumented
+async def select_book(session, book_id):
+    book = book_cache.get(book_id)
+    if book is not None:
+        return book
+    generation = book_cache.generation
+    # cards are cached, a lagging replica must not put a stale one there
+    book = await session.execute(
+        book_cards_query().where(BookSearch.id == book_id
+                                 ).execution_options(use_primary=True)
+    )
+    book = book.fetchone()
+    book_cache.set(book_id, book, generation)
+    return book
+
+
+@instrumented
+async def select_books(session, book_ids):
+    # cards in the order of book_ids, the uncached ones in one statement
+    books = {book_id: book_cache.get(book_id) for book_id in book_ids}
+    missing = [book_id for book_id, book in books.items() if book is None]
+    if missing:
+        generation = book_cache.generation
+        result = await session.execute(
+            book_cards_query().where(BookSearch.id.in_(missing)
+                                     ).execution_options(use_primary=True)
         )
-
-        is_transferred = False if book_status == 1 else book.is_transferred
-        await session.execute(
-            update(Book
-                   ).where(Book.id == book_id
-                           ).values(
-                status_id=book_status,
-                remain_time=remain_time,
-                candidate_telegram_id=candidate_telegram_id,
-                is_transferred=is_transferred
-            )
-        )
-        await session.commit()
-
-
-async def update_book_canceling_transfer(book_id):
-    async with async_sessionmaker() as session:
-        await session.execute(update(Book).where(
-                Book.id == book_id
-            ).values(
-                status_id=1,
-                remain_time=None,
-                candidate_telegram_id=None,
-                is_transferred=False
-            )
+        for book in result.fetchall():
+            books[book.id] = book
+            book_cache.set(book.id, book, generation)
+    return [books[book_id] for book_id in book_ids
+            if books[book_id] is not None]
+
+
+def book_card_returning():
+    # the card columns are correlated to the updated row, so a transition
+    # returns everything the handlers show in the same round trip
+    previous = aliased(Book)
+    return previous, (
+        Book.id,
+        Book.book_id,
+        select(BookData.title).where(BookData.id == Book.book_id
+                                     ).correlate(Book).scalar_subquery(
+                                     ).label('title'),
+        select(array_agg(Author.author)).join(book_author).where(
+            book_author.c.book_id == Book.book_id
+        ).correlate(Book).scalar_subquery().label('authors'),
+        select(array_agg(book_genre.c.genre_id)).where(
+            book_genre.c.book_id == Book.book_id
+        ).correlate(Book).scalar_subquery().label('genre_ids'),
+        Book.status_id,
+        Book.location_id,
+        Book.remain_time,
+        Book.candidate_telegram_id,
+        Book.is_transferred,
+        Book.telegram_id,
+        previous.status_id.label('previous_status_id'),
+        previous.candidate_telegram_id.label('previous_candidate_id'),
+    )
+
+
+async def transition_book(session, book_id, expected_status, values,
+                          *conditions):
+    # UPDATE ... WHERE status_id = expected RETURNING ..., None means that
+    # the book was not in the expected state and nothing was changed
+    previous, columns = book_card_returning()
+    book = await session.execute(
+        update(Book.__table__
+               ).where(Book.id == book_id,
+                       Book.status_id == expected_status,
+                       previous.id == Book.id,
+                       *conditions
+                       ).values(**values
+                                ).returning(*columns)
+    )
+    book = book.fetchone()
+    invalidate_books_on_commit(session, book_id)
+    return book
+
+
+@instrumented
+async def update_book_booking(session, book_id, candidate_id):
+    return await transition_book(
+        session,
+        book_id, STATUS_FREE,
+        {'status_id': STATUS_BOOKED, 'candidate_telegram_id': candidate_id}
+    )
+
+
+@instrumented
+async def update_book_own_status(session, book_id, book_status):
+    if book_status == STATUS_READING:
+        return await transition_book(session, book_id, STATUS_FREE, {
+            'status_id': STATUS_READING,
+            'remain_time': datetime.now() + timedelta(days=90),
+            'reminder_sent': False,
+        })
+    return await transition_book(session, book_id, STATUS_READING, {
+        'status_id': STATUS_FREE,
+        'remain_time': None,
+        'candidate_telegram_id': None,
+        'is_transferred': False,
+    })
+
+
+@instrumented
+async def update_book_canceling_transfer(session, book_id):
+    return await transition_book(session, book_id, STATUS_BOOKED, {
+        'status_id': STATUS_FREE,
+        'remain_time': None,
+        'candidate_telegram_id': None,
+        'is_transferred': False,
+    })
+
+
+@instrumented
+async def update_book_transfer_by_candidate(session, book_id, candidate_id):
+    return await transition_book(
+        session,
+        book_id,
+        STATUS_BOOKED,
+        {
+            'status_id': STATUS_READING,
+            'remain_time': datetime.now() + timedelta(days=90),
+            'reminder_sent': False,
+            'telegram_id': candidate_id,
+            'candidate_telegram_id': None,
+            'is_transferred': False,
+        },
+        Book.is_transferred.is_(True),
+        Book.candidate_telegram_id == candidate_id,
+    )
+
+
+@instrumented
+async def update_book_transfer(session, book_id):
+    return await transition_book(
+        session,
+        book_id,
+        STATUS_BOOKED,
+        {'is_transferred': True},
+        Book.is_transferred.is_not(True),
+        Book.candidate_telegram_id.is_not(None),
+    )
+
+
+@instrumented
+async def update_remain_time(session, book_id, user_id):
+    return await transition_book(
+        session,
+        book_id,
+        STATUS_READING,
+        {'remain_time': Book.remain_time + timedelta(days=15),
+         'reminder_sent': False},
+        Book.remain_time.is_not(None),
+        Book.telegram_id == user_id,
+    )
+
+
+@instrumented
+async def select_books_by_home_location(session, user_id, after=None,
+                                        before=None):
+    user = await select_user(session, user_id)
+    location_id = user.location_id
+    sort_keys = (BookSearch.status_id, BookSearch.title, BookSearch.id)
+    page = await fetch_books_page(
+        session,
+        book_cards_query().where(
+            and_(BookSearch.location_id == location_id,
+                 BookSearch.telegram_id != user_id)
+        ),
+        sort_keys,
+        select(*sort_keys),
+        after,
+        before,
+    )
+
+    return page, location_id
+
+
+def normalize_keyword(user_input):
+    return ' '.join(user_input.lower().replace('ё', 'е').split())
+
+
+def keyword_relevance(column, keyword):
+    ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, keyword)
+    vector = func.to_tsvector(SEARCH_CONFIG, normalized_text(column))
+    rank = func.greatest(
+        func.ts_rank(vector, ts_query),
+        func.word_similarity(keyword, normalized_text(column)),
+    )
+    # %> is the pg_trgm word similarity operator, it gives typo tolerance
+    match = or_(
+        vector.op('@@')(ts_query),
+        normalized_text(column).op('%>')(keyword),
+    )
+    return rank, match
+
+
+def ids_page(book_ids, after=None, before=None):
+    # the cursors of fetch_books_page over a list of ids, an id that is not
+    # in the list any more starts from the first page
+    if before is not None and before in book_ids:
+        end = book_ids.index(before)
+        start = max(end - BOOKS_PAGE_SIZE, 0)
+    else:
+        start = (book_ids.index(after) + 1
+                 if after is not None and after in book_ids else 0)
+        end = start + BOOKS_PAGE_SIZE
+    page = book_ids[start:end]
+    if not page:
+        return page, None, None
+    return (
+        page,
+        page[0] if start > 0 else None,
+        page[-1] if end < len(book_ids) else None,
+    )
+
+
+@instrumented
+async def select_book_ids_by_keyword(session, user_id, keyword):
+    _, match = keyword_relevance(BookSearch.document, keyword)
+    # a broad keyword matches a large part of the catalog, only the first
+    # SEARCH_CANDIDATES_LIMIT matches the index returns get ranked. The
+    # inner LIMIT has no ORDER BY, so the scan stops there
+    candidates = select(
+        BookSearch.id, BookSearch.status_id, BookSearch.document
+    ).where(
+        match, BookSearch.telegram_id != user_id
+    ).limit(SEARCH_CANDIDATES_LIMIT).subquery()
+    rank, _ = keyword_relevance(candidates.c.document, keyword)
+    # relevance order inside each status, higher rank first
+    result = await session.execute(
+        select(candidates.c.id).order_by(
+            candidates.c.status_id, -rank, candidates.c.id
+        ).limit(SEARCH_RESULTS_LIMIT)
+    )
+    return result.scalars().all()
+
+
+@instrumented
+async def select_books_by_keyword(session, user_id, user_input, after=None,
+                                  before=None, refresh=False):
+    # the ranked ids of a search are kept in search_cache, paging and going
+    # back to the list only read the cards of the visible page
+    keyword = normalize_keyword(user_input)
+    book_ids = None if refresh else search_cache.get(user_id, keyword)
+    if book_ids is None:
+        book_ids = await select_book_ids_by_keyword(session, user_id, keyword)
+        search_cache.set(user_id, keyword, book_ids)
+    page, prev_cursor, next_cursor = ids_page(book_ids, after, before)
+    books = await select_books(session, page)
+    # a card may have changed hands since the search
+    books = [book for book in books if book.telegram_id != user_id]
+    return BooksPage(books, prev_cursor, next_cursor)
+
+
+def reading_sweep_batch(*conditions):
+    # oldest first, SKIP LOCKED lets a handler that is changing one of
+    # the books finish instead of waiting for the sweep
+    return select(Book.id).where(
+        Book.status_id == STATUS_READING, *conditions
+    ).order_by(Book.remain_time).limit(SWEEP_BATCH_SIZE
+                                       ).with_for_update(skip_locked=True)
+
+
+def reading_sweep_returning():
+    return (
+        Book.id,
+        Book.telegram_id,
+        Book.remain_time,
+        select(BookData.title).where(BookData.id == Book.book_id
+                                     ).correlate(Book).scalar_subquery(
+                                     ).label('title'),
+    )
+
+
+@instrumented
+async def update_reading_reminders(session, now):
+    # marks up to SWEEP_BATCH_SIZE readings that end within
+    # READING_REMINDER_DAYS and were not reminded yet
+    books = await session.execute(
+        update(Book.__table__).where(Book.id.in_(reading_sweep_batch(
+            Book.remain_time > now,
+            Book.remain_time <= now + timedelta(days=READING_REMINDER_DAYS),
+            Book.reminder_sent.is_not(True),
+        ))).values(reminder_sent=True).returning(*reading_sweep_returning())
+    )
+    return books.fetchall()
+
+
+@instrumented
+async def update_expired_readings(session, now):
+    # frees up to SWEEP_BATCH_SIZE books whose reading period is over
+    books = await session.execute(
+        update(Book.__table__).where(Book.id.in_(reading_sweep_batch(
+            Book.remain_time <= now,
+        ))).values(
+            status_id=STATUS_FREE,
+            remain_time=None,
+            candidate_telegram_id=None,
+            is_transferred=False,
+            reminder_sent=False,
+        ).returning(*reading_sweep_returning())
+    )
+    books = books.fetchall()
+    invalidate_books_on_commit(session, *(book.id for book in books))
+    return books
+
+
+def add_notification(session, user_id, text, reply_markup=None,
+                     parse_mode=None):
+    # written in the transaction of the change it reports, the outbox
+    # sender delivers it once the transaction commits
+    session.add(Notification(
+        telegram_id=user_id,
+        text=text,
+        parse_mode=parse_mode,
+        reply_markup=(reply_markup.to_python() if reply_markup is not None
+                      else None),
+    ))
+    session.info['notifications'] = True
+
+
+@instrumented
+async def claim_notifications(session, limit, lease):
+    # the claimed rows are hidden from other senders for `lease` seconds,
+    # if this sender dies before finishing them they are sent again
+    batch = select(Notification.id).where(
+        Notification.send_after <= func.now()
+    ).order_by(Notification.send_after, Notification.id
+               ).limit(limit).with_for_update(skip_locked=True)
+    notifications = await session.execute(
+        update(Notification.__table__).where(Notification.id.in_(batch)
+                                             ).values(
+            send_after=func.now() + timedelta(seconds=lease),
+            attempts=Notification.attempts + 1,
+        ).returning(
+            Notification.id,
+            Notification.telegram_id,
+            Notification.text,
+            Notification.parse_mode,
+            Notification.reply_markup,
+            Notification.attempts,
+            select(User.is_blocked).where(
+                User.telegram_id == Notification.telegram_id
+            ).correlate(Notification).scalar_subquery().label('is_blocked'),
         )
-        await session.commit()
-
-
-async def update_book_transfer_by_candidate(book_id, candidate_id):
-    async with async_sessionmaker() as session:
-        remain_time = datetime.now() + timedelta(days=90)
-        await session.execute(
-            update(Book
-                   ).where(Book.id == book_id
-                           ).values(
-                status_id=3,
-                remain_time=remain_time,
-                telegram_id=candidate_id,
-                candidate_telegram_id=None,
-                is_transferred=False
-            )
+    )
+    # RETURNING has no order, messages to one chat keep theirs
+    return sorted(notifications.fetchall(), key=lambda row: row.id)
+
+
+@instrumented
+async def delete_notifications(session, notification_ids):
+    await session.execute(
+        delete(Notification).where(Notification.id.in_(notification_ids))
+    )
+
+
+@instrumented
+async def reschedule_notification(session, notification_id, delay, error):
+    # delay None gives the notification up, it stays for inspection
+    await session.execute(
+        update(Notification).where(Notification.id == notification_id).values(
+            send_after=(func.now() + timedelta(seconds=delay)
+                        if delay is not None else None),
+            last_error=error,
         )
-        await session.commit()
-
+    )
 
-async def update_book_transfer(book_id):
-    async with async_sessionmaker() as session:
 
+@instrumented
+async def update_user_blocked(session, user_id, is_blocked=True):
+    await session.execute(
+        update(User).where(User.telegram_id == user_id
+                           ).values(is_blocked=is_blocked)
+    )
+    if is_blocked:
         await session.execute(
-            update(Book
-                   ).where(Book.id == book_id
-                           ).values(is_transferred=True))
-        await session.commit()
-
-
-async def update_remain_time(book_id):
-    async with async_sessionmaker() as session:
-        book = await select_book(book_id)
-        remain_time = book.remain_time + timedelta(days=15)
-        await session.execute(
-            update(Book
-                   ).where(Book.id == book_id
-                           ).values(remain_time=remain_time)
+            update(Notification).where(
+                Notification.telegram_id == user_id,
+                Notification.send_after.is_not(None),
+            ).values(send_after=None, last_error='blocked')
         )
-        await session.commit()
-
-
-async def select_books_by_home_location(user_id):
-    user = await select_user(user_id)
-    location_id = user.location_id
-    async with async_sessionmaker() as session:
-        book = await session.execute(select(
-            Book.id,
-            BookData.id.label('book_id'),
-            BookData.title,
-            array_agg(func.distinct(Author.author)).label('authors'),
-            array_agg(func.distinct(Genre.genre)).label('genres'),
-            DictStatus.status,
-            Location.city,
-            Book.status_id,
-            Book.remain_time,
-            Book.candidate_telegram_id,
-            Book.is_transferred,
-        ).select_from(Book
-                      ).join(BookData
-                             ).outerjoin(DictStatus
-                                         ).outerjoin(Location
-                                                     ).outerjoin(book_author
-                                                                 ).outerjoin(
-            Author
-            ).outerjoin(book_genre
-                        ).outerjoin(Genre
-                                    ).where(
-            and_(Location.id == location_id, Book.telegram_id != user_id,)
-                 ).group_by(Book.id,
-                             BookData.id,
-                             DictStatus.id,
-                             Location.city,
-                             # Author.author,
-                             # Genre.genre
-                             ).order_by(DictStatus.id,
-                                        BookData.title))
-
-        return book.fetchall(), location_id
-
-
-
-
-async def select_books_by_keyword(user_id, user_input):
-    async with async_sessionmaker() as session:
-        book = await session.execute(select(
-            Book.id,
-            BookData.id.label('book_id'),
-            BookData.title,
-            array_agg(func.distinct(Author.author)).label('authors'),
-            array_agg(func.distinct(Genre.genre)).label('genres'),
-            DictStatus.status,
-            Location.city,
-            Book.status_id,
-            Book.remain_time,
-            Book.candidate_telegram_id,
-            Book.is_transferred,
-        ).select_from(Book
-                      ).join(BookData
-                      ).outerjoin(DictStatus
-                      ).outerjoin(Location
-                      ).outerjoin(book_author
-                      ).outerjoin(Author
-                      ).outerjoin(book_genre
-                      ).outerjoin(Genre
-                      ).where(or_(BookData.title.ilike(f'%{user_input}%'),
-                                  Author.author.ilike(f'%{user_input}%'),
-                                  Genre.genre.ilike(f'%{user_input}%')),
-                              and_(Book.telegram_id != user_id,
-                                   # Book.location_id == location
-                                   )).group_by(Book.id,
-                                               BookData.id,
-                                               DictStatus.id,
-                                               Location.city,
-                                               # Author.author,
-                                               # Genre.genre
-                                               ).order_by(DictStatus.id,
-                                                          Location.city)
-                                     )
-        return book.fetchall()
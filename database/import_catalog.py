@@ -0,0 +1,202 @@
+"""Import a book catalog dump into books_data, authors and their links.
+
+JSONL records need a title, authors (author_name) and genres (subject)
+are optional. A CSV needs the columns title, authors and genres, several
+values in a column are separated by ';'. Genres are matched to the
+existing genres by name, unknown ones are skipped.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+from itertools import islice
+from pathlib import Path
+
+from database.bulk import chunks, copy_connection, upsert_records
+
+
+BATCH_SIZE = 5_000
+
+
+def normalize_title(title):
+    # same folding as normalized_text() in models, so keys match the index
+    return ' '.join(title.lower().replace('ё', 'е').split())
+
+
+def names(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(';')
+    return [
+        ' '.join((item.get('name', '') if isinstance(item, dict)
+                  else str(item)).split())
+        for item in value
+    ]
+
+
+def jsonl_records(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield (
+                record.get('title'),
+                names(record.get('authors', record.get('author_name'))),
+                names(record.get('genres', record.get('subject'))),
+            )
+
+
+def csv_records(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            yield (
+                row.get('title'),
+                names(row.get('authors')),
+                names(row.get('genres')),
+            )
+
+
+READERS = {
+    '.jsonl': jsonl_records,
+    '.json': jsonl_records,
+    '.csv': csv_records,
+}
+
+
+class Checkpoint:
+    # number of records already imported, saved after every batch
+    def __init__(self, path):
+        self.path = Path(path)
+        self.records = 0
+        if self.path.exists():
+            self.records = json.loads(self.path.read_text())['records']
+
+    def save(self, records):
+        self.records = records
+        temporary = self.path.with_suffix('.tmp')
+        temporary.write_text(json.dumps({'records': records}))
+        os.replace(temporary, self.path)
+
+
+async def author_ids(conn, authors):
+    await upsert_records(
+        conn, 'authors', ('author',), ((author,) for author in authors),
+        key=('author',),
+    )
+    rows = await conn.fetch(
+        'SELECT id, author FROM authors WHERE author = ANY($1::text[])',
+        list(authors),
+    )
+    return {row['author']: row['id'] for row in rows}
+
+
+async def existing_works(conn, titles):
+    rows = await conn.fetch(
+        """
+        SELECT d.id, translate(lower(d.title), 'ё', 'е') AS title,
+               array_remove(array_agg(ba.author_id ORDER BY ba.author_id),
+                            NULL) AS author_ids
+        FROM books_data d
+        LEFT JOIN book_author ba ON ba.book_id = d.id
+        WHERE translate(lower(d.title), 'ё', 'е') = ANY($1::text[])
+        GROUP BY d.id
+        """,
+        list(titles),
+    )
+    return {
+        (row['title'], tuple(row['author_ids'])): row['id'] for row in rows
+    }
+
+
+async def import_batch(conn, records, genres):
+    records = [
+        (' '.join(title.split()), [author for author in authors if author],
+         genres_of)
+        for title, authors, genres_of in records
+        if title and title.strip()
+    ]
+    ids = await author_ids(conn, {
+        author for _, authors, _ in records for author in authors
+    })
+    # a work is its normalized title and the set of its authors
+    works = {}
+    for title, authors, genres_of in records:
+        key = (normalize_title(title),
+               tuple(sorted({ids[author] for author in authors})))
+        work = works.setdefault(key, (title, set()))
+        work[1].update(
+            genres[genre.lower()] for genre in genres_of
+            if genre.lower() in genres
+        )
+
+    found = await existing_works(conn, {key[0] for key in works})
+    new = [key for key in works if key not in found]
+    new_ids = await conn.fetch(
+        "SELECT nextval(pg_get_serial_sequence('books_data', 'id')) "
+        "FROM generate_series(1, $1)",
+        len(new),
+    )
+    found.update(zip(new, (row[0] for row in new_ids)))
+    if new:
+        await conn.copy_records_to_table(
+            'books_data', columns=('id', 'title'),
+            records=[(found[key], works[key][0]) for key in new],
+        )
+    await upsert_records(
+        conn, 'book_author', ('book_id', 'author_id'),
+        ((found[key], author) for key in new for author in key[1]),
+        key=('book_id', 'author_id'),
+    )
+    # genres are added to already known works too
+    await upsert_records(
+        conn, 'book_genre', ('book_id', 'genre_id'),
+        ((found[key], genre) for key, (_, genres_of) in works.items()
+         for genre in genres_of),
+        key=('book_id', 'genre_id'),
+    )
+    return len(new), len(works) - len(new)
+
+
+async def import_catalog(path, checkpoint, batch_size):
+    records = READERS[path.suffix.lower()](path)
+    # records of the finished batches are skipped without touching the db
+    records = islice(records, checkpoint.records, None)
+    conn = await copy_connection()
+    try:
+        genres = {
+            row['genre'].lower(): row['id']
+            for row in await conn.fetch('SELECT id, genre FROM genres')
+        }
+        created = matched = 0
+        for batch in chunks(records, batch_size):
+            async with conn.transaction():
+                new, known = await import_batch(conn, batch, genres)
+            checkpoint.save(checkpoint.records + len(batch))
+            created += new
+            matched += known
+            print(f'{checkpoint.records} записей: {created} новых книг, '
+                  f'{matched} уже в базе', flush=True)
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('dump', type=Path, help='.jsonl or .csv file')
+    parser.add_argument('--checkpoint', type=Path,
+                        help='defaults to <dump>.checkpoint')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    if args.dump.suffix.lower() not in READERS:
+        parser.error('поддерживаются только файлы .jsonl и .csv')
+    checkpoint = Checkpoint(
+        args.checkpoint or args.dump.with_name(args.dump.name + '.checkpoint')
+    )
+    asyncio.run(import_catalog(args.dump, checkpoint, args.batch_size))
+
+
+if __name__ == '__main__':
+    main()
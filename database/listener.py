@@ -0,0 +1,94 @@
+import asyncio
+import logging
+
+from database.bulk import copy_connection
+
+
+# NOTIFY channels, the payload is not used
+REFERENCE_DATA_CHANNEL = 'reference_data'
+# sent by the notifications_added trigger, see migration 0008
+NOTIFICATIONS_CHANNEL = 'notifications'
+
+RECONNECT_DELAY = 5
+
+
+class Listener:
+    # one LISTEN connection per process, outside of the pool. Callbacks get
+    # the payload, a coroutine they return is run as a task
+    def __init__(self):
+        self.callbacks = {}
+        self.tasks = set()
+        self.task = None
+        self.conn = None
+
+    async def subscribe(self, channel, callback):
+        new = channel not in self.callbacks
+        self.callbacks.setdefault(channel, []).append(callback)
+        if new and self.conn is not None:
+            await self.conn.add_listener(channel, self.on_notification)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def notify(self, channel, payload=None):
+        for callback in self.callbacks.get(channel, ()):
+            result = callback(payload)
+            if asyncio.iscoroutine(result):
+                task = asyncio.create_task(result)
+                self.tasks.add(task)
+                task.add_done_callback(self.done)
+
+    def done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error('Notification callback failed',
+                          exc_info=task.exception())
+
+    async def run(self):
+        reconnect = False
+        while True:
+            try:
+                conn = await copy_connection()
+            except Exception:
+                logging.exception('LISTEN connection failed')
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            closed = asyncio.Event()
+            conn.add_termination_listener(lambda conn: closed.set())
+            try:
+                # channels may be subscribed while this is connecting
+                listening = set()
+                while channels := set(self.callbacks) - listening:
+                    for channel in channels:
+                        await conn.add_listener(
+                            channel, self.on_notification
+                        )
+                    listening |= channels
+                self.conn = conn
+                if reconnect:
+                    # notifications sent while disconnected are lost
+                    for channel in self.callbacks:
+                        self.notify(channel)
+                reconnect = True
+                await closed.wait()
+                logging.warning('LISTEN connection lost, reconnecting')
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception('LISTEN failed')
+            finally:
+                self.conn = None
+                if not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def on_notification(self, conn, pid, channel, payload):
+        self.notify(channel, payload)
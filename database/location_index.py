@@ -0,0 +1,144 @@
+from collections import Counter
+from typing import NamedTuple
+
+
+TRANSLIT = (
+    ('shch', 'щ'), ('sch', 'щ'), ('yo', 'е'), ('jo', 'е'), ('zh', 'ж'),
+    ('kh', 'х'), ('ts', 'ц'), ('ch', 'ч'), ('sh', 'ш'), ('yu', 'ю'),
+    ('ju', 'ю'), ('ya', 'я'), ('ja', 'я'), ('ye', 'е'), ('iy', 'ий'),
+    ('yy', 'ый'), ('a', 'а'), ('b', 'б'), ('v', 'в'), ('w', 'в'),
+    ('g', 'г'), ('d', 'д'), ('e', 'е'), ('z', 'з'), ('i', 'и'), ('j', 'й'),
+    ('k', 'к'), ('l', 'л'), ('m', 'м'), ('n', 'н'), ('o', 'о'), ('p', 'п'),
+    ('r', 'р'), ('s', 'с'), ('t', 'т'), ('u', 'у'), ('f', 'ф'), ('h', 'х'),
+    ('c', 'к'), ('q', 'к'), ('x', 'кс'), ('y', 'ы'), ("'", 'ь'),
+)
+NGRAM_SIZE = 3
+LOCATIONS_LIMIT = 10
+# every trie node keeps only the best ranked ids of its subtree
+NODE_CAPACITY = LOCATIONS_LIMIT
+
+
+class LocationEntry(NamedTuple):
+    id: int
+    city: str
+    region: str
+
+
+def transliterate(text):
+    result = []
+    position = 0
+    while position < len(text):
+        for latin, cyrillic in TRANSLIT:
+            if text.startswith(latin, position):
+                result.append(cyrillic)
+                position += len(latin)
+                break
+        else:
+            result.append(text[position])
+            position += 1
+    return ''.join(result)
+
+
+def normalize_city(text):
+    text = text.lower().replace('ё', 'е').replace('-', ' ')
+    if any('a' <= char <= 'z' for char in text):
+        text = transliterate(text)
+    return ' '.join(text.split())
+
+
+def ngrams(text):
+    padded = f' {text} '
+    return {
+        padded[i:i + NGRAM_SIZE]
+        for i in range(len(padded) - NGRAM_SIZE + 1)
+    }
+
+
+class Trie:
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, key, location_id):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+            ids = node.setdefault(None, [])
+            if len(ids) < NODE_CAPACITY and location_id not in ids:
+                ids.append(location_id)
+
+    def search(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        return node.get(None, [])
+
+
+class LocationIndex:
+    def __init__(self):
+        self.locations = {}
+        self.order = {}
+        self.names = Trie()
+        self.words = Trie()
+        self.grams = {}
+
+    def __bool__(self):
+        return bool(self.locations)
+
+    def build(self, locations, weights=None):
+        self.__init__()
+        weights = weights or {}
+        # cities with more users first, so "Санкт-Петербург" beats
+        # "Санкт-Галлен", then the city the region is named after, then
+        # shorter names, so "Москва" beats "Московский" for "моск"
+        entries = sorted(
+            (LocationEntry(location.id, location.city, location.region)
+             for location in locations),
+            key=lambda entry: (
+                -weights.get(entry.id, 0),
+                not (entry.region or '').startswith(entry.city),
+                len(entry.city), entry.city, entry.id,
+            ),
+        )
+        for entry in entries:
+            self.locations[entry.id] = entry
+            self.order[entry.id] = len(self.order)
+            name = normalize_city(entry.city)
+            self.names.insert(name, entry.id)
+            for word in name.split()[1:]:
+                self.words.insert(word, entry.id)
+            for gram in ngrams(name):
+                self.grams.setdefault(gram, []).append(entry.id)
+
+    def search(self, user_input, limit=LOCATIONS_LIMIT):
+        query = normalize_city(user_input)
+        if not query:
+            return []
+        found = []
+        for location_id in (*self.names.search(query),
+                            *self.words.search(query)):
+            if location_id not in found:
+                found.append(location_id)
+        if len(found) < limit:
+            found.extend(self.search_ngrams(query, found, limit))
+        return [self.locations[location_id] for location_id in found[:limit]]
+
+    def search_ngrams(self, query, exclude, limit):
+        # fallback for substrings and typos, at least half of the query
+        # n-grams have to be present in the city name
+        query_grams = ngrams(query)
+        counter = Counter()
+        for gram in query_grams:
+            counter.update(self.grams.get(gram, ()))
+        threshold = max(1, len(query_grams) // 2)
+        matches = sorted(
+            (location_id for location_id, count in counter.items()
+             if count >= threshold and location_id not in exclude),
+            key=lambda location_id: (-counter[location_id],
+                                     self.order[location_id]),
+        )
+        return matches[:limit - len(exclude)]
+
+
+location_index = LocationIndex()
@@ -1,8 +1,8 @@
 from sqlalchemy import (
-    BigInteger, Boolean, Column, DateTime, ForeignKey,
-    Integer, String, Table, Text,
+    ARRAY, JSON, BigInteger, Boolean, Column, DateTime, ForeignKey,
+    Index, Integer, String, Table, Text,
 )
-from sqlalchemy import func
+from sqlalchemy import false, func, literal_column
 
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
@@ -10,6 +10,31 @@ from sqlalchemy.orm import relationship
 
 Base = declarative_base()
 
+SEARCH_CONFIG = literal_column("'russian'")
+
+
+def normalized_text(column):
+    # ё/е folding and lower case, inlined so that queries match the indexes
+    return func.translate(
+        func.lower(column), literal_column("'ё'"), literal_column("'е'")
+    )
+
+
+def search_indexes(name, column):
+    return (
+        Index(
+            f'ix_{name}_trgm',
+            normalized_text(column).label(f'{name}_trgm'),
+            postgresql_using='gin',
+            postgresql_ops={f'{name}_trgm': 'gin_trgm_ops'},
+        ),
+        Index(
+            f'ix_{name}_tsv',
+            func.to_tsvector(SEARCH_CONFIG, normalized_text(column)),
+            postgresql_using='gin',
+        ),
+    )
+
 
 class DictStatus(Base):
     __tablename__ = 'dict_statuses'
@@ -18,6 +43,12 @@ class DictStatus(Base):
     status = Column(String, unique=True)
 
 
+# ids of the dict_statuses rows loaded from csv_data/status.csv
+STATUS_FREE = 1
+STATUS_BOOKED = 2
+STATUS_READING = 3
+
+
 class DictAction(Base):
     __tablename__ = 'dict_actions'
 
@@ -38,14 +69,16 @@ book_author = Table(
     'book_author',
     Base.metadata,
     Column('book_id', Integer, ForeignKey('books_data.id'), primary_key=True),
-    Column('author_id', Integer, ForeignKey('authors.id'), primary_key=True)
+    Column('author_id', Integer, ForeignKey('authors.id'), primary_key=True),
+    Index('ix_book_author_author_id', 'author_id'),
 )
 
 book_genre = Table(
     'book_genre',
     Base.metadata,
     Column('book_id', Integer, ForeignKey('books_data.id'), primary_key=True),
-    Column('genre_id', Integer, ForeignKey('genres.id'), primary_key=True)
+    Column('genre_id', Integer, ForeignKey('genres.id'), primary_key=True),
+    Index('ix_book_genre_genre_id', 'genre_id'),
 )
 
 
@@ -86,6 +119,13 @@ class BookData(Base):
     age_limit = Column(String, nullable=True)
     year = Column(String, nullable=True)  # год издания конкретного экземпляра? тогда логичнее к таблице экземпляра
 
+    # created by migrations/versions/0003 and 0006
+    __table_args__ = (
+        *search_indexes('books_data_title', title),
+        # exact title lookups of the catalog import
+        Index('ix_books_data_title_key', normalized_text(title)),
+    )
+
     authors = relationship('Author', secondary=book_author)
     genres = relationship('Genre', secondary=book_genre)
 
@@ -99,6 +139,8 @@ class User(Base):
     username = Column(String(32), nullable=True)
     reading_amount = Column(Integer, nullable=True, default=0)
     location_id = Column(Integer, ForeignKey('locations.id'), nullable=True)
+    # the user blocked the bot, notifications to them are dropped
+    is_blocked = Column(Boolean, default=False, server_default=false())
 
     location = relationship('Location')
 
@@ -107,9 +149,11 @@ class Book(Base):
     __tablename__ = 'books'
 
     id = Column(Integer, primary_key=True)
-    book_id = Column(Integer, ForeignKey('books_data.id'))
+    book_id = Column(Integer, ForeignKey('books_data.id'), index=True)
     telegram_id = Column(BigInteger, ForeignKey('users.telegram_id'))
-    status_id = Column(Integer, ForeignKey('dict_statuses.id'), default=1)
+    status_id = Column(
+        Integer, ForeignKey('dict_statuses.id'), default=STATUS_FREE
+    )
     location_id = Column(Integer, ForeignKey('locations.id'))
     image = Column(String, nullable=True)
     condition = Column(String, nullable=True)
@@ -119,8 +163,25 @@ class Book(Base):
         BigInteger, nullable=True, default=None
     )
     is_transferred = Column(Boolean, default=False)
+    # the 7 day reminder of the current reading period was sent
+    reminder_sent = Column(Boolean, default=False, server_default=false())
     # year = Column(String, nullable=True)  # год издания конкретного экземпляра?
 
+    # created by migrations/versions/0002_hot_path_indexes.py
+    __table_args__ = (
+        Index('ix_books_owner', telegram_id, status_id),
+        Index('ix_books_location', location_id, status_id, telegram_id),
+        # the reading-expiry scan only looks at books that are being read
+        Index(
+            'ix_books_reading_expiry', remain_time,
+            postgresql_where=status_id == STATUS_READING,
+        ),
+        Index(
+            'ix_books_candidate', candidate_telegram_id,
+            postgresql_where=candidate_telegram_id.is_not(None),
+        ),
+    )
+
     location = relationship('Location')
     user = relationship('User')
     status = relationship('DictStatus')
@@ -128,6 +189,37 @@ class Book(Base):
     # location = relationship('Location')
 
 
+class BookSearch(Base):
+    # read model, one row per Book, kept in sync by the triggers from
+    # database/book_search.py, created by migrations/versions/0007
+    __tablename__ = 'book_search'
+
+    id = Column(
+        Integer, ForeignKey('books.id', ondelete='CASCADE'), primary_key=True
+    )
+    book_data_id = Column(Integer)
+    title = Column(String)
+    authors = Column(ARRAY(String))
+    genre_ids = Column(ARRAY(Integer))
+    status_id = Column(Integer)
+    location_id = Column(Integer)
+    telegram_id = Column(BigInteger)
+    remain_time = Column(DateTime)
+    candidate_telegram_id = Column(BigInteger)
+    is_transferred = Column(Boolean)
+    document = Column(Text)
+
+    __table_args__ = (
+        Index(
+            'ix_book_search_owner', telegram_id, status_id, title, id
+        ),
+        Index(
+            'ix_book_search_location', location_id, status_id, title, id
+        ),
+        *search_indexes('book_search_document', document),
+    )
+
+
 class Action(Base):
     __tablename__ = 'actions'
 
@@ -142,6 +234,33 @@ class Action(Base):
     action = relationship('DictAction')
 
 
+class Notification(Base):
+    # outbox of messages to other users, written in the transaction of the
+    # change they report and delivered by notifications/sender.py. The
+    # notifications_added trigger of migration 0008 wakes the sender
+    __tablename__ = 'notifications'
+
+    id = Column(Integer, primary_key=True)
+    telegram_id = Column(BigInteger, ForeignKey('users.telegram_id'))
+    text = Column(Text)
+    parse_mode = Column(String, nullable=True)
+    reply_markup = Column(JSON, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    # next delivery attempt, NULL when the message was given up
+    send_after = Column(DateTime, server_default=func.now())
+    attempts = Column(Integer, default=0, server_default='0')
+    last_error = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index(
+            'ix_notifications_pending', send_after, id,
+            postgresql_where=send_after.is_not(None),
+        ),
+    )
+
+    user = relationship('User')
+
+
 class UserMessage(Base):
     __tablename__ = 'user_messages'
 
@@ -0,0 +1,183 @@
+import json
+import logging
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config_data.config import DB_SLOW_QUERY_EXPLAIN, DB_SLOW_QUERY_MS
+
+
+# upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+UNTAGGED = 'untagged'
+
+query_tag = ContextVar('query_tag', default=UNTAGGED)
+slow_query_logger = logging.getLogger('database.slow_queries')
+
+
+class QueryStat:
+    __slots__ = ('count', 'total', 'max', 'rows', 'pool_wait', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.pool_wait = 0.0
+        # the last bucket counts everything above BUCKETS[-1]
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def percentile(self, fraction):
+        # upper bound of the bucket the percentile falls into
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip((*BUCKETS, self.max), self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count, 2) if self.count else 0,
+            'p50_ms': round(self.percentile(0.5), 2),
+            'p95_ms': round(self.percentile(0.95), 2),
+            'p99_ms': round(self.percentile(0.99), 2),
+            'max_ms': round(self.max, 2),
+            'rows': self.rows,
+            'pool_wait_ms': round(self.pool_wait, 2),
+            'histogram': dict(zip(
+                (*(f'<={bound}' for bound in BUCKETS), f'>{BUCKETS[-1]}'),
+                self.buckets,
+            )),
+        }
+
+
+class QueryStats:
+    # latency, rows and pool wait per db_requests function
+    def __init__(self):
+        self.stats = {}
+
+    def stat(self, tag):
+        stat = self.stats.get(tag)
+        if stat is None:
+            stat = self.stats[tag] = QueryStat()
+        return stat
+
+    def record_query(self, tag, elapsed, rows):
+        stat = self.stat(tag)
+        stat.count += 1
+        stat.total += elapsed
+        stat.max = max(stat.max, elapsed)
+        stat.rows += max(rows, 0)
+        stat.buckets[bisect_left(BUCKETS, elapsed)] += 1
+
+    def record_pool_wait(self, tag, elapsed):
+        self.stat(tag).pool_wait += elapsed
+
+    def clear(self):
+        self.stats.clear()
+
+    def report(self):
+        return {
+            tag: stat.as_dict() for tag, stat in sorted(self.stats.items())
+        }
+
+
+query_stats = QueryStats()
+
+
+def instrumented(function):
+    # statements issued inside the function are tagged with its name
+    @wraps(function)
+    async def wrapper(*args, **kwargs):
+        token = query_tag.set(function.__name__)
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            query_tag.reset(token)
+    return wrapper
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        # time spent waiting for a free connection or opening a new one
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            query_stats.record_pool_wait(
+                query_tag.get(), (perf_counter() - started) * 1000
+            )
+
+
+def explain(connection, statement, parameters):
+    # a separate DBAPI cursor keeps the results of the slow statement,
+    # the savepoint keeps the transaction usable if EXPLAIN fails
+    dbapi_connection = connection.connection.dbapi_connection
+    cursor = dbapi_connection.cursor()
+    in_transaction = not getattr(dbapi_connection, 'autocommit', False)
+    try:
+        if in_transaction:
+            cursor.execute('SAVEPOINT slow_query_explain')
+        cursor.execute(f'EXPLAIN {statement}', parameters)
+        plan = [row[0] for row in cursor.fetchall()]
+        if in_transaction:
+            cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        return plan
+    except Exception as error:
+        if in_transaction:
+            cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+        return [f'EXPLAIN failed: {error}']
+    finally:
+        cursor.close()
+
+
+def before_cursor_execute(connection, cursor, statement, parameters,
+                          context, executemany):
+    connection.info.setdefault('query_started', []).append(perf_counter())
+
+
+def after_cursor_execute(connection, cursor, statement, parameters,
+                         context, executemany):
+    started = connection.info['query_started'].pop()
+    elapsed = (perf_counter() - started) * 1000
+    rows = cursor.rowcount
+    if rows == -1:
+        rows = len(getattr(cursor, '_rows', None) or ())
+    tag = query_tag.get()
+    query_stats.record_query(tag, elapsed, rows)
+    if elapsed < DB_SLOW_QUERY_MS:
+        return
+    record = {
+        'function': tag,
+        'duration_ms': round(elapsed, 2),
+        'rows': rows,
+        'statement': ' '.join(statement.split()),
+        'parameters': parameters,
+    }
+    if DB_SLOW_QUERY_EXPLAIN and not executemany:
+        record['plan'] = explain(connection, statement, parameters)
+    slow_query_logger.warning(
+        json.dumps(record, ensure_ascii=False, default=str)
+    )
+
+
+def handle_error(context):
+    if context.connection is not None:
+        started = context.connection.info.get('query_started')
+        if started:
+            started.pop()
+
+
+def instrument(engine):
+    event.listen(engine.sync_engine, 'before_cursor_execute',
+                 before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute',
+                 after_cursor_execute)
+    event.listen(engine.sync_engine, 'handle_error', handle_error)
@@ -0,0 +1,52 @@
+from database.location_index import LocationEntry, location_index
+
+
+class ReferenceCache:
+    def __init__(self):
+        self.statuses = {}
+        self.actions = {}
+        self.genres = {}
+        self.locations = {}
+
+    def __bool__(self):
+        return bool(self.statuses)
+
+    def update(self, statuses, actions, genres, locations):
+        # new dicts are swapped in whole, readers never see a partial refresh
+        self.statuses = dict(statuses)
+        self.actions = dict(actions)
+        self.genres = dict(genres)
+        self.locations = {
+            location.id: LocationEntry(
+                location.id, location.city, location.region
+            )
+            for location in locations
+        }
+        # the number of users of a city ranks it in autocomplete
+        location_index.build(self.locations.values(), {
+            location.id: location.users
+            for location in locations
+        })
+
+    # an unknown id means the cache is not loaded or older than the data,
+    # see load_reference_data and REFERENCE_DATA_CHANNEL
+    def status(self, status_id):
+        if status_id not in self.statuses:
+            raise KeyError(f'status {status_id} is not in reference_cache')
+        return self.statuses[status_id]
+
+    def city(self, location_id):
+        if location_id not in self.locations:
+            raise KeyError(
+                f'location {location_id} is not in reference_cache'
+            )
+        return self.locations[location_id].city
+
+    def genre_names(self, genre_ids):
+        return [
+            self.genres[genre_id] for genre_id in genre_ids
+            if genre_id in self.genres
+        ]
+
+
+reference_cache = ReferenceCache()
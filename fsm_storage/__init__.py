@@ -0,0 +1,17 @@
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+from config_data.config import FSM_STATE_TTL, FSM_STORAGE, REDIS_URL
+
+
+def create_storage():
+    # memory keeps states in this process only, redis shares them between
+    # bot workers and keeps them over restarts
+    if FSM_STORAGE == 'memory':
+        return MemoryStorage()
+    if FSM_STORAGE == 'redis':
+        from redis.asyncio import Redis
+
+        from fsm_storage.redis_storage import RedisStorage
+
+        return RedisStorage(Redis.from_url(REDIS_URL), ttl=FSM_STATE_TTL)
+    raise ValueError(f'Unknown FSM_STORAGE: {FSM_STORAGE}')
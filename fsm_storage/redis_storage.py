@@ -0,0 +1,109 @@
+import json
+
+from aiogram.dispatcher.storage import BaseStorage
+
+
+STATE = 's'
+DATA = 'd'
+BUCKET = 'b'
+
+
+def dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+class RedisStorage(BaseStorage):
+    # state, data and bucket of a chat/user are fields of one hash, every
+    # call is one pipelined round trip that also renews the idle TTL.
+    # Read-modify-write (update_data) is not atomic, updates of one user
+    # are expected to be handled one after another.
+    def __init__(self, redis, prefix='fsm', ttl=None):
+        self.redis = redis
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def key(self, chat, user):
+        chat, user = self.check_address(chat=chat, user=user)
+        return f'{self.prefix}:{chat}:{user}'
+
+    async def close(self):
+        await self.redis.close()
+
+    async def wait_closed(self):
+        pass
+
+    async def read(self, chat, user, field):
+        # reading counts as activity too, the TTL is renewed in the same
+        # round trip
+        key = self.key(chat, user)
+        if not self.ttl:
+            return await self.redis.hget(key, field)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            value, _ = await pipe.hget(key, field).expire(key, self.ttl
+                                                          ).execute()
+        return value
+
+    async def write(self, chat, user, values=None, delete=()):
+        key = self.key(chat, user)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if values:
+                pipe.hset(key, mapping=values)
+            if delete:
+                pipe.hdel(key, *delete)
+            if self.ttl:
+                pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def write_value(self, chat, user, field, value):
+        if value:
+            await self.write(chat, user, {field: value})
+        else:
+            await self.write(chat, user, delete=(field,))
+
+    async def get_state(self, *, chat=None, user=None, default=None):
+        state = await self.read(chat, user, STATE)
+        if state is None:
+            return self.resolve_state(default)
+        return state.decode()
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        await self.write_value(
+            chat, user, STATE,
+            self.resolve_state(state) if state is not None else None,
+        )
+
+    async def get_data(self, *, chat=None, user=None, default=None):
+        data = await self.read(chat, user, DATA)
+        return json.loads(data) if data else dict(default or {})
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        await self.write_value(chat, user, DATA, dumps(data) if data else None)
+
+    async def update_data(self, *, chat=None, user=None, data=None,
+                          **kwargs):
+        current = await self.get_data(chat=chat, user=user)
+        current.update(data or {}, **kwargs)
+        await self.set_data(chat=chat, user=user, data=current)
+
+    async def reset_state(self, *, chat=None, user=None, with_data=True):
+        await self.write(
+            chat, user, delete=(STATE, DATA) if with_data else (STATE,)
+        )
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *, chat=None, user=None, default=None):
+        bucket = await self.read(chat, user, BUCKET)
+        return json.loads(bucket) if bucket else dict(default or {})
+
+    async def set_bucket(self, *, chat=None, user=None, bucket=None):
+        await self.write_value(
+            chat, user, BUCKET, dumps(bucket) if bucket else None
+        )
+
+    async def update_bucket(self, *, chat=None, user=None, bucket=None,
+                            **kwargs):
+        current = await self.get_bucket(chat=chat, user=user)
+        current.update(bucket or {}, **kwargs)
+        await self.set_bucket(chat=chat, user=user, bucket=current)
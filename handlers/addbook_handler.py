@@ -9,9 +9,8 @@ from aiogram.types import (
     Message
 )
 from magic_filter import F
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.database import async_sessionmaker
 from database.db_requests import (
     get_book_data,
     insert_existing_book_instance,
@@ -21,9 +20,10 @@ from database.db_requests import (
     select_bookdata_by_id,
     select_user
 )
-from database.models import Genre
+from database.reference_cache import reference_cache
 from handlers.findbook_handler import cmd_findbook
-from handlers.lexicon import comma, declensions, genres_keyboard
+from handlers.keyboards import genre_keyboard
+from handlers.lexicon import comma, declensions
 from handlers.mybooks_handler import cmd_mybooks
 from handlers.rules_handler import cmd_rules
 from handlers.start_handler import FSMLocation, cmd_start
@@ -40,38 +40,10 @@ class FSMAddBook(StatesGroup):
     genre = State()
 
 
-async def genre_keyboard_without_db(genres_list): # todo chose best way to get genre inline keyboard
-    buttons = []
-    keyboard = InlineKeyboardMarkup(row_width=3)
-    for index, genre in enumerate(genres_list):
-        buttons.append(InlineKeyboardButton(
-            genre, callback_data=f'{genre}_{index+1}'
-        )
-        )
-    keyboard.add(*buttons)
-    keyboard.add(InlineKeyboardButton('Подтвердить', callback_data='accept'))
-    return keyboard
-
-
-async def genre_keyboard():  # TODO возравщить только жанры
-    async with async_sessionmaker() as session:
-        genres = await session.execute(select(Genre))
-        genres = genres.scalars().all()
-    keyboard = InlineKeyboardMarkup(row_width=3)
-    buttons = []
-    for genre in genres:
-        buttons.append(InlineKeyboardButton(
-            genre.genre, callback_data=f'{genre.genre}_{genre.id}'
-        )
-        )
-    keyboard.add(*buttons)
-    keyboard.add(InlineKeyboardButton('Подтвердить', callback_data='accept'))
-    return keyboard
-
-
-async def cmd_addbook(msg: Message, state: FSMContext):
+async def cmd_addbook(msg: Message, state: FSMContext,
+                      session: AsyncSession):
     await state.reset_state()
-    user = await select_user(msg.from_user.id)
+    user = await select_user(session, msg.from_user.id)
 
     if user.location_id is None:
         await msg.answer(
@@ -89,9 +61,10 @@ async def cmd_addbook(msg: Message, state: FSMContext):
     await FSMAddBook.book.set()
 
 
-async def get_book(msg: Message, state: FSMContext):
+async def get_book(msg: Message, state: FSMContext,
+                   session: AsyncSession):
     book_title = msg.text.replace('"', '').replace("'", '')
-    books = await select_books_by_title(book_title)
+    books = await select_books_by_title(session, book_title)
 
     if not books:
         async with state.proxy() as data:
@@ -106,9 +79,11 @@ async def get_book(msg: Message, state: FSMContext):
 
     keyboard = InlineKeyboardMarkup()
     for book in books:
-        author = (', '.join(a.title() for a in set(book.authors)
+        author = (', '.join(a.title() for a in set(book.authors or ())
                             if a is not None))
-        genre = ', '.join(g for g in set(book.genres) if g is not None)
+        genre = ', '.join(
+            reference_cache.genre_names(set(book.genre_ids or ()))
+        )
         button = InlineKeyboardButton(
             f'"{book.title[:15]}",',
             # f' {author}, {genre}',
@@ -126,10 +101,13 @@ async def get_book(msg: Message, state: FSMContext):
     await FSMAddBook.book.set()
 
 
-async def save_existing_book(callback: CallbackQuery, state: FSMContext):
+async def save_existing_book(callback: CallbackQuery, state: FSMContext,
+                             session: AsyncSession):
     book_id = int(callback.data.split('_')[1])
-    book = await select_bookdata_by_id(book_id)
-    await insert_existing_book_instance(book_id, callback.from_user.id)
+    book = await select_bookdata_by_id(session, book_id)
+    await insert_existing_book_instance(
+        session, book_id, callback.from_user.id
+    )
     await callback.message.delete()
     title, author, genre = await get_book_data(book)
 
@@ -164,7 +142,7 @@ async def get_author(msg: Message, state: FSMContext):
         if comma not in msg.text:
             data['authors'] = msg.text
         data['authors'] = msg.text.strip().split(',')
-    keyboard = await genre_keyboard_without_db(genres_keyboard)
+    keyboard = genre_keyboard()
     await msg.answer(
         'Выберите жанр произведения и нажмите "Подтвердить":',
         reply_markup=keyboard
@@ -174,48 +152,35 @@ async def get_author(msg: Message, state: FSMContext):
 
 async def get_genres(callback: CallbackQuery, state: FSMContext):
     # TODO принимать только ввод и инлайн клавы, сделать доп хэндлер для обработки исключений
-    data = await state.get_data()
     if callback.data != 'accept':
         genre, genre_id = callback.data.split('_')
-        genres = data.get('genres')
-        keyboard = callback.message.reply_markup
-
+        genre_id = int(genre_id)
         async with state.proxy() as data_update:
-            if genres is None or genre not in genres:
-                data_update.setdefault('genres_id', []).append(int(genre_id))
-                data_update.setdefault('genres', []).append(genre)
-                chosen = False
-                for row in keyboard.inline_keyboard:
-                    for button in row:
-                        if button.text == genre:
-                            button.text = f'✅{genre}'
-                            chosen = True
-                    if chosen:
-                        break
+            genres = data_update.setdefault('genres', [])
+            genres_id = data_update.setdefault('genres_id', [])
+            if genre_id not in genres_id:
+                genres_id.append(genre_id)
+                genres.append(genre)
             else:
-                data_update['genres'].remove(genre)
-                data_update['genres_id'].remove(int(genre_id))
-                chosen = False
-                for row in keyboard.inline_keyboard:
-                    for button in row:
-                        if button.text == f'✅{genre}':
-                            button.text = f'{genre}'
-                            chosen = True
-                        if chosen:
-                            break
-        await callback.message.edit_reply_markup(reply_markup=keyboard)
+                genres.remove(genre)
+                genres_id.remove(genre_id)
+        # the chosen genres are marked on the cached genre keyboard
+        await callback.message.edit_reply_markup(
+            reply_markup=genre_keyboard(genres_id)
+        )
         await FSMAddBook.genre_id.set()
 
 
-async def author_exists(author_list):
+async def author_exists(session, author_list):
     for author in author_list:
-        if select_author_by_keyword(author) is not None:
+        if select_author_by_keyword(session, author) is not None:
             return author.id, author.author
 
 
-async def save_new_book(callback: CallbackQuery, state: FSMContext):
+async def save_new_book(callback: CallbackQuery, state: FSMContext,
+                        session: AsyncSession):
     data = await state.get_data()
-    await insert_new_book_instance(callback.from_user.id, data)
+    await insert_new_book_instance(session, callback.from_user.id, data)
     title, author, genre = await get_book_data(data)
     if not genre:
         genre = 'Другое'
@@ -12,14 +12,19 @@ from aiogram.types import (
     InlineKeyboardMarkup,
     Message
 )
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.db_requests import (
+    add_notification,
     get_book_data,
     select_book,
     select_books_by_keyword,
     select_user,
-    update_book, select_books_by_home_location,
+    update_book_booking, select_books_by_home_location,
 )
+from database.models import STATUS_BOOKED, STATUS_FREE, STATUS_READING
+from database.reference_cache import reference_cache
+from handlers.keyboards import books_keyboard, markups, parse_page_callback
 from handlers.lexicon import declensions
 
 
@@ -39,18 +44,9 @@ class FSMFindBook(StatesGroup):
 
 async def cmd_findbook(msg: Message, state: FSMContext):
     await state.reset_state()
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton(
-        'Поиск по ключевым словам', callback_data='search-keyword'
-    )
-    )
-    keyboard.add(InlineKeyboardButton(
-        'Все книги в твоём городе', callback_data='search-location'
-    )
-    )
     await msg.answer(
         'Сейчас доступно два вида поиска:',
-        reply_markup=keyboard
+        reply_markup=markups.get('findbook')
     )
 
 
@@ -65,30 +61,28 @@ async def search_by_keyword(callback: CallbackQuery):
     return await FSMFindBook.by_location.set()
 
 
-async def result_by_keyword(msg: Message | CallbackQuery, state: FSMContext):
+async def result_by_keyword(msg: Message | CallbackQuery, state: FSMContext,
+                            session: AsyncSession):
     if not isinstance(msg, CallbackQuery):
-        await state.update_data(by_keyword=msg.text)
+        await state.update_data(by_keyword=msg.text, by_keyword_page=None)
     data = await state.get_data()
     by_keyword = data.get('by_keyword')
-    books = await select_books_by_keyword(msg.from_user.id, by_keyword)
+    after, before = data.get('by_keyword_page') or (None, None)
+    # a typed query searches again, "back" takes the cached result
+    page = await select_books_by_keyword(
+        session, msg.from_user.id, by_keyword, after, before,
+        refresh=isinstance(msg, Message),
+    )
 
     # if books is None:
-    if len(books) == 0:
+    if len(page.books) == 0:
         await msg.answer(
             'По твоему запросу ничего не найдено, попробуй ввести его '
             'по-другому. Или поищи другую книгу для чтения.'
             )
         return
 
-    keyboard = InlineKeyboardMarkup()
-    for book in books:
-        title, author, genre = await get_book_data(book)
-        keyboard.add(
-            InlineKeyboardButton(
-                f'"{title}", {author}, {book.status}',
-                callback_data=f'search_{book.id}'
-            )
-        )
+    keyboard = await books_keyboard(page, 'search', 'keyword-page')
     text = 'Вот что могу предложить из книг для обмена:'
     await FSMFindBook.by_keyword_detail.set()
     return (await msg.answer(text, reply_markup=keyboard)
@@ -99,14 +93,29 @@ async def result_by_keyword(msg: Message | CallbackQuery, state: FSMContext):
             )
 
 
-async def detail_by_keyword(callback: CallbackQuery, state: FSMContext):
+async def page_by_keyword(callback: CallbackQuery, state: FSMContext,
+                          session: AsyncSession):
+    after, before = parse_page_callback(callback.data)
+    await state.update_data(by_keyword_page=[after, before])
+    data = await state.get_data()
+    page = await select_books_by_keyword(
+        session, callback.from_user.id, data.get('by_keyword'), after, before
+    )
+    if not page.books:
+        return await callback.answer('Больше книг не найдено.')
+    keyboard = await books_keyboard(page, 'search', 'keyword-page')
+    await callback.message.edit_reply_markup(reply_markup=keyboard)
+
+
+async def detail_by_keyword(callback: CallbackQuery, state: FSMContext,
+                            session: AsyncSession):
     book_id = int(callback.data.split('_')[1])
     async with state.proxy() as data:
         data['by_keyword_detail'] = callback.data
     data = await state.get_data()
     by_keyword = data.get('by_keyword')
 
-    book = await select_book(book_id)
+    book = await select_book(session, book_id)
     title, author, genre = await get_book_data(book)
     detail_keyboard = InlineKeyboardMarkup()
     detail_keyboard.add(
@@ -122,19 +131,20 @@ async def detail_by_keyword(callback: CallbackQuery, state: FSMContext):
         f'Книга: {title}\n'
         f'{declensions[0][len(author) > 1]}: {author}\n'
         f'{declensions[1][len(genre) > 1]}: {genre}\n'
-        f'Статус: {book.status}\n'
-        f'Город: {book.city}',
+        f'Статус: {reference_cache.status(book.status_id)}\n'
+        f'Город: {reference_cache.city(book.location_id)}',
         reply_markup=detail_keyboard,
     )
     await FSMFindBook.by_keyword_return.set()
 
 
-async def want_take(callback: CallbackQuery, state: FSMContext):
+async def want_take(callback: CallbackQuery, state: FSMContext,
+                    session: AsyncSession):
     data = await state.get_data()
     by_keyword = data.get('by_keyword')
     book_id = int(callback.data.split('_')[1])
 
-    book = await select_book(book_id)
+    book = await select_book(session, book_id)
     keyboard = InlineKeyboardMarkup()
     keyboard.add(
         InlineKeyboardButton(
@@ -142,7 +152,7 @@ async def want_take(callback: CallbackQuery, state: FSMContext):
         )
     )
 
-    if book.status_id == 3:
+    if book.status_id == STATUS_READING:
 
         remain_text = '\n'  # todo move this block to lexicon file or dif function? defenitely yes
         if book.remain_time:
@@ -163,7 +173,7 @@ async def want_take(callback: CallbackQuery, state: FSMContext):
         )
         return
 
-    elif book.status_id == 2:
+    elif book.status_id == STATUS_BOOKED:
         await callback.message.delete()
         await callback.message.answer(
             f'Сейчас книгу забронировал другой пользователь. '
@@ -184,7 +194,6 @@ async def want_take(callback: CallbackQuery, state: FSMContext):
         'тобой, чтобы вы договорились о передаче книги.'
     )
 
-    book = await select_book(book_id)
     keyboard = InlineKeyboardMarkup()
     keyboard.add(
         InlineKeyboardButton(
@@ -194,14 +203,15 @@ async def want_take(callback: CallbackQuery, state: FSMContext):
     )
 
     title, author, genre = await get_book_data(book)
-    await callback.bot.send_message(
-        chat_id=book.telegram_id,
+    add_notification(
+        session,
+        book.telegram_id,
         text='Привет!\n'
              f'{url} хочет взять у тебя книгу:\n'
              f'Книга: "{title}"\n'
              f'Автор(ы): {author}\n'
-             f'Статус: {book.status}\n'
-             f'Город: {book.city}\n'
+             f'Статус: {reference_cache.status(book.status_id)}\n'
+             f'Город: {reference_cache.city(book.location_id)}\n'
              'Ты можешь написать ему, чтобы обсудить детали '
              'передачи книги. Не забудь потом сообщить мне, '
              'что ты отдал эту книгу.',
@@ -211,32 +221,39 @@ async def want_take(callback: CallbackQuery, state: FSMContext):
     await state.finish()
 
 
-async def change_status_booked(callback: CallbackQuery):
+async def change_status_booked(callback: CallbackQuery,
+                               session: AsyncSession):
     callback_data = callback.data.split('_')
     book_id = int(callback_data[1])
-    book = await select_book(book_id)
-    title, author, genre = await get_book_data(book)
-    if book.status == 'Забронирована':
+    user_id = int(callback_data[2])
+    book = await update_book_booking(session, book_id, user_id)
+    if book is None:
+        book = await select_book(session, book_id)
+        title, author, genre = await get_book_data(book)
         await callback.message.answer(
             f'Книга: {title}\n'
             f'{declensions[0][len(author) > 1]}: {author}\n'
             f'{declensions[1][len(genre) > 1]}: {genre}\n'
             f'забронирована за другим пользователем. '
+            if book.status_id == STATUS_BOOKED
+            else f'Книга: {title}\n'
+                 f'{declensions[0][len(author) > 1]}: {author}\n'
+                 f'{declensions[1][len(genre) > 1]}: {genre}\n'
+                 f'сейчас недоступна для бронирования. '
         )
         return
 
-    user_id = int(callback_data[2])
-    user = await select_user(user_id)
+    title, author, genre = await get_book_data(book)
+    user = await select_user(session, user_id)
     url = (
         f'@{user.username}' if user.username is not None
         else f'<a href="tg://user?id={user_id}">пользователем</a>'
     )
-    await update_book(book_id, 2, user_id)
-    book = await select_book(book_id)
     keyboard = InlineKeyboardMarkup()
     keyboard.add(
         InlineKeyboardButton(
-            'Отменить бронь', callback_data=f'status-free_{book_id}_1'
+            'Отменить бронь',
+            callback_data=f'status-free_{book_id}_{STATUS_FREE}',
         ),
         InlineKeyboardButton(
             'Передать книгу', callback_data=f'transfer-book_{book_id}'
@@ -249,24 +266,28 @@ async def change_status_booked(callback: CallbackQuery):
         f'Книга: {title}\n'
         f'{declensions[0][len(author) > 1]}: {author}\n'
         f'{declensions[1][len(genre) > 1]}: {genre}\n'
-        f'изменен на: "{book.status}".\n\n'
+        f'изменен на: "{reference_cache.status(book.status_id)}".\n\n'
         f'Не забудь связаться с {url} и договориться о передаче книги!',
         parse_mode='HTML',
         reply_markup=keyboard,
     )
 
 
-async def return_keyword_results(callback: CallbackQuery, state: FSMContext):
+async def return_keyword_results(callback: CallbackQuery, state: FSMContext,
+                                 session: AsyncSession):
     async with state.proxy() as data:
         data['by_keyword_return'] = data.get('by_keyword')
-    await result_by_keyword(callback, state)
+    await result_by_keyword(callback, state, session)
 
 
-async def search_by_home_location(callback: CallbackQuery, state: FSMContext):
+async def search_by_home_location(callback: CallbackQuery, state: FSMContext,
+                                  session: AsyncSession):
     await FSMFindBook.by_location.set()
-    books, location_id = await select_books_by_home_location(callback.from_user.id)
+    page, location_id = await select_books_by_home_location(
+        session, callback.from_user.id
+    )
 
-    if len(books) == 0:
+    if len(page.books) == 0:
         await callback.message.delete()
         await callback.message.answer(
             'К сожалению, в твоем городе ничего не найдено.\n'
@@ -274,20 +295,24 @@ async def search_by_home_location(callback: CallbackQuery, state: FSMContext):
             )
         return
 
-    keyboard = InlineKeyboardMarkup()
-    for book in books:
-        title, author, genre = await get_book_data(book)
-        keyboard.add(
-            InlineKeyboardButton(
-                f'"{title}", {author}, {book.status}',
-                callback_data=f'location_{book.id}'
-            )
-        )
+    keyboard = await books_keyboard(page, 'location', 'location-page')
     text = 'Вот что могу предложить из книг в твоём городе:'
     await callback.message.delete()
     await callback.message.answer(text, reply_markup=keyboard)
 
 
+async def page_by_home_location(callback: CallbackQuery,
+                                session: AsyncSession):
+    after, before = parse_page_callback(callback.data)
+    page, location_id = await select_books_by_home_location(
+        session, callback.from_user.id, after, before
+    )
+    if not page.books:
+        return await callback.answer('Больше книг не найдено.')
+    keyboard = await books_keyboard(page, 'location', 'location-page')
+    await callback.message.edit_reply_markup(reply_markup=keyboard)
+
+
 async def detail_by_location():
     ...
 
@@ -315,6 +340,16 @@ def register_findbook(dispatcher: Dispatcher):
         result_by_keyword,
         state=FSMFindBook.by_keyword,
     )
+    dispatcher.register_callback_query_handler(
+        page_by_keyword,
+        Text(startswith='keyword-page_'),
+        state=FSMFindBook.by_keyword_detail
+    )
+    dispatcher.register_callback_query_handler(
+        page_by_home_location,
+        Text(startswith='location-page_'),
+        state=FSMFindBook.by_location
+    )
     dispatcher.register_callback_query_handler(
         detail_by_keyword,
         Text(startswith='search_'),
@@ -0,0 +1,158 @@
+import json
+from functools import lru_cache
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from database.db_requests import BooksPage, get_book_data
+from database.reference_cache import reference_cache
+
+
+# distinct location search results whose keyboards are kept
+LOCATION_KEYBOARDS_LIMIT = 256
+
+
+def dump_markup(markup):
+    return json.dumps(markup, ensure_ascii=False, separators=(',', ':'))
+
+
+class MarkupTemplate:
+    # a keyboard built once: its rows as Bot API dicts, the serialized JSON
+    # and the position of every button by callback data
+    def __init__(self, keyboard):
+        self.rows = keyboard.to_python()['inline_keyboard']
+        self.json = dump_markup({'inline_keyboard': self.rows})
+        self.positions = {
+            button['callback_data']: (row_number, column)
+            for row_number, row in enumerate(self.rows)
+            for column, button in enumerate(row)
+            if 'callback_data' in button
+        }
+
+    def patch(self, buttons):
+        # callback data -> changed fields, only the touched rows are copied
+        if not buttons:
+            return self.json
+        rows = list(self.rows)
+        for callback_data, fields in buttons.items():
+            row_number, column = self.positions[callback_data]
+            if rows[row_number] is self.rows[row_number]:
+                rows[row_number] = list(rows[row_number])
+            rows[row_number][column] = {
+                **rows[row_number][column], **fields
+            }
+        return dump_markup({'inline_keyboard': rows})
+
+
+class MarkupRegistry:
+    # static keyboards are built on first use and sent as JSON strings,
+    # aiogram passes a str reply_markup to the Bot API as it is
+    def __init__(self):
+        self.builders = {}
+        self.templates = {}
+
+    def register(self, name, source=None):
+        # source returns the data the keyboard is built from, the template
+        # is rebuilt once it returns another object
+        def decorator(builder):
+            self.builders[name] = (builder, source or (lambda: None))
+            return builder
+        return decorator
+
+    def template(self, name):
+        builder, source = self.builders[name]
+        data = source()
+        cached = self.templates.get(name)
+        if cached is None or cached[0] is not data:
+            cached = self.templates[name] = (data, MarkupTemplate(builder()))
+        return cached[1]
+
+    def get(self, name):
+        return self.template(name).json
+
+    def patch(self, name, buttons):
+        return self.template(name).patch(buttons)
+
+
+markups = MarkupRegistry()
+
+
+@markups.register('findbook')
+def findbook_keyboard():
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton(
+        'Поиск по ключевым словам', callback_data='search-keyword'
+    ))
+    keyboard.add(InlineKeyboardButton(
+        'Все книги в твоём городе', callback_data='search-location'
+    ))
+    return keyboard
+
+
+# reference_cache swaps in a new genres dict on every refresh
+@markups.register('genres', source=lambda: reference_cache.genres)
+def genres_keyboard():
+    keyboard = InlineKeyboardMarkup(row_width=3)
+    keyboard.add(*(
+        InlineKeyboardButton(genre, callback_data=f'{genre}_{genre_id}')
+        for genre_id, genre in reference_cache.genres.items()
+    ))
+    keyboard.add(InlineKeyboardButton('Подтвердить', callback_data='accept'))
+    return keyboard
+
+
+def genre_keyboard(chosen=()):
+    # chosen genre ids are marked with ✅ on the cached template, a genre
+    # removed by a refresh is skipped
+    genres = reference_cache.genres
+    return markups.patch('genres', {
+        f'{genres[genre_id]}_{genre_id}': {'text': f'✅{genres[genre_id]}'}
+        for genre_id in chosen if genre_id in genres
+    })
+
+
+@lru_cache(maxsize=LOCATION_KEYBOARDS_LIMIT)
+def location_keyboard(locations):
+    # a tuple of location index entries, popular cities are serialized once
+    keyboard = InlineKeyboardMarkup()
+    for location in locations:
+        keyboard.add(InlineKeyboardButton(
+            f'{location.city}, {location.region}',
+            callback_data=f'location_{location.id}',
+        ))
+    return dump_markup(keyboard.to_python())
+
+
+def add_pagination_buttons(keyboard: InlineKeyboardMarkup, page: BooksPage,
+                           prefix: str):
+    buttons = []
+    if page.prev_cursor is not None:
+        buttons.append(InlineKeyboardButton(
+            '⬅️ Назад', callback_data=f'{prefix}_before_{page.prev_cursor}'
+        ))
+    if page.next_cursor is not None:
+        buttons.append(InlineKeyboardButton(
+            'Далее ➡️', callback_data=f'{prefix}_after_{page.next_cursor}'
+        ))
+    if buttons:
+        keyboard.row(*buttons)
+    return keyboard
+
+
+def parse_page_callback(callback_data: str):
+    _, direction, cursor = callback_data.split('_')
+    cursor = int(cursor)
+    return (cursor, None) if direction == 'after' else (None, cursor)
+
+
+async def books_keyboard(page: BooksPage, book_prefix: str, page_prefix: str):
+    keyboard = InlineKeyboardMarkup()
+    for book in page.books:
+        title, author, genre = await get_book_data(book)
+        status = reference_cache.status(book.status_id)
+        keyboard.add(
+            InlineKeyboardButton(
+                f'"{title}", {author}, {status}',
+                callback_data=f'{book_prefix}_{book.id}'
+            )
+        )
+    return add_pagination_buttons(keyboard, page, page_prefix)
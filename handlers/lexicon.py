@@ -1,5 +1,2 @@
 comma = ','
 declensions = [['Автор', 'Авторы'], ['Жанр', 'Жанры']]
-genres_keyboard = ('Проза', 'Фантастика', 'Фэнтези', 'Детектив', 'Триллер',
-          'Драма', 'Ужасы', 'Комиксы/манга', 'Приключения', 'Поэзия',
-          'Научпоп', 'Хобби', 'Образование', 'Для детей', 'Другое')
\ No newline at end of file
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
+import logging
 from datetime import datetime
 
-from aiogram import Bot
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text
 from aiogram.types import (
@@ -10,53 +10,53 @@ from aiogram.types import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     Message,
-    Update
+    Update,
+    User,
 )
 from aiogram.utils.exceptions import BotBlocked
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.database import async_sessionmaker
 from database.db_requests import (
+    SWEEP_BATCH_SIZE,
+    add_notification,
     get_book_data,
     select_book,
     select_user,
     select_users_books,
-    update_book,
+    update_book_own_status,
     update_book_transfer,
     update_book_transfer_by_candidate,
     update_remain_time,
     update_book_canceling_transfer,
+    update_expired_readings,
+    update_reading_reminders,
+    update_user_blocked,
 )
-from database.models import Book, BookData
+from database.models import STATUS_BOOKED, STATUS_FREE, STATUS_READING
+from database.reference_cache import reference_cache
+from handlers.keyboards import books_keyboard, parse_page_callback
 from handlers.lexicon import declensions
 
 
 # todo return_to_booklist repeats in every handler
 
-async def cmd_mybooks(msg: Message | CallbackQuery, state: FSMContext):
+async def cmd_mybooks(msg: Message | CallbackQuery, state: FSMContext,
+                      session: AsyncSession):
     await state.reset_state()
     await state.finish()
     user_id = (int(msg.data.split('_')[1]) if isinstance(msg, CallbackQuery)
                else msg.from_user.id)
-    books = await select_users_books(user_id)
+    page = await select_users_books(session, user_id)
 
-    if not books:
+    if not page.books:
         return await msg.answer(
             'Сейчас у тебя нет книг.\n\nДобавь свою книгу для обмена '
             'с помощью команды /addbook или поищи книгу для чтения '
             'командой /findbook.'
         )
 
-    keyboard = InlineKeyboardMarkup()
-    for book in books:
-        title, author, genre = await get_book_data(book)
-        keyboard.add(
-            InlineKeyboardButton(
-                f'"{title}", {author}, {book.status}',
-                callback_data=f'detailed-book_{book.id}',
-            )
-        )
-
+    keyboard = await books_keyboard(page, 'detailed-book', 'mybooks-page')
     text = ('Выбери нужную книгу, чтобы узнать подробную информацию '
             'или изменить её статус.')
     return (await msg.answer(text, reply_markup=keyboard)
@@ -65,9 +65,20 @@ async def cmd_mybooks(msg: Message | CallbackQuery, state: FSMContext):
             )
 
 
-async def info_book(callback: CallbackQuery):
+async def page_my_books(callback: CallbackQuery, session: AsyncSession):
+    after, before = parse_page_callback(callback.data)
+    page = await select_users_books(
+        session, callback.from_user.id, after, before
+    )
+    if not page.books:
+        return await callback.answer('Больше книг не найдено.')
+    keyboard = await books_keyboard(page, 'detailed-book', 'mybooks-page')
+    await callback.message.edit_reply_markup(reply_markup=keyboard)
+
+
+async def info_book(callback: CallbackQuery, session: AsyncSession):
     book_id = int(callback.data.split('_')[1])
-    book = await select_book(book_id)
+    book = await select_book(session, book_id)
 
     keyboard = InlineKeyboardMarkup(row_width=1)
     return_book_list = InlineKeyboardButton(
@@ -76,26 +87,27 @@ async def info_book(callback: CallbackQuery):
     )
 
     # if book.status == 'Свободна':
-    if book.status_id == 1:
+    if book.status_id == STATUS_FREE:
         keyboard.add(
             InlineKeyboardButton(
                 'Начать читать (90 дней)',
-                callback_data=f'status-own-read_{book_id}_3',
+                callback_data=f'status-own-read_{book_id}_{STATUS_READING}',
             ),
             return_book_list
         )
 
     # elif book.status == 'Забронирована':
-    elif book.status_id == 2:
+    elif book.status_id == STATUS_BOOKED:
         cancel_booking = InlineKeyboardButton(
-            'Отменить бронь', callback_data=f'status-free_{book_id}_1'
+            'Отменить бронь',
+            callback_data=f'status-free_{book_id}_{STATUS_FREE}',
         )
         transfer_book = InlineKeyboardButton(
             'Передать книгу', callback_data=f'transfer-book_{book_id}'
         )
         cancel_transferring = InlineKeyboardButton(
             'Отменить передачу книги',
-            callback_data=f'status-free_{book_id}_1',
+            callback_data=f'status-free_{book_id}_{STATUS_FREE}',
         )
 
         if not book.is_transferred:
@@ -103,11 +115,11 @@ async def info_book(callback: CallbackQuery):
         else:
             keyboard.add(cancel_transferring, return_book_list)
     # elif book.status == 'Читается':
-    elif book.status_id == 3:
+    elif book.status_id == STATUS_READING:
         keyboard.add(
             InlineKeyboardButton(
                 'Закончить чтение',
-                callback_data=f'status-own-free_{book_id}_1'
+                callback_data=f'status-own-free_{book_id}_{STATUS_FREE}'
             ),
             return_book_list
         )
@@ -123,15 +135,16 @@ async def info_book(callback: CallbackQuery):
             remain_text = f'(осталось {remain_time} дней)\n'
 
     title, author, genre = await get_book_data(book)
+    status = reference_cache.status(book.status_id)
 
     text = (f'Книга: {title}\n'
             f'{declensions[0][len(author) > 1]}: {author}\n'
             f'{declensions[1][len(genre) > 1]}: {genre}\n'
-            f'Статус: {book.status.lower()} ' + remain_text +
-            f'Город: {book.city}'
+            f'Статус: {status.lower()} ' + remain_text +
+            f'Город: {reference_cache.city(book.location_id)}'
             )
     if book.candidate_telegram_id:
-        candidate = await select_user(book.candidate_telegram_id)
+        candidate = await select_user(session, book.candidate_telegram_id)
         url = (f'@{candidate.username}' if candidate.username is not None
                else f'<a href="tg://user?id={candidate.telegram_id}">'
                     f'Пользователь</a>'
@@ -145,21 +158,25 @@ async def info_book(callback: CallbackQuery):
     )
 
 
-async def return_my_books(callback: CallbackQuery, state: FSMContext):
+async def return_my_books(callback: CallbackQuery, state: FSMContext,
+                          session: AsyncSession):
     await callback.message.delete()
-    await cmd_mybooks(callback, state)
+    await cmd_mybooks(callback, state, session)
 
 
-async def change_own_status(callback: CallbackQuery):
+async def change_own_status(callback: CallbackQuery, session: AsyncSession):
     book_id = int(callback.data.split('_')[1])
     book_status = int(callback.data.split('_')[2])
-    book = await select_book(book_id)
+    book = await update_book_own_status(session, book_id, book_status)
+    if book is None:
+        return await callback.answer(
+            'Статус книги уже изменился.', show_alert=True
+        )
     title, author, genre = await get_book_data(book)
     book_data_text = f'"{title}", {author}'
-    await update_book(book_id, book_status)
     await callback.message.delete()
     text = (f'Статус книги {book_data_text} изменён на: "Свободна".'
-            if book_status == 1
+            if book_status == STATUS_FREE
             else (f'Статус книги {book_data_text} изменён на: "Читается".\n'
                   f'На чтение книги отводится до 90 дней, но в случае '
                   f'необходимости ты сможешь продлить чтение.')
@@ -167,13 +184,16 @@ async def change_own_status(callback: CallbackQuery):
     await callback.message.answer(text)
 
 
-async def change_status(callback: CallbackQuery):
+async def change_status(callback: CallbackQuery, session: AsyncSession):
     book_id = int(callback.data.split('_')[1])
     book_status = int(callback.data.split('_')[2])
-    book = await select_book(book_id)
+    book = await update_book_canceling_transfer(session, book_id)
+    if book is None:
+        return await callback.answer(
+            'Статус книги уже изменился.', show_alert=True
+        )
     title, author, genre = await get_book_data(book)
-    candidate_id = book.candidate_telegram_id
-    await update_book_canceling_transfer(book_id)
+    candidate_id = book.previous_candidate_id
 
     book_data_text = f'"{title}", {author}'
     initiator = callback.from_user.id
@@ -193,28 +213,37 @@ async def change_status(callback: CallbackQuery):
                  f'Владелец книги</a>'
         )
 
-    await callback.bot.send_message(
-        chat_id=candidate_id if initiator == owner else owner,
+    add_notification(
+        session,
+        candidate_id if initiator == owner else owner,
         text=f'{user_url} отменил передачу книги {book_data_text}.',
         parse_mode='HTML'
     )
 
     await callback.message.delete()
     text = (f'Статус книги {book_data_text} изменён на: "Свободна".'
-            if any([book_status == 1, book_status == 2])
+            if book_status in (STATUS_FREE, STATUS_BOOKED)
             else (f'Статус книги {book_data_text} изменён на: "Читается".\n'
                   f'На чтение книги отводится до 90 дней, но в случае '
                   f'необходимости ты сможешь продлить чтение.')
             )
-    await (
-        callback.message.answer(text) if initiator == owner
-        else callback.bot.send_message(chat_id=owner, text=text)
-    )
+    if initiator == owner:
+        await callback.message.answer(text)
+    else:
+        add_notification(session, owner, text)
 
 
-async def increase_reading_time(callback: CallbackQuery):
+async def increase_reading_time(callback: CallbackQuery,
+                                session: AsyncSession):
     book_id = int(callback.data.split('_')[1])
-    await update_remain_time(book_id)
+    book = await update_remain_time(
+        session, book_id, callback.from_user.id
+    )
+    if book is None:
+        return await callback.answer(
+            'Продлить можно только книгу в статусе "Читается".',
+            show_alert=True
+        )
     keyboard = InlineKeyboardMarkup(row_width=1)
     keyboard.add(
         InlineKeyboardButton(
@@ -229,16 +258,17 @@ async def increase_reading_time(callback: CallbackQuery):
     )
 
 
-async def transfer_book(callback: CallbackQuery):
+async def transfer_book(callback: CallbackQuery, session: AsyncSession):
     book_id = int(callback.data.split('_')[1])
-    book = await select_book(book_id)
-    await update_book_transfer(book_id)
-    candidate = await select_user(book.candidate_telegram_id)
+    book = await update_book_transfer(session, book_id)
+    candidate = (await select_user(session, book.candidate_telegram_id)
+                 if book is not None else None)
     if not candidate:
         await callback.message.delete()
         await callback.message.answer(
             f'Невозможно передать книгу.\n'
         )
+        return
 
     url = (f'@{candidate.username}' if candidate.username is not None
            else f'<a href="tg://user?id={candidate.telegram_id}">'
@@ -271,8 +301,9 @@ async def transfer_book(callback: CallbackQuery):
         else f'<a href="tg://user?id={callback.from_user.id}">'
              f'пользователь</a>'
     )
-    await callback.bot.send_message(
-        chat_id=candidate.telegram_id,
+    add_notification(
+        session,
+        candidate.telegram_id,
         text=f'Привет!\n{url_owner} хочет передать тебе книгу '
              f'{book_data_text}.\n\n'
              f'Пожалуйста, когда получишь её, не забудь сообщить мне об этом!',
@@ -281,15 +312,20 @@ async def transfer_book(callback: CallbackQuery):
     )
 
 
-async def confirmation_book_transfer(callback: CallbackQuery):
+async def confirmation_book_transfer(callback: CallbackQuery,
+                                     session: AsyncSession):
     book_id = int(callback.data.split('_')[1])
-    book = await select_book(book_id)
-    title, author, genre = await get_book_data(book)
-    book_data_text = f'"{title}", {author}'
-    await update_book_transfer_by_candidate(
+    book = await update_book_transfer_by_candidate(
+        session,
         book_id,
-        book.candidate_telegram_id
+        callback.from_user.id
     )
+    if book is None:
+        return await callback.answer(
+            'Передача книги уже отменена или подтверждена.', show_alert=True
+        )
+    title, author, genre = await get_book_data(book)
+    book_data_text = f'"{title}", {author}'
 
     # todo move this block to lexicon file?
     remain_text = '\n'
@@ -309,55 +345,68 @@ async def confirmation_book_transfer(callback: CallbackQuery):
         )
 
 
-async def notification_remaining_days_for_reading(bot: Bot):
-    ...
-    # # TODO булево значение в таблицу экзмепляров книг,
-    # #  для установления флага продлевалось чтение или нет
-    # day_now = datetime.now()
-    # async with async_sessionmaker() as session:
-    #     result = await session.execute(select(Book))
-    #     books = result.scalars().all()
-    #     for book in books:
-    #         book_data = await session.get(BookData, book.book_id)
-    #         if book.status_id != 3:
-    #             continue
-    #         else:
-    #             if book.remain_time <= day_now:
-    #                 book.status_id = 1
-    #                 book.remain_time = None
-    #                 await session.commit()
-    #                 await bot.send_message(
-    #                     book.telegram_id,
-    #                     f'Привет!\n'
-    #                     f'Ты читаешь книгу "{book_data.title.capitalize()}" уже 90 дней,\n'
-    #                     f'статус книги автоматически изменен на: "Свободна".'
-    #                 )
-    #             elif (book.remain_time - day_now).days == 7:
-    #                 inlines_btn = InlineKeyboardMarkup(row_width=1)
-    #                 inlines_btn.add(
-    #                     InlineKeyboardButton(
-    #                         'Продлить чтение',
-    #                         callback_data=f'extension reading_{book.id}',
-    #                     ),
-    #                     InlineKeyboardButton(
-    #                         'Закончить чтение',
-    #                         callback_data=f'status free_{book.id}',
-    #                     ),
-    #                 )
-    #                 await bot.send_message(
-    #                     book.telegram_id,
-    #                     text=f'Привет!\n'
-    #                          f'Ты читаешь книгу "{book_data.title.capitalize()}" уже 83 дня.\n'
-    #                          f'Будешь ли продлевать статус "Читается"?\n '
-    #                          f'Если его не продлить, то через 7 дней\n '
-    #                          f'он автоматически изменится на "Свободна".',
-    #                     reply_markup=inlines_btn
-    #
-    #                 )
-
-
-async def error_bot_blocked_handler(update: Update, exception: BotBlocked): # todo exceptions after main logic
-    print('Бот заблокирован пользователем, залогировать?? обработать?')
+def notify_expired(session: AsyncSession, book):
+    add_notification(
+        session,
+        book.telegram_id,
+        f'Привет!\n'
+        f'Срок чтения книги "{book.title.capitalize()}" закончился,\n'
+        f'статус книги автоматически изменен на: "Свободна".'
+    )
+
+
+def notify_reminder(session: AsyncSession, book):
+    keyboard = InlineKeyboardMarkup(row_width=1)
+    keyboard.add(
+        InlineKeyboardButton(
+            'Продлить чтение (15 дней)',
+            callback_data=f'extension-reading_{book.id}',
+        ),
+        InlineKeyboardButton(
+            'Закончить чтение',
+            callback_data=f'status-own-free_{book.id}_{STATUS_FREE}',
+        ),
+    )
+    days = max((book.remain_time - datetime.now()).days, 1)
+    add_notification(
+        session,
+        book.telegram_id,
+        text=f'Привет!\n'
+             f'До окончания чтения книги "{book.title.capitalize()}" '
+             f'осталось дней: {days}.\n'
+             f'Будешь ли продлевать статус "Читается"?\n'
+             f'Если его не продлить, то он автоматически изменится '
+             f'на "Свободна".',
+        reply_markup=keyboard
+    )
+
+
+async def notification_remaining_days_for_reading():
+    # books are changed in batches by one UPDATE ... RETURNING each, the
+    # notifications are written to the outbox in the same transaction
+    now = datetime.now()
+    for update_books, notify in (
+        (update_expired_readings, notify_expired),
+        (update_reading_reminders, notify_reminder),
+    ):
+        while True:
+            async with async_sessionmaker() as session:
+                books = await update_books(session, now)
+                for book in books:
+                    notify(session, book)
+                await session.commit()
+            if len(books) < SWEEP_BATCH_SIZE:
+                break
+        logging.info('Reading sweep: %s done', update_books.__name__)
+
+
+async def error_bot_blocked_handler(update: Update, exception: BotBlocked):
+    # the user blocked the bot while a handler was answering them
+    user = User.get_current()
+    if user is not None:
+        async with async_sessionmaker() as session:
+            await update_user_blocked(session, user.id)
+            await session.commit()
     return True
 
 
@@ -373,6 +422,10 @@ def register_mybooks(dispatcher):
         return_my_books,
         Text(startswith='user-books_'),
     )
+    dispatcher.register_callback_query_handler(
+        page_my_books,
+        Text(startswith='mybooks-page_'),
+    )
     dispatcher.register_callback_query_handler(
         info_book,
         Text(startswith='detailed-book_'),
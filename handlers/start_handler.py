@@ -6,12 +6,9 @@ from aiogram import Dispatcher
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text
 from aiogram.dispatcher.filters.state import StatesGroup, State
-from aiogram.types import (
-    CallbackQuery,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
-    Message
-)
+from aiogram.types import CallbackQuery, Message
+
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.db_requests import (
     insert_location,
@@ -19,7 +16,7 @@ from database.db_requests import (
     select_location,
     select_user
 )
-from database.models import Location
+from handlers.keyboards import location_keyboard
 
 
 # TODO - прописать отмену для каждого шага с возвратом в меню старт -
@@ -34,18 +31,23 @@ class FSMLocation(StatesGroup):
     db_location = State()
 
 
-async def cmd_start(msg: Message, state: FSMContext):
+async def cmd_start(msg: Message, state: FSMContext,
+                    session: AsyncSession):
     await state.reset_state()
     user_id = msg.from_user.id
     name = msg.from_user.first_name
-    user = await select_user(user_id)
+    user = await select_user(session, user_id)
     if user is not None:
+        # unblocking the bot sends /start again
+        if user.is_blocked:
+            user.is_blocked = False
         await msg.answer(f'Привет, {name}! Смотри, что могу:\n'
                          f'Список команд (с описанием...):\n'
                          f'/start\n/addbook\n/rules\n/mybooks\n'
                          f'/findbook\n/profile')
         return
     await insert_user(
+        session,
         user_id,
         name,
         msg.from_user.last_name,
@@ -68,37 +70,29 @@ async def cmd_start(msg: Message, state: FSMContext):
     await FSMLocation.user_location.set()
 
 
-async def location_keyboard(locations: Location):
-    keyboard = InlineKeyboardMarkup()
-    for location in locations:
-        keyboard.add(
-            InlineKeyboardButton(
-                f'{location.city}, {location.region}',
-                callback_data=f'location_{location.id}'
-            )
-        )
-    return keyboard
-
-
-async def get_location(msg: Message | CallbackQuery, state: FSMContext):
+async def get_location(msg: Message | CallbackQuery, state: FSMContext,
+                       session: AsyncSession):
     async with state.proxy() as data:
         data['user_location'] = msg.text
-    locations = await select_location(msg.text)
+    locations = await select_location(session, msg.text)
     if not locations:
         await msg.answer(
             'Извини, город не найден. Пожалуйста, попробуй еще раз:'
         )
         return
-    keyboard = await location_keyboard(locations)
+    keyboard = location_keyboard(tuple(locations))
     await msg.answer('Выбери город из списка ниже:', reply_markup=keyboard)
     await FSMLocation.db_location.set()
 
 
-async def save_location(callback: CallbackQuery, state: FSMContext):
+async def save_location(callback: CallbackQuery, state: FSMContext,
+                        session: AsyncSession):
     location_id = int(callback.data.split('_')[1])
     async with state.proxy() as data:
         data['db_location'] = location_id
-    city, region = await insert_location(location_id, callback.from_user.id)
+    city, region = await insert_location(
+        session, location_id, callback.from_user.id
+    )
     await callback.message.delete()
     await callback.message.answer(
         f'Записал!\nГород: {city}, ({region})\n'
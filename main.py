@@ -1,12 +1,25 @@
-import asyncio
+import logging
 
 from aiogram import Bot, Dispatcher, executor
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
-# from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from sqlalchemy.ext.asyncio import async_sessionmaker
-
-from config_data.config import BOT_TOKEN
-from database.database import close_database, connect_to_database, engine
+from aiogram.bot.api import TelegramAPIServer
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from config_data.config import (
+    BOT_API_URL, BOT_MODE, BOT_TOKEN, HANDLER_CONCURRENCY,
+    HANDLER_MAX_PENDING, READING_SWEEP_CRON, READING_SWEEP_TIMEZONE,
+    THROTTLE_COSTS, WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_PATH,
+)
+from database.cache import book_cache, search_cache
+from database.database import (
+    async_sessionmaker, close_database, connect_to_database,
+)
+from database.db_requests import load_reference_data, notifications_added
+from database.listener import (
+    Listener, NOTIFICATIONS_CHANNEL, REFERENCE_DATA_CHANNEL,
+)
+from database.query_stats import query_stats
+from fsm_storage import create_storage
 from handlers.addbook_handler import register_addbook
 from handlers.bot_commands import set_default_commands
 # from handlers.cancel_handler import register_cancel
@@ -15,16 +28,62 @@ from handlers.mybooks_handler import notification_remaining_days_for_reading
 from handlers.mybooks_handler import register_mybooks
 from handlers.rules_handler import register_rules
 from handlers.start_handler import register_start
+from middlewares.database import DatabaseMiddleware
+from middlewares.throttling import ThrottlingMiddleware, create_buckets
+from middlewares.user_queue import UserQueueMiddleware
+from notifications.sender import OutboxSender
+from webhook import WebhookHandler, create_app, register_webhook
+
+
+async def refresh_reference_data(dp):
+    async with dp.bot['db']() as session:
+        await load_reference_data(session)
+    logging.info('Reference data loaded')
 
 
 async def on_startup(dp):
     dp.bot['db'] = await connect_to_database()
+    await refresh_reference_data(dp)
+    # import_data.py notifies every running process after an import
+    dp['listener'] = Listener()
+    dp['listener'].start()
+    await dp['listener'].subscribe(
+        REFERENCE_DATA_CHANNEL, lambda payload: refresh_reference_data(dp)
+    )
     await set_default_commands(dp)
 
 
+async def start_background_jobs(dp):
+    # the outbox sender and the reading sweep, one of each per deployment
+    dp['outbox'] = OutboxSender(dp.bot, async_sessionmaker)
+    dp['outbox'].start()
+    # notifications written by the other worker processes
+    await dp['listener'].subscribe(
+        NOTIFICATIONS_CHANNEL, lambda payload: notifications_added.set()
+    )
+    dp['scheduler'] = AsyncIOScheduler(timezone=READING_SWEEP_TIMEZONE)
+    dp['scheduler'].add_job(
+        notification_remaining_days_for_reading,
+        trigger=CronTrigger.from_crontab(
+            READING_SWEEP_CRON, timezone=READING_SWEEP_TIMEZONE
+        ),
+        # a sweep that is still running is not started twice
+        max_instances=1,
+        coalesce=True,
+    )
+    dp['scheduler'].start()
+
+
 async def on_shutdown(dp):
-    async with dp.bot['db']() as session:
-        await close_database(session)
+    if dp.get('scheduler') is not None:
+        dp['scheduler'].shutdown(wait=False)
+        await dp['outbox'].stop()
+    await dp['listener'].stop()
+    logging.info('Book card cache: %s', book_cache.stats())
+    logging.info('Search result cache: %s', search_cache.stats())
+    logging.info('Query stats: %s', query_stats.report())
+    logging.info('User queues: %s', dp['user_queue'].report())
+    await close_database()
 
 
 def register_all_handlers(dp):
@@ -36,28 +95,58 @@ def register_all_handlers(dp):
     register_addbook(dp)
 
 
-if __name__ == '__main__':
-
-    bot = Bot(token=BOT_TOKEN)
-    storage = MemoryStorage()
+def create_bot():
+    if BOT_API_URL:
+        # a local Bot API server, or the fake one of the benchmarks
+        return Bot(token=BOT_TOKEN,
+                   server=TelegramAPIServer.from_base(BOT_API_URL))
+    return Bot(token=BOT_TOKEN)
+
+
+def create_dispatcher():
+    dp = Dispatcher(create_bot(), storage=create_storage())
+    dp['user_queue'] = UserQueueMiddleware(
+        HANDLER_CONCURRENCY, HANDLER_MAX_PENDING
+    )
+    dp.middleware.setup(dp['user_queue'])
+    dp.middleware.setup(
+        ThrottlingMiddleware(create_buckets(), THROTTLE_COSTS)
+    )
+    dp.middleware.setup(DatabaseMiddleware(async_sessionmaker))
+    register_all_handlers(dp)
+    return dp
 
-    dp = Dispatcher(bot, storage=storage)
 
-    register_all_handlers(dp)
+def hold_polling(dp):
+    # getUpdates waits while too many updates are pending, the rest stay
+    # with telegram as with the webhook's 429
+    get_updates = dp.bot.get_updates
 
-    loop = asyncio.get_event_loop()
-    loop.create_task(on_startup(dp))
+    async def wait_and_get_updates(*args, **kwargs):
+        await dp['user_queue'].wait_ready()
+        return await get_updates(*args, **kwargs)
 
-    # scheduler = AsyncIOScheduler(timezone='Europe/Moscow')
-    # scheduler.add_job(
-    #     notification_remaining_days_for_reading,
-    #     trigger='interval',
-    #     hours=24,
-    #     kwargs={'bot': bot},
-    #     start_date='2023-04-20 10:00:00',
-    # )
-    # scheduler.start()
+    dp.bot.get_updates = wait_and_get_updates
 
-    dp.bot['db'] = async_sessionmaker(engine, expire_on_commit=False)
 
-    executor.start_polling(dp, on_shutdown=on_shutdown, skip_updates=True)
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    dp = create_dispatcher()
+
+    if BOT_MODE == 'webhook':
+        runner = executor.Executor(dp)
+        runner.on_startup((on_startup, start_background_jobs))
+        runner.on_startup(register_webhook, polling=False)
+        runner.on_shutdown(on_shutdown)
+        runner.set_webhook(
+            WEBHOOK_PATH, request_handler=WebhookHandler,
+            web_app=create_app(),
+        )
+        runner.run_app(host=WEBAPP_HOST, port=WEBAPP_PORT)
+    else:
+        hold_polling(dp)
+        executor.start_polling(
+            dp, on_startup=(on_startup, start_background_jobs),
+            on_shutdown=on_shutdown, skip_updates=True,
+        )
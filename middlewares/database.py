@@ -0,0 +1,55 @@
+import logging
+import sys
+
+from aiogram.dispatcher.middlewares import LifetimeControllerMiddleware
+from aiogram.utils.exceptions import TelegramAPIError
+
+from database.database import recent_writers
+
+
+COMMIT_FAILED_TEXT = (
+    'Не получилось сохранить изменения, попробуй ещё раз чуть позже.'
+)
+
+
+class DatabaseMiddleware(LifetimeControllerMiddleware):
+    # one session per handled update, committed when the handler returns
+    # and rolled back when it raises
+    skip_patterns = ['update', 'error']
+
+    def __init__(self, sessionmaker):
+        super().__init__()
+        self.sessionmaker = sessionmaker
+
+    async def pre_process(self, obj, data, *args):
+        session = data['session'] = self.sessionmaker()
+        user = getattr(obj, 'from_user', None)
+        if user is not None and recent_writers.is_pinned(user.id):
+            session.info['primary'] = True
+
+    async def post_process(self, obj, data, *args):
+        session = data.pop('session', None)
+        if session is None:
+            return
+        user = getattr(obj, 'from_user', None)
+        try:
+            if sys.exc_info()[0] is None:
+                await session.commit()
+                if session.info.get('wrote') and user is not None:
+                    recent_writers.pin(user.id)
+        except Exception:
+            # the handler has already answered, the user has to learn
+            # that its changes were rolled back
+            logging.exception('Commit failed')
+            await self.report_failure(obj, user)
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def report_failure(obj, user):
+        if user is None:
+            return
+        try:
+            await obj.bot.send_message(user.id, COMMIT_FAILED_TEXT)
+        except TelegramAPIError as error:
+            logging.warning('Commit failure not reported: %r', error)
@@ -0,0 +1,152 @@
+from time import monotonic, time
+
+from aiogram.dispatcher.handler import CancelHandler, current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from config_data.config import (
+    REDIS_URL, THROTTLE_BURST, THROTTLE_RATE, THROTTLE_STORAGE,
+)
+
+
+# buckets kept in memory before the full ones are dropped
+MEMORY_BUCKETS_LIMIT = 10_000
+
+TAKE_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 't', 'u')
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local cost, now = tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate)
+local wait = 0
+if tokens < cost then
+    wait = (cost - tokens) / rate
+else
+    tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 'u', ARGV[4])
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class MemoryBuckets:
+    # token buckets of this process only
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+
+    async def take(self, user_id, cost):
+        # seconds until `cost` tokens are there, 0 when they were taken
+        now = monotonic()
+        tokens, updated = self.buckets.get(user_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < cost:
+            self.buckets[user_id] = (tokens, now)
+            return (cost - tokens) / self.rate
+        self.buckets[user_id] = (tokens - cost, now)
+        if len(self.buckets) > MEMORY_BUCKETS_LIMIT:
+            self.prune(now)
+        return 0
+
+    def prune(self, now):
+        self.buckets = {
+            user_id: (tokens, updated)
+            for user_id, (tokens, updated) in self.buckets.items()
+            if tokens + (now - updated) * self.rate < self.burst
+        }
+
+
+class RedisBuckets:
+    # token buckets shared by all bot processes, one hash per user that
+    # expires once the bucket is full again
+    def __init__(self, redis, rate, burst, prefix='throttle'):
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+        self.script = redis.register_script(TAKE_SCRIPT)
+
+    async def take(self, user_id, cost):
+        wait = await self.script(
+            keys=[f'{self.prefix}:{user_id}'],
+            args=[self.rate, self.burst, cost, time()],
+        )
+        return float(wait)
+
+
+def create_buckets():
+    # redis shares the buckets between the processes of runner.py
+    if THROTTLE_STORAGE == 'memory':
+        return MemoryBuckets(THROTTLE_RATE, THROTTLE_BURST)
+    if THROTTLE_STORAGE == 'redis':
+        from redis.asyncio import Redis
+
+        return RedisBuckets(
+            Redis.from_url(REDIS_URL), THROTTLE_RATE, THROTTLE_BURST
+        )
+    raise ValueError(f'Unknown THROTTLE_STORAGE: {THROTTLE_STORAGE}')
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    # every handler takes its cost from the user's token bucket, a user
+    # without tokens gets a short "slow down" answer and the handler does
+    # not run. Costs are looked up by handler name, command or callback
+    # data prefix.
+    def __init__(self, buckets, costs, default_cost=1):
+        super().__init__()
+        self.buckets = buckets
+        self.costs = costs
+        self.default_cost = default_cost
+        # the message reply is sent once per throttled period
+        self.warned_until = {}
+
+    def cost(self, handler, text=None, callback_data=None):
+        if handler.__name__ in self.costs:
+            return self.costs[handler.__name__]
+        # plain text is charged by its handler only, a message that
+        # happens to start with a cost name is not a command
+        if text and text[0] == '/':
+            command = text.split()[0].split('@')[0]
+            return self.costs.get(command, self.default_cost)
+        if callback_data:
+            for name, cost in self.costs.items():
+                if name[0] != '/' and callback_data.startswith(name):
+                    return cost
+        return self.default_cost
+
+    async def throttle(self, user_id, text=None, callback_data=None):
+        cost = min(self.cost(current_handler.get(), text, callback_data),
+                   self.buckets.burst)
+        if cost <= 0:
+            return 0
+        return await self.buckets.take(user_id, cost)
+
+    async def on_process_message(self, message, data):
+        wait = await self.throttle(message.from_user.id, text=message.text)
+        if not wait:
+            return
+        now = monotonic()
+        if self.warned_until.get(message.from_user.id, 0) < now:
+            self.warned_until = {
+                user_id: until for user_id, until in self.warned_until.items()
+                if until > now
+            }
+            self.warned_until[message.from_user.id] = now + wait
+            await message.answer(
+                f'Слишком много запросов, попробуй ещё раз через '
+                f'{max(round(wait), 1)} сек.'
+            )
+        raise CancelHandler()
+
+    async def on_process_callback_query(self, callback, data):
+        wait = await self.throttle(
+            callback.from_user.id, callback_data=callback.data
+        )
+        if not wait:
+            return
+        # answering the callback is needed anyway, it stops the spinner
+        await callback.answer(
+            f'Слишком часто, подожди {max(round(wait), 1)} сек.'
+        )
+        raise CancelHandler()
@@ -0,0 +1,107 @@
+import asyncio
+from time import perf_counter
+
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from database.query_stats import QueryStats
+
+
+# seconds between checks while too many updates are pending
+OVERLOAD_PAUSE = 0.05
+
+
+def update_user_id(update):
+    # messages, callback queries and the rest carry their sender as from_user
+    for value in update.values.values():
+        user = getattr(value, 'from_user', None)
+        if user is not None:
+            return user.id
+    return None
+
+
+class UserQueueMiddleware(BaseMiddleware):
+    # updates of one user are handled one after another, in the order they
+    # came, and at most `concurrency` updates are handled at once. The rest
+    # wait here instead of in the database pool.
+    def __init__(self, concurrency, max_pending):
+        super().__init__()
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_pending = max_pending
+        # user id -> [lock, updates of the user queued or running]
+        self.users = {}
+        self.pending = 0
+        self.running = 0
+        self.max_depth = 0
+        self.stats = QueryStats()
+
+    @property
+    def overloaded(self):
+        return self.pending >= self.max_pending
+
+    async def wait_ready(self):
+        # for update sources that can hold back, polling and runner workers
+        while self.overloaded:
+            await asyncio.sleep(OVERLOAD_PAUSE)
+
+    async def on_pre_process_update(self, update, data):
+        user_id = update_user_id(update)
+        if user_id is None:
+            return
+        started = perf_counter()
+        entry = self.users.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        self.pending += 1
+        self.max_depth = max(self.max_depth, entry[1])
+        acquired = []
+        try:
+            await entry[0].acquire()
+            acquired.append(entry[0])
+            queued = perf_counter()
+            await self.semaphore.acquire()
+            acquired.append(self.semaphore)
+        except BaseException:
+            # cancelled while waiting, post_process will not run
+            for lock in acquired:
+                lock.release()
+            self.leave(user_id, entry)
+            raise
+        self.running += 1
+        now = perf_counter()
+        self.stats.record_query(
+            'user_queue_wait', (queued - started) * 1000, 0
+        )
+        self.stats.record_query('slot_wait', (now - queued) * 1000, 0)
+        data['user_queue'] = (user_id, entry, now)
+
+    async def on_post_process_update(self, update, results, data):
+        if 'user_queue' not in data:
+            return
+        user_id, entry, started = data.pop('user_queue')
+        self.stats.record_query(
+            'handling', (perf_counter() - started) * 1000, 0
+        )
+        self.running -= 1
+        self.semaphore.release()
+        entry[0].release()
+        self.leave(user_id, entry)
+
+    def leave(self, user_id, entry):
+        entry[1] -= 1
+        self.pending -= 1
+        if not entry[1]:
+            del self.users[user_id]
+
+    def report(self):
+        return {
+            'pending': self.pending,
+            'running': self.running,
+            'users': len(self.users),
+            'max_user_depth': self.max_depth,
+            **{
+                name: {
+                    key: value for key, value in stat.items()
+                    if key not in ('rows', 'pool_wait_ms')
+                }
+                for name, stat in self.stats.report().items()
+            },
+        }
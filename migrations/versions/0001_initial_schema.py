@@ -0,0 +1,123 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2023-05-02 12:00:00.000000
+
+The tables exactly as ``Base.metadata.create_all`` built them before
+migrations existed, such databases are marked with ``alembic stamp 0001``
+and get everything else from the later revisions.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'dict_statuses',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('status', sa.String(), unique=True),
+    )
+    op.create_table(
+        'dict_actions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('action', sa.String(), unique=True),
+    )
+    op.create_table(
+        'locations',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('country', sa.String(), nullable=True),
+        sa.Column('region', sa.String(), nullable=True),
+        sa.Column('city', sa.String()),
+    )
+    op.create_table(
+        'authors',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('author', sa.String(), unique=True, nullable=True),
+    )
+    op.create_table(
+        'genres',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('genre', sa.String(), unique=True),
+    )
+    op.create_table(
+        'books_data',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('title', sa.String()),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('age_limit', sa.String(), nullable=True),
+        sa.Column('year', sa.String(), nullable=True),
+    )
+    op.create_table(
+        'book_author',
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books_data.id'),
+                  primary_key=True),
+        sa.Column('author_id', sa.Integer(), sa.ForeignKey('authors.id'),
+                  primary_key=True),
+    )
+    op.create_table(
+        'book_genre',
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books_data.id'),
+                  primary_key=True),
+        sa.Column('genre_id', sa.Integer(), sa.ForeignKey('genres.id'),
+                  primary_key=True),
+    )
+    op.create_table(
+        'users',
+        sa.Column('telegram_id', sa.BigInteger(), primary_key=True),
+        sa.Column('first_name', sa.String(32)),
+        sa.Column('last_name', sa.String(32), nullable=True),
+        sa.Column('username', sa.String(32), nullable=True),
+        sa.Column('reading_amount', sa.Integer(), nullable=True),
+        sa.Column('location_id', sa.Integer(), sa.ForeignKey('locations.id'),
+                  nullable=True),
+    )
+    op.create_table(
+        'books',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books_data.id')),
+        sa.Column('telegram_id', sa.BigInteger(),
+                  sa.ForeignKey('users.telegram_id')),
+        sa.Column('status_id', sa.Integer(),
+                  sa.ForeignKey('dict_statuses.id')),
+        sa.Column('location_id', sa.Integer(), sa.ForeignKey('locations.id')),
+        sa.Column('image', sa.String(), nullable=True),
+        sa.Column('condition', sa.String(), nullable=True),
+        sa.Column('pub_date', sa.DateTime(), server_default=sa.func.now()),
+        sa.Column('remain_time', sa.DateTime()),
+        sa.Column('candidate_telegram_id', sa.BigInteger(), nullable=True),
+        sa.Column('is_transferred', sa.Boolean()),
+    )
+    op.create_table(
+        'actions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('telegram_id', sa.BigInteger(),
+                  sa.ForeignKey('users.telegram_id')),
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books.id')),
+        sa.Column('action_id', sa.Integer(),
+                  sa.ForeignKey('dict_actions.id')),
+        sa.Column('ctime', sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_table(
+        'user_messages',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('telegram_id', sa.BigInteger(),
+                  sa.ForeignKey('users.telegram_id')),
+        sa.Column('msg_dt', sa.DateTime(), server_default=sa.func.now()),
+        sa.Column('msg_text', sa.String()),
+    )
+
+
+def downgrade() -> None:
+    for table in ('user_messages', 'actions', 'books', 'users',
+                  'book_genre', 'book_author', 'books_data', 'genres',
+                  'authors', 'locations', 'dict_actions', 'dict_statuses'):
+        op.drop_table(table)
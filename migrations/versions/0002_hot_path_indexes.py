@@ -0,0 +1,50 @@
+"""hot path indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2023-05-02 12:30:00.000000
+
+Indexes are built with CREATE INDEX CONCURRENTLY, which can not run in a
+transaction, so every one of them gets its own autocommit block. If a
+build fails it leaves an INVALID index behind, drop it before retrying.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    # /mybooks lists of an owner
+    ('ix_books_owner', 'books', ['telegram_id', 'status_id'], {}),
+    # city lists, the owner's own books are filtered out from the index
+    ('ix_books_location', 'books',
+     ['location_id', 'status_id', 'telegram_id'], {}),
+    # the reading-expiry scan only looks at books that are being read
+    ('ix_books_reading_expiry', 'books', ['remain_time'],
+     {'postgresql_where': sa.text('status_id = 3')}),
+    ('ix_books_candidate', 'books', ['candidate_telegram_id'],
+     {'postgresql_where': sa.text('candidate_telegram_id IS NOT NULL')}),
+    # reverse lookups, the primary keys only cover (book_id, ...)
+    ('ix_book_author_author_id', 'book_author', ['author_id'], {}),
+    ('ix_book_genre_genre_id', 'book_genre', ['genre_id'], {}),
+)
+
+
+def upgrade() -> None:
+    for name, table, columns, kwargs in INDEXES:
+        with op.get_context().autocommit_block():
+            op.create_index(
+                name, table, columns, postgresql_concurrently=True, **kwargs
+            )
+
+
+def downgrade() -> None:
+    for name, table, columns, kwargs in reversed(INDEXES):
+        with op.get_context().autocommit_block():
+            op.drop_index(name, table, postgresql_concurrently=True)
@@ -0,0 +1,33 @@
+"""books_data normalized title index
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2023-05-10 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_books_data_title_key', 'books_data',
+            [sa.text("translate(lower(title), 'ё', 'е')")],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_books_data_title_key', 'books_data',
+            postgresql_concurrently=True,
+        )
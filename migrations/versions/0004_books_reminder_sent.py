@@ -0,0 +1,28 @@
+"""books reminder_sent flag
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2023-05-16 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # a constant default does not rewrite the table
+    op.add_column(
+        'books',
+        sa.Column('reminder_sent', sa.Boolean(), server_default=sa.false()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('books', 'reminder_sent')
@@ -0,0 +1,50 @@
+"""notifications outbox
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2023-05-20 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'users',
+        sa.Column('is_blocked', sa.Boolean(), server_default=sa.false()),
+    )
+    op.create_table(
+        'notifications',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('telegram_id', sa.BigInteger(), nullable=True),
+        sa.Column('text', sa.Text(), nullable=True),
+        sa.Column('parse_mode', sa.String(), nullable=True),
+        sa.Column('reply_markup', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(),
+                  server_default=sa.func.now(), nullable=True),
+        sa.Column('send_after', sa.DateTime(),
+                  server_default=sa.func.now(), nullable=True),
+        sa.Column('attempts', sa.Integer(), server_default='0',
+                  nullable=True),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['telegram_id'], ['users.telegram_id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_notifications_pending', 'notifications', ['send_after', 'id'],
+        postgresql_where=sa.text('send_after IS NOT NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notifications_pending', table_name='notifications')
+    op.drop_table('notifications')
+    op.drop_column('users', 'is_blocked')
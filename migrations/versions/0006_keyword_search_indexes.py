@@ -0,0 +1,46 @@
+"""keyword search indexes
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2023-05-24 12:00:00.000000
+
+Indexes are built with CREATE INDEX CONCURRENTLY, see 0002.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+NORMALIZED = "translate(lower(title), 'ё', 'е')"
+
+INDEXES = (
+    # trigram and full-text matching of the titles, database/models.py
+    ('ix_books_data_title_trgm', 'books_data',
+     [sa.text(f'{NORMALIZED} gin_trgm_ops')], {'postgresql_using': 'gin'}),
+    ('ix_books_data_title_tsv', 'books_data',
+     [sa.text(f"to_tsvector('russian', {NORMALIZED})")],
+     {'postgresql_using': 'gin'}),
+    # copies of a catalog book
+    ('ix_books_book_id', 'books', ['book_id'], {}),
+)
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, columns, kwargs in INDEXES:
+        with op.get_context().autocommit_block():
+            op.create_index(
+                name, table, columns, postgresql_concurrently=True, **kwargs
+            )
+
+
+def downgrade() -> None:
+    for name, table, columns, kwargs in reversed(INDEXES):
+        with op.get_context().autocommit_block():
+            op.drop_index(name, table, postgresql_concurrently=True)
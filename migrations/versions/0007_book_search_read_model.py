@@ -0,0 +1,83 @@
+"""book_search read model
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2023-05-24 12:30:00.000000
+
+Creates the table with its indexes and triggers and fills it from the
+existing books in the same transaction.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from database.book_search import BOOK_SEARCH_BACKFILL, BOOK_SEARCH_DDL
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+NORMALIZED = "translate(lower(document), 'ё', 'е')"
+
+TRIGGERS = (
+    ('book_search_authors', 'authors'),
+    ('book_search_book_genre', 'book_genre'),
+    ('book_search_book_author', 'book_author'),
+    ('book_search_books_data', 'books_data'),
+    ('book_search_books', 'books'),
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        'book_search',
+        sa.Column('id', sa.Integer(),
+                  sa.ForeignKey('books.id', ondelete='CASCADE'),
+                  primary_key=True),
+        sa.Column('book_data_id', sa.Integer()),
+        sa.Column('title', sa.String()),
+        sa.Column('authors', postgresql.ARRAY(sa.String())),
+        sa.Column('genre_ids', postgresql.ARRAY(sa.Integer())),
+        sa.Column('status_id', sa.Integer()),
+        sa.Column('location_id', sa.Integer()),
+        sa.Column('telegram_id', sa.BigInteger()),
+        sa.Column('remain_time', sa.DateTime()),
+        sa.Column('candidate_telegram_id', sa.BigInteger()),
+        sa.Column('is_transferred', sa.Boolean()),
+        sa.Column('document', sa.Text()),
+    )
+    op.create_index(
+        'ix_book_search_owner', 'book_search',
+        ['telegram_id', 'status_id', 'title', 'id'],
+    )
+    op.create_index(
+        'ix_book_search_location', 'book_search',
+        ['location_id', 'status_id', 'title', 'id'],
+    )
+    op.create_index(
+        'ix_book_search_document_trgm', 'book_search',
+        [sa.text(f'{NORMALIZED} gin_trgm_ops')],
+        postgresql_using='gin',
+    )
+    op.create_index(
+        'ix_book_search_document_tsv', 'book_search',
+        [sa.text(f"to_tsvector('russian', {NORMALIZED})")],
+        postgresql_using='gin',
+    )
+    for statement in BOOK_SEARCH_DDL:
+        op.execute(statement)
+    op.execute(BOOK_SEARCH_BACKFILL)
+
+
+def downgrade() -> None:
+    for trigger, table in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {trigger} ON {table}')
+    op.drop_table('book_search')
+    for function in ('book_search_on_author', 'book_search_on_book_data',
+                     'book_search_on_book'):
+        op.execute(f'DROP FUNCTION IF EXISTS {function}()')
+    op.execute('DROP FUNCTION IF EXISTS book_search_upsert(integer[])')
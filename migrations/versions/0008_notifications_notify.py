@@ -0,0 +1,39 @@
+"""notifications NOTIFY trigger
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2023-05-26 12:00:00.000000
+
+Wakes the outbox sender, whichever process wrote the notifications.
+NOTIFY is sent on commit and only once per transaction and channel.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+    CREATE OR REPLACE FUNCTION notifications_notify() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('notifications', '');
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+    CREATE TRIGGER notifications_added
+    AFTER INSERT ON notifications
+    FOR EACH STATEMENT EXECUTE FUNCTION notifications_notify()
+    """)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS notifications_added ON notifications')
+    op.execute('DROP FUNCTION IF EXISTS notifications_notify()')
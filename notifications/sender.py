@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import random
+from collections import defaultdict
+from time import monotonic
+
+from aiogram.utils.exceptions import (
+    BadRequest, ChatNotFound, RetryAfter, TelegramAPIError, Unauthorized,
+)
+
+from config_data.config import (
+    OUTBOX_BATCH_SIZE, OUTBOX_CHAT_INTERVAL, OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_POLL_INTERVAL, OUTBOX_RATE,
+)
+from database.db_requests import (
+    claim_notifications,
+    delete_notifications,
+    notifications_added,
+    reschedule_notification,
+    update_user_blocked,
+)
+
+
+# seconds a claimed batch stays hidden from other senders
+LEASE = 300
+BACKOFF_BASE = 5
+BACKOFF_MAX = 3600
+
+
+def backoff(attempts):
+    # exponential with jitter, so failed messages do not retry in step
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.5)
+
+
+class OutboxSender:
+    # drains the notifications table: OUTBOX_RATE messages a second in
+    # total and at most one per OUTBOX_CHAT_INTERVAL to the same chat
+    def __init__(self, bot, sessionmaker):
+        self.bot = bot
+        self.sessionmaker = sessionmaker
+        self.lock = asyncio.Lock()
+        self.next_send = 0.0
+        self.next_chat_send = {}
+        self.stopping = False
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        # the current batch is finished, so nothing is sent twice
+        self.stopping = True
+        notifications_added.set()
+        if self.task is not None:
+            await self.task
+
+    async def run(self):
+        while not self.stopping:
+            notifications_added.clear()
+            try:
+                async with self.sessionmaker() as session:
+                    notifications = await claim_notifications(
+                        session, OUTBOX_BATCH_SIZE, LEASE
+                    )
+                    await session.commit()
+                if notifications:
+                    await self.send_batch(notifications)
+                    continue
+            except Exception:
+                logging.exception('Notification outbox failed')
+            try:
+                await asyncio.wait_for(
+                    notifications_added.wait(), OUTBOX_POLL_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def send_batch(self, notifications):
+        chats = defaultdict(list)
+        for notification in notifications:
+            chats[notification.telegram_id].append(notification)
+        results = await asyncio.gather(
+            *(self.send_chat(chat) for chat in chats.values())
+        )
+        async with self.sessionmaker() as session:
+            sent = []
+            for chat_sent, retries, blocked in results:
+                sent.extend(chat_sent)
+                for notification_id, delay, error in retries:
+                    await reschedule_notification(
+                        session, notification_id, delay, error
+                    )
+                if blocked is not None:
+                    await update_user_blocked(session, blocked)
+            if sent:
+                await delete_notifications(session, sent)
+            await session.commit()
+        now = monotonic()
+        self.next_chat_send = {
+            chat: ready for chat, ready in self.next_chat_send.items()
+            if ready > now
+        }
+
+    async def send_chat(self, notifications):
+        # messages to one chat go in order, after a failure the rest of
+        # them waits for the same retry
+        sent, retries = [], []
+        chat_id = notifications[0].telegram_id
+        if notifications[0].is_blocked:
+            return sent, retries, chat_id
+        for number, notification in enumerate(notifications):
+            await self.throttle(chat_id)
+            try:
+                await self.bot.send_message(
+                    chat_id,
+                    notification.text,
+                    parse_mode=notification.parse_mode,
+                    reply_markup=notification.reply_markup,
+                )
+            except (Unauthorized, ChatNotFound):
+                logging.info('User %s blocked the bot', chat_id)
+                return sent, retries, chat_id
+            except RetryAfter as error:
+                # flood control is counted for the whole bot
+                self.next_send = max(self.next_send,
+                                     monotonic() + error.timeout)
+                delay, message = error.timeout, str(error)
+            except BadRequest as error:
+                # a malformed message will not get better, give it up
+                logging.warning('Notification %s rejected: %s',
+                                notification.id, error)
+                retries.append((notification.id, None, str(error)))
+                continue
+            except (TelegramAPIError, asyncio.TimeoutError) as error:
+                delay, message = backoff(notification.attempts), str(error)
+            else:
+                sent.append(notification.id)
+                continue
+            for waiting in notifications[number:]:
+                retries.append((
+                    waiting.id,
+                    delay if waiting.attempts < OUTBOX_MAX_ATTEMPTS else None,
+                    message,
+                ))
+            break
+        return sent, retries, None
+
+    async def throttle(self, chat_id):
+        delay = self.next_chat_send.get(chat_id, 0) - monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with self.lock:
+            delay = self.next_send - monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_send = max(self.next_send, monotonic()) + 1 / OUTBOX_RATE
+        self.next_chat_send[chat_id] = monotonic() + OUTBOX_CHAT_INTERVAL
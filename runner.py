@@ -0,0 +1,211 @@
+"""Run the bot in several worker processes.
+
+One front-end process takes updates from Telegram (long polling or the
+webhook, as BOT_MODE says) and routes each of them to a worker by the id
+of the user who sent it. Updates of one user always go to the same worker,
+so their FSM flow stays in one process. Every worker has its own
+dispatcher and database pool, the outbox sender and the reading sweep run
+in worker 0 only. Notifications written by the other workers wake the
+sender through a Postgres NOTIFY. The book card cache is off with more than one worker,
+its invalidations would not reach the other processes.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import signal
+from queue import Empty
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+
+from config_data.config import (
+    BOT_MODE, BOT_WORKERS, WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_PATH,
+)
+
+
+# updates taken from a worker queue in one go
+QUEUE_BATCH = 100
+POLLING_TIMEOUT = 20
+
+
+def update_user(update):
+    # messages, callback queries and the rest all carry the sender in 'from'
+    for value in update.values():
+        if isinstance(value, dict) and 'from' in value:
+            return value['from']['id']
+    return update['update_id']
+
+
+class Router:
+    def __init__(self, queues, processes):
+        self.queues = queues
+        self.processes = processes
+
+    def route(self, update):
+        self.queues[update_user(update) % len(self.queues)].put(update)
+
+    def stop(self):
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join()
+
+
+async def poll(router, bot):
+    # same as start_polling(skip_updates=True) of main.py
+    await bot.delete_webhook(drop_pending_updates=True)
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset, timeout=POLLING_TIMEOUT
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception('getUpdates failed')
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            router.route(update.to_python())
+            offset = update.update_id + 1
+
+
+def run_polling(router):
+    async def main():
+        # the Bot is only used for getUpdates, handlers run in the workers
+        from main import create_bot
+
+        bot = create_bot()
+        try:
+            await poll(router, bot)
+        finally:
+            await (await bot.get_session()).close()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+def run_webhook(router):
+    from webhook import check_secret, register_webhook
+
+    async def receive(request):
+        check_secret(request)
+        router.route(await request.json())
+        return web.Response(text='ok')
+
+    async def health(request):
+        alive = [process.is_alive() for process in router.processes]
+        return web.json_response(
+            {'workers': alive}, status=200 if all(alive) else 503
+        )
+
+    async def on_startup(app):
+        from main import create_bot
+
+        bot = create_bot()
+        await register_webhook(Dispatcher(bot))
+        await (await bot.get_session()).close()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, receive)
+    app.router.add_get('/health', health)
+    app.on_startup.append(on_startup)
+    web.run_app(app, host=WEBAPP_HOST, port=WEBAPP_PORT)
+
+
+async def consume(dp, queue):
+    from webhook import process_update
+
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    while True:
+        # an overloaded worker leaves updates in its queue
+        await dp['user_queue'].wait_ready()
+        # a blocking get in a thread, then whatever else is already queued
+        updates = [await loop.run_in_executor(None, queue.get)]
+        try:
+            while len(updates) < QUEUE_BATCH:
+                updates.append(queue.get_nowait())
+        except Empty:
+            pass
+        for update in updates:
+            if update is None:
+                if tasks:
+                    await asyncio.wait(tasks)
+                return
+            task = asyncio.create_task(
+                process_update(dp, types.Update(**update))
+            )
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+
+def worker(number, queue, workers):
+    # ctrl+c reaches the whole process group, the front-end stops workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(
+        level=logging.INFO, format=f'[worker {number}] %(message)s'
+    )
+    # imported here, so every process creates its own engine and pool
+    from database.cache import book_cache
+    from main import (
+        create_dispatcher, on_shutdown, on_startup, start_background_jobs,
+    )
+
+    if workers > 1:
+        book_cache.disable()
+
+    async def main():
+        dp = create_dispatcher()
+        Bot.set_current(dp.bot)
+        Dispatcher.set_current(dp)
+        await on_startup(dp)
+        if number == 0:
+            await start_background_jobs(dp)
+        try:
+            await consume(dp, queue)
+        finally:
+            await on_shutdown(dp)
+            await dp.storage.close()
+            await dp.storage.wait_closed()
+            await (await dp.bot.get_session()).close()
+
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=BOT_WORKERS)
+    parser.add_argument('--mode', choices=('polling', 'webhook'),
+                        default=BOT_MODE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # spawn, a forked child would share the parent's sockets and loop
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue() for _ in range(args.workers)]
+    processes = [
+        context.Process(
+            target=worker, args=(number, queue, args.workers), daemon=True
+        )
+        for number, queue in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+    router = Router(queues, processes)
+    logging.info('Started %s workers, %s mode', args.workers, args.mode)
+    try:
+        if args.mode == 'webhook':
+            run_webhook(router)
+        else:
+            run_polling(router)
+    finally:
+        router.stop()
+
+
+if __name__ == '__main__':
+    main()
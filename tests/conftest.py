@@ -0,0 +1,13 @@
+import os
+
+
+# config_data.config is read at import, the tests never connect anywhere
+for name, value in (
+    ('BOT_TOKEN', '1:test'),
+    ('DB_USER', 'test'),
+    ('DB_PASSWORD', 'test'),
+    ('DB_HOST', 'localhost'),
+    ('DB_PORT', '5432'),
+    ('DB_NAME', 'test'),
+):
+    os.environ.setdefault(name, value)
@@ -0,0 +1,43 @@
+import json
+
+from database.reference_cache import reference_cache
+from handlers.keyboards import genre_keyboard, markups
+
+
+def buttons(markup):
+    return [
+        (button['text'], button['callback_data'])
+        for row in json.loads(markup)['inline_keyboard'] for button in row
+    ]
+
+
+def test_static_markup_is_built_once():
+    assert markups.get('findbook') is markups.get('findbook')
+    assert buttons(markups.get('findbook')) == [
+        ('Поиск по ключевым словам', 'search-keyword'),
+        ('Все книги в твоём городе', 'search-location'),
+    ]
+
+
+def test_genre_keyboard_marks_chosen(monkeypatch):
+    monkeypatch.setattr(reference_cache, 'genres', {1: 'Роман', 2: 'Поэзия'})
+    assert genre_keyboard() is markups.get('genres')
+    assert buttons(genre_keyboard([2])) == [
+        ('Роман', 'Роман_1'),
+        ('✅Поэзия', 'Поэзия_2'),
+        ('Подтвердить', 'accept'),
+    ]
+    # the template itself is not changed by a patch
+    assert '✅' not in markups.get('genres')
+
+
+def test_genre_keyboard_follows_refresh(monkeypatch):
+    monkeypatch.setattr(reference_cache, 'genres', {1: 'Роман'})
+    genre_keyboard([1])
+    monkeypatch.setattr(reference_cache, 'genres', {1: 'Роман', 7: 'Новый'})
+    assert ('✅Новый', 'Новый_7') in buttons(genre_keyboard([7]))
+    # a chosen genre that the refresh removed is skipped
+    monkeypatch.setattr(reference_cache, 'genres', {7: 'Новый'})
+    assert buttons(genre_keyboard([1, 7])) == [
+        ('✅Новый', 'Новый_7'), ('Подтвердить', 'accept'),
+    ]
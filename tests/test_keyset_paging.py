@@ -0,0 +1,91 @@
+import asyncio
+from collections import namedtuple
+
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from database.db_requests import (
+    BOOKS_PAGE_SIZE, BooksPage, fetch_books_page,
+)
+from database.models import BookSearch
+from handlers.keyboards import add_pagination_buttons, parse_page_callback
+
+
+Row = namedtuple('Row', 'id')
+
+
+class FakeSession:
+    # returns the prepared rows in the order the query asked for
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    async def execute(self, query):
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        self.statements.append(sql)
+        rows = sorted(self.rows, reverse='DESC' in sql)
+        return FakeResult([Row(book_id) for book_id in rows])
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+def fetch(rows, after=None, before=None):
+    session = FakeSession(rows)
+    sort_keys = (BookSearch.status_id, BookSearch.id)
+    page = asyncio.run(fetch_books_page(
+        session, select(BookSearch.id), sort_keys, select(*sort_keys),
+        after, before,
+    ))
+    return page, session.statements[0]
+
+
+def ids(page):
+    return [book.id for book in page.books]
+
+
+def test_first_page():
+    page, sql = fetch(range(1, BOOKS_PAGE_SIZE + 2))
+    assert ids(page) == list(range(1, BOOKS_PAGE_SIZE + 1))
+    assert page.prev_cursor is None
+    assert page.next_cursor == BOOKS_PAGE_SIZE
+    # one row more than the page tells whether there is a next one
+    assert 'LIMIT' in sql and '>' not in sql
+
+
+def test_last_page_after_cursor():
+    page, sql = fetch(range(11, 16), after=10)
+    assert ids(page) == [11, 12, 13, 14, 15]
+    assert (page.prev_cursor, page.next_cursor) == (11, None)
+    assert '(book_search.status_id, book_search.id) >' in sql
+
+
+def test_page_before_cursor_is_reversed():
+    page, sql = fetch(range(1, BOOKS_PAGE_SIZE + 1), before=11)
+    assert ids(page) == list(range(1, BOOKS_PAGE_SIZE + 1))
+    assert (page.prev_cursor, page.next_cursor) == (None, BOOKS_PAGE_SIZE)
+    assert '(book_search.status_id, book_search.id) <' in sql
+    assert 'DESC' in sql
+
+
+def test_empty_page():
+    page, _ = fetch([], after=5)
+    assert page == BooksPage([], None, None)
+
+
+def test_pagination_buttons_round_trip():
+    page = BooksPage([Row(3), Row(4)], 3, 4)
+    keyboard = add_pagination_buttons(InlineKeyboardMarkup(), page, 'p')
+    back, forward = keyboard.inline_keyboard[0]
+    assert parse_page_callback(back.callback_data) == (None, 3)
+    assert parse_page_callback(forward.callback_data) == (4, None)
+    single = BooksPage([Row(3)], None, None)
+    assert not add_pagination_buttons(
+        InlineKeyboardMarkup(), single, 'p'
+    ).inline_keyboard
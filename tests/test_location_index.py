@@ -0,0 +1,70 @@
+from database.location_index import (
+    LOCATIONS_LIMIT, LocationEntry, LocationIndex, normalize_city,
+)
+
+
+LOCATIONS = [
+    LocationEntry(1, 'Москва', 'Москва и Московская обл.'),
+    LocationEntry(2, 'Московский', 'Москва и Московская обл.'),
+    LocationEntry(3, 'Новомосковск', 'Тульская обл.'),
+    LocationEntry(4, 'Санкт-Петербург', 'Санкт-Петербург и область'),
+    LocationEntry(5, 'Санкт-Галлен', 'Швейцария'),
+    LocationEntry(6, 'Екатеринбург', 'Свердловская обл.'),
+    LocationEntry(7, 'Ростов-на-Дону', 'Ростовская обл.'),
+]
+
+
+def build(weights=None):
+    index = LocationIndex()
+    index.build(LOCATIONS, weights)
+    return index
+
+
+def cities(index, user_input):
+    return [location.city for location in index.search(user_input)]
+
+
+def test_normalize_city():
+    assert normalize_city('  Ростов-на-Дону ') == 'ростов на дону'
+    assert normalize_city('Королёв') == 'королев'
+    assert normalize_city('Moskva') == 'москва'
+
+
+def test_shorter_name_first():
+    assert cities(build(), 'моск')[:2] == ['Москва', 'Московский']
+
+
+def test_region_namesake_before_shorter_name():
+    assert cities(build(), 'Санкт') == ['Санкт-Петербург', 'Санкт-Галлен']
+
+
+def test_users_rank_first():
+    assert cities(build({5: 3, 4: 1}), 'санкт')[0] == 'Санкт-Галлен'
+
+
+def test_inner_word_and_transliteration():
+    assert cities(build(), 'дону') == ['Ростов-на-Дону']
+    assert cities(build(), 'ekaterinburg') == ['Екатеринбург']
+
+
+def test_ngram_fallback():
+    # a typo misses the prefix tries
+    assert 'Екатеринбург' in cities(build(), 'екатиринбург')
+    # a substring that is not a word start
+    assert 'Новомосковск' in cities(build(), 'московск')
+
+
+def test_empty_and_unknown():
+    index = build()
+    assert index.search('   ') == []
+    assert index.search('щщщщ') == []
+    assert not LocationIndex()
+
+
+def test_limit():
+    index = LocationIndex()
+    index.build(
+        LocationEntry(number, f'Город {number}', 'Область')
+        for number in range(LOCATIONS_LIMIT * 3)
+    )
+    assert len(index.search('город')) == LOCATIONS_LIMIT
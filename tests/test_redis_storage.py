@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from aiogram.dispatcher.filters.state import State, StatesGroup
+
+from fsm_storage.redis_storage import RedisStorage
+
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+class Form(StatesGroup):
+    title = State()
+
+
+def run(scenario, ttl=None):
+    redis = fakeredis.FakeAsyncRedis()
+    storage = RedisStorage(redis, ttl=ttl)
+    return asyncio.run(scenario(storage, redis))
+
+
+def test_state_round_trip():
+    async def scenario(storage, redis):
+        assert await storage.get_state(chat=1, user=2) is None
+        assert await storage.get_state(chat=1, user=2, default='x') == 'x'
+        await storage.set_state(chat=1, user=2, state=Form.title)
+        state = await storage.get_state(chat=1, user=2)
+        # another user of the same chat has its own state
+        other = await storage.get_state(chat=1, user=3)
+        await storage.set_state(chat=1, user=2, state=None)
+        return state, other, await redis.exists('fsm:1:2')
+
+    assert run(scenario) == ('Form:title', None, 0)
+
+
+def test_data_round_trip():
+    async def scenario(storage, redis):
+        await storage.set_data(chat=1, user=1, data={'book': 'Дюна'})
+        await storage.update_data(chat=1, user=1, data={'genres_id': [1]},
+                                  page=[None, 5])
+        data = await storage.get_data(chat=1, user=1)
+        raw = await redis.hget('fsm:1:1', 'd')
+        await storage.set_data(chat=1, user=1, data={})
+        return data, raw, await storage.get_data(chat=1, user=1)
+
+    data, raw, cleared = run(scenario)
+    assert data == {'book': 'Дюна', 'genres_id': [1], 'page': [None, 5]}
+    # compact json, cyrillic is stored as is
+    assert 'Дюна' in raw.decode() and ' ' not in raw.decode()
+    assert cleared == {}
+
+
+def test_reset_state_keeps_or_drops_data():
+    async def scenario(storage, redis):
+        await storage.set_state(chat=1, user=1, state='a')
+        await storage.set_data(chat=1, user=1, data={'x': 1})
+        await storage.reset_state(chat=1, user=1, with_data=False)
+        kept = await storage.get_data(chat=1, user=1)
+        await storage.set_state(chat=1, user=1, state='a')
+        await storage.reset_state(chat=1, user=1)
+        return (kept, await storage.get_state(chat=1, user=1),
+                await storage.get_data(chat=1, user=1))
+
+    assert run(scenario) == ({'x': 1}, None, {})
+
+
+def test_bucket_round_trip():
+    async def scenario(storage, redis):
+        await storage.update_bucket(chat=1, user=1, bucket={'n': 1}, m=2)
+        bucket = await storage.get_bucket(chat=1, user=1)
+        return bucket, await storage.get_data(chat=1, user=1)
+
+    assert run(scenario) == ({'n': 1, 'm': 2}, {})
+
+
+def test_ttl_is_renewed_by_reads_and_writes():
+    async def scenario(storage, redis):
+        await storage.set_state(chat=1, user=1, state='a')
+        after_write = await redis.ttl('fsm:1:1')
+        await redis.expire('fsm:1:1', 5)
+        await storage.get_state(chat=1, user=1)
+        return after_write, await redis.ttl('fsm:1:1')
+
+    assert run(scenario, ttl=3600) == (3600, 3600)
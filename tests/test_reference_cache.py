@@ -0,0 +1,41 @@
+import asyncio
+from collections import namedtuple
+
+import pytest
+
+from database.listener import Listener
+from database.reference_cache import ReferenceCache
+
+
+Location = namedtuple('Location', 'id city region users')
+
+
+def test_unknown_ids_fail_loudly():
+    cache = ReferenceCache()
+    with pytest.raises(KeyError):
+        cache.status(1)
+    cache.update([(1, 'Свободна')], [], [],
+                 [Location(5, 'Пермь', 'Пермский край', 0)])
+    assert (cache.status(1), cache.city(5)) == ('Свободна', 'Пермь')
+    with pytest.raises(KeyError):
+        cache.city(6)
+
+
+def test_listener_runs_callbacks_of_the_channel():
+    async def scenario():
+        listener = Listener()
+        calls = []
+
+        async def reload(payload):
+            calls.append(('reload', payload))
+
+        await listener.subscribe('reference_data', reload)
+        await listener.subscribe(
+            'other', lambda payload: calls.append('other')
+        )
+        listener.on_notification(None, 1, 'reference_data', '')
+        await asyncio.gather(*listener.tasks)
+        return calls, listener.tasks
+
+    calls, tasks = asyncio.run(scenario())
+    assert calls == [('reload', '')] and not tasks
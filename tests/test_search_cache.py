@@ -0,0 +1,128 @@
+import asyncio
+from collections import namedtuple
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from config_data.config import SEARCH_CANDIDATES_LIMIT, SEARCH_RESULTS_LIMIT
+from database import db_requests
+from database.cache import SearchResultCache
+from database.db_requests import BOOKS_PAGE_SIZE, ids_page
+
+
+Card = namedtuple('Card', 'id telegram_id')
+
+BOOK_IDS = list(range(101, 101 + BOOKS_PAGE_SIZE * 2 + 5))
+
+
+def test_ids_page_walks_forward_and_back():
+    first = ids_page(BOOK_IDS)
+    assert first == (BOOK_IDS[:BOOKS_PAGE_SIZE], None, BOOK_IDS[9])
+    second = ids_page(BOOK_IDS, after=first[2])
+    assert second == (BOOK_IDS[10:20], BOOK_IDS[10], BOOK_IDS[19])
+    last = ids_page(BOOK_IDS, after=second[2])
+    assert last == (BOOK_IDS[20:], BOOK_IDS[20], None)
+    assert ids_page(BOOK_IDS, before=last[1]) == second
+    assert ids_page(BOOK_IDS, before=second[1]) == first
+
+
+def test_ids_page_edges():
+    assert ids_page([]) == ([], None, None)
+    assert ids_page([1]) == ([1], None, None)
+    # a cursor that is not in the list starts over
+    assert ids_page(BOOK_IDS, after=1) == ids_page(BOOK_IDS)
+    assert ids_page(BOOK_IDS, before=1) == ids_page(BOOK_IDS)
+
+
+def test_search_cache_by_user_and_query(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('database.cache.monotonic', lambda: now[0])
+    cache = SearchResultCache(maxsize=2, ttl=60)
+    cache.set(1, 'дюна', [3, 1])
+    assert cache.get(1, 'дюна') == [3, 1]
+    # one search per user, another query is a miss
+    assert cache.get(1, 'толстой') is None
+    assert cache.get(2, 'дюна') is None
+    now[0] += 61
+    assert cache.get(1, 'дюна') is None
+    assert cache.stats()['hits'] == 1
+
+
+def test_search_cache_evicts_least_recent_user():
+    cache = SearchResultCache(maxsize=2, ttl=60)
+    cache.set(1, 'a', [1])
+    cache.set(2, 'b', [2])
+    cache.get(1, 'a')
+    cache.set(3, 'c', [3])
+    assert cache.get(2, 'b') is None
+    assert cache.get(1, 'a') == [1] and cache.get(3, 'c') == [3]
+
+
+@pytest.fixture
+def search(monkeypatch):
+    # select_books_by_keyword with the ranked query and the card lookup
+    # replaced, counting how often the ranked query runs
+    monkeypatch.setattr(db_requests, 'search_cache', SearchResultCache())
+    queries = []
+
+    async def select_book_ids(session, user_id, keyword):
+        queries.append(keyword)
+        return BOOK_IDS
+
+    async def select_books(session, book_ids):
+        return [Card(book_id, 2 if book_id == 103 else 1)
+                for book_id in book_ids]
+
+    monkeypatch.setattr(db_requests, 'select_book_ids_by_keyword',
+                        select_book_ids)
+    monkeypatch.setattr(db_requests, 'select_books', select_books)
+
+    def run(*args, **kwargs):
+        return asyncio.run(db_requests.select_books_by_keyword(
+            None, 2, *args, **kwargs
+        ))
+    return run, queries
+
+
+def test_paging_and_back_use_the_cached_ids(search):
+    run, queries = search
+    first = run('  Дюна ', refresh=True)
+    second = run('дюна', after=first.next_cursor)
+    back = run('ДЮНА', before=second.prev_cursor)
+    assert queries == ['дюна']
+    assert [card.id for card in second.books] == BOOK_IDS[10:20]
+    # the user's own book is not shown
+    assert 103 not in [card.id for card in first.books]
+    assert back == first
+
+
+def test_typed_query_searches_again(search):
+    run, queries = search
+    run('дюна', refresh=True)
+    run('дюна', refresh=True)
+    run('толстой')
+    assert queries == ['дюна', 'дюна', 'толстой']
+
+
+def test_only_the_capped_candidates_are_ranked():
+    class Session:
+        async def execute(self, query):
+            self.query = query.compile(dialect=postgresql.dialect())
+            return self
+
+        def scalars(self):
+            return self
+
+        def all(self):
+            return []
+
+    session = Session()
+    asyncio.run(db_requests.select_book_ids_by_keyword(session, 1, 'дюна'))
+    sql = str(session.query)
+    inner, outer = sql.split(') AS anon_1')
+    assert 'LIMIT' in inner and 'ts_rank' not in inner
+    assert 'ts_rank' in outer.split('ORDER BY')[1]
+    params = session.query.params
+    assert (params['param_1'], params['param_2']) == (
+        SEARCH_CANDIDATES_LIMIT, SEARCH_RESULTS_LIMIT
+    )
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from middlewares.throttling import (
+    MemoryBuckets, RedisBuckets, ThrottlingMiddleware,
+)
+
+
+COSTS = {'get_book': 3, '/mybooks': 2, 'mybooks-page_': 2, '/rules': 0.5}
+
+
+def get_book():
+    pass
+
+
+def other_handler():
+    pass
+
+
+def take_all(buckets, costs, user_id=1):
+    async def take():
+        return [await buckets.take(user_id, cost) for cost in costs]
+    return asyncio.run(take())
+
+
+def test_cost_by_handler_name():
+    middleware = ThrottlingMiddleware(MemoryBuckets(1, 10), COSTS)
+    assert middleware.cost(get_book, text='Война и мир') == 3
+    assert middleware.cost(get_book, callback_data='mybooks-page_5') == 3
+
+
+def test_cost_by_command():
+    middleware = ThrottlingMiddleware(MemoryBuckets(1, 10), COSTS)
+    assert middleware.cost(other_handler, text='/mybooks') == 2
+    assert middleware.cost(other_handler, text='/mybooks@bot now') == 2
+    assert middleware.cost(other_handler, text='/start') == 1
+
+
+def test_cost_by_callback_prefix():
+    middleware = ThrottlingMiddleware(MemoryBuckets(1, 10), COSTS)
+    assert middleware.cost(
+        other_handler, callback_data='mybooks-page_after_7'
+    ) == 2
+    assert middleware.cost(other_handler, callback_data='search_7') == 1
+
+
+def test_plain_text_is_not_charged_as_a_cost_name():
+    middleware = ThrottlingMiddleware(MemoryBuckets(1, 10), COSTS)
+    assert middleware.cost(other_handler, text='get_book something') == 1
+    assert middleware.cost(other_handler, text='mybooks-page_1') == 1
+    assert middleware.cost(other_handler, text='') == 1
+
+
+def test_memory_buckets():
+    buckets = MemoryBuckets(rate=1, burst=10)
+    waits = take_all(buckets, [4, 4, 4])
+    assert waits[:2] == [0, 0]
+    # 2 tokens are left, 2 more take 2 seconds at 1 token a second
+    assert waits[2] == pytest.approx(2, abs=0.01)
+    # another user has a full bucket
+    assert take_all(buckets, [10], user_id=2) == [0]
+
+
+def test_memory_buckets_refill(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('middlewares.throttling.monotonic', lambda: now[0])
+    buckets = MemoryBuckets(rate=2, burst=4)
+    assert take_all(buckets, [4, 1]) == [0, 0.5]
+    now[0] += 1
+    assert take_all(buckets, [2, 1]) == [0, 0.5]
+    # a bucket never holds more than burst
+    now[0] += 60
+    assert take_all(buckets, [4, 1]) == [0, 0.5]
+
+
+def test_memory_buckets_prune(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('middlewares.throttling.monotonic', lambda: now[0])
+    monkeypatch.setattr('middlewares.throttling.MEMORY_BUCKETS_LIMIT', 2)
+    buckets = MemoryBuckets(rate=1, burst=4)
+    take_all(buckets, [1], user_id=1)
+    take_all(buckets, [1], user_id=2)
+    now[0] += 10
+    take_all(buckets, [1], user_id=3)
+    # the refilled buckets are dropped, they equal a missing one
+    assert list(buckets.buckets) == [3]
+
+
+def test_redis_buckets(monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    now = [1000.0]
+    monkeypatch.setattr('middlewares.throttling.time', lambda: now[0])
+    redis = fakeredis.FakeAsyncRedis()
+    buckets = RedisBuckets(redis, rate=1, burst=10)
+
+    async def scenario():
+        waits = [await buckets.take(1, 4) for _ in range(3)]
+        now[0] += 2
+        waits.append(await buckets.take(1, 4))
+        waits.append(await buckets.take(2, 10))
+        ttl = await redis.ttl('throttle:1')
+        return waits, ttl
+
+    waits, ttl = asyncio.run(scenario())
+    assert waits[:2] == [0, 0]
+    assert waits[2] == pytest.approx(2)
+    assert waits[3] == 0
+    assert waits[4] == 0
+    # a bucket expires once it would be full again
+    assert 0 < ttl <= 11
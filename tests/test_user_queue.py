@@ -0,0 +1,109 @@
+import asyncio
+
+from aiogram import types
+
+from middlewares.user_queue import UserQueueMiddleware, update_user_id
+
+
+def message_update(update_id, user_id):
+    return types.Update(**{'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': str(update_id),
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'a'},
+        'chat': {'id': user_id, 'type': 'private'},
+    }})
+
+
+async def handle(middleware, update, log, delay):
+    # what the dispatcher does around the handlers of one update
+    data = {}
+    await middleware.on_pre_process_update(update, data)
+    try:
+        log.append(('start', update.update_id, middleware.running))
+        await asyncio.sleep(delay)
+        log.append(('end', update.update_id, middleware.running))
+    finally:
+        await middleware.on_post_process_update(update, [], data)
+
+
+def test_update_user_id():
+    assert update_user_id(message_update(1, 42)) == 42
+    assert update_user_id(types.Update(update_id=1)) is None
+
+
+def test_user_updates_run_in_order_one_at_a_time():
+    async def scenario():
+        middleware = UserQueueMiddleware(concurrency=10, max_pending=100)
+        log = []
+        # the first update is the slowest, the later ones must still wait
+        await asyncio.gather(*(
+            handle(middleware, message_update(number, 7), log, delay)
+            for number, delay in ((1, 0.03), (2, 0.01), (3, 0))
+        ))
+        return middleware, log
+
+    middleware, log = asyncio.run(scenario())
+    assert [(event, number) for event, number, _ in log] == [
+        ('start', 1), ('end', 1), ('start', 2), ('end', 2),
+        ('start', 3), ('end', 3),
+    ]
+    assert middleware.max_depth == 3
+    assert (middleware.pending, middleware.running) == (0, 0)
+    assert middleware.users == {}
+
+
+def test_concurrency_limit_across_users():
+    async def scenario():
+        middleware = UserQueueMiddleware(concurrency=2, max_pending=100)
+        log = []
+        await asyncio.gather(*(
+            handle(middleware, message_update(user_id, user_id), log, 0.01)
+            for user_id in range(1, 6)
+        ))
+        return log
+
+    log = asyncio.run(scenario())
+    assert max(running for _, _, running in log) == 2
+    assert len(log) == 10
+
+
+def test_overloaded_and_wait_ready():
+    async def scenario():
+        middleware = UserQueueMiddleware(concurrency=1, max_pending=2)
+        log = []
+        tasks = [
+            asyncio.create_task(
+                handle(middleware, message_update(number, number), log, 0.02)
+            )
+            for number in (1, 2)
+        ]
+        await asyncio.sleep(0)
+        overloaded = middleware.overloaded
+        await middleware.wait_ready()
+        # ready once one of the two updates is done
+        done = sum(task.done() for task in tasks)
+        await asyncio.gather(*tasks)
+        return overloaded, done, middleware.overloaded
+
+    overloaded, done, after = asyncio.run(scenario())
+    assert overloaded and done >= 1 and not after
+
+
+def test_cancelled_while_waiting_leaves_the_queue():
+    async def scenario():
+        middleware = UserQueueMiddleware(concurrency=1, max_pending=100)
+        log = []
+        first = asyncio.create_task(
+            handle(middleware, message_update(1, 7), log, 0.02)
+        )
+        second = asyncio.create_task(
+            handle(middleware, message_update(2, 7), log, 0)
+        )
+        await asyncio.sleep(0)
+        second.cancel()
+        await asyncio.gather(first, second, return_exceptions=True)
+        return middleware, log
+
+    middleware, log = asyncio.run(scenario())
+    assert [number for _, number, _ in log] == [1, 1]
+    assert (middleware.pending, middleware.running) == (0, 0)
+    assert middleware.users == {}
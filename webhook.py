@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from secrets import compare_digest
+
+from aiogram.dispatcher.webhook import (
+    BOT_DISPATCHER_KEY, WebhookRequestHandler,
+)
+from aiohttp import web
+
+from config_data.config import WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_URL
+from database.database import engine, ping
+
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+HEALTH_TIMEOUT = 2
+# seconds telegram is asked to wait when too many updates are pending
+OVERLOAD_RETRY_AFTER = 1
+# updates that are still being handled, by application
+UPDATES_KEY = 'updates_in_progress'
+
+
+def check_secret(request):
+    received = request.headers.get(SECRET_HEADER, '')
+    if WEBHOOK_SECRET and not compare_digest(received, WEBHOOK_SECRET):
+        raise web.HTTPUnauthorized()
+
+
+class WebhookHandler(WebhookRequestHandler):
+    # telegram gets its 200 at once and the update is handled in the
+    # background, a slow handler does not hold the webhook connection
+    async def post(self):
+        check_secret(self.request)
+        dispatcher = self.get_dispatcher()
+        if dispatcher['user_queue'].overloaded:
+            # telegram delivers the update again later
+            raise web.HTTPTooManyRequests(
+                headers={'Retry-After': str(OVERLOAD_RETRY_AFTER)}
+            )
+        update = await self.parse_update(dispatcher.bot)
+        self.handle(dispatcher, update)
+        return web.Response(text='ok')
+
+    def handle(self, dispatcher, update):
+        updates = self.request.app[UPDATES_KEY]
+        task = asyncio.create_task(process_update(dispatcher, update))
+        updates.add(task)
+        task.add_done_callback(updates.discard)
+
+
+async def process_update(dispatcher, update):
+    try:
+        # through updates_handler, so update middlewares run as in polling
+        await dispatcher.updates_handler.notify(update)
+    except Exception:
+        # nobody awaits the task, errors handlers did not take it
+        logging.exception('Update %s failed', update.update_id)
+
+
+async def health(request):
+    dispatcher = request.app[BOT_DISPATCHER_KEY]
+    try:
+        await asyncio.wait_for(ping(engine), HEALTH_TIMEOUT)
+    except Exception as error:
+        logging.warning('Health check failed: %r', error)
+        return web.json_response({'status': 'database unavailable'},
+                                 status=503)
+    return web.json_response({
+        'status': 'ok',
+        'updates_in_progress': len(request.app[UPDATES_KEY]),
+        'user_queue': dispatcher['user_queue'].report(),
+    })
+
+
+async def wait_updates(app):
+    # runs before the executor shutdown, so handlers still have the
+    # database and the bot session
+    if app[UPDATES_KEY]:
+        await asyncio.wait(app[UPDATES_KEY])
+
+
+def create_app():
+    app = web.Application()
+    app[UPDATES_KEY] = set()
+    app.router.add_get('/health', health)
+    app.on_shutdown.append(wait_updates)
+    return app
+
+
+async def register_webhook(dp):
+    # without WEBHOOK_URL the server only takes updates posted by hand
+    if WEBHOOK_URL:
+        await dp.bot.set_webhook(
+            WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None,
+        )